@@ -0,0 +1,108 @@
+"""Offline batch checker for regimen files.
+
+Usage:
+    python -m Form.batch_cli regimens.csv -o results.jsonl --workers 8
+
+Input is CSV (a "drugs" column of space-separated names, optional "id" column)
+or JSONL ({"id": ..., "drugs": [...] or "a b"}). Each output line is one regimen's
+result in the same shape as the /form/batch endpoint, including missing_drugs: the
+drugs that could not be resolved or whose interaction data could not be fetched.
+Exits with status 1 if any regimen has missing drugs, since its results may be incomplete.
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import Form.form as form_module
+
+
+def read_regimens(filename):
+    """Stream (id, drug names) from a CSV or JSONL regimen file."""
+    with open(filename, newline="", encoding="utf-8") as file:
+        if filename.endswith((".jsonl", ".json")):
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                drugs = record["drugs"]
+                yield record.get("id", line_number), drugs.split() if isinstance(drugs, str) else drugs
+        else:
+            for row_number, row in enumerate(csv.DictReader(file), 1):
+                yield row.get("id") or row_number, row["drugs"].split()
+
+
+def chunked(iterable, size):
+    """Group an iterator into lists of at most `size` items without reading ahead further."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def init_worker():
+    """Give each forked worker its own MongoDB client; the indexes stay mapped from the shared files."""
+    form_module.init_forked_worker()
+
+
+def check_chunk(chunk):
+    """Check a chunk of regimens, sharing drug resolution and fetching within the chunk."""
+    ids = [regimen_id for regimen_id, _ in chunk]
+    batch = form_module.check_regimen_batch([drugs for _, drugs in chunk])
+    return [dict(result, id=regimen_id) for regimen_id, result in zip(ids, batch["results"])]
+
+
+def main(argv=None):
+    """Check every regimen in the input file; returns the exit status."""
+    parser = argparse.ArgumentParser(description="Check drug regimens from a CSV or JSONL file.")
+    parser.add_argument("input", help="CSV with a 'drugs' column, or JSONL with a 'drugs' field")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=50, help="regimens per worker task")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    # Build the index files once here; every worker maps the same files instead of holding its own copy
+    form_module.preload_indexes()
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        print("⚠️ fork is unavailable; each worker re-imports the app and maps the shared index files.", file=sys.stderr)
+        context = multiprocessing.get_context()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started = last_report = time.monotonic()
+    regimens_done = interactions_found = regimens_incomplete = 0
+    try:
+        with context.Pool(args.workers, initializer=init_worker) as pool:
+            chunks = chunked(read_regimens(args.input), args.chunk_size)
+            for results in pool.imap_unordered(check_chunk, chunks):
+                for result in results:
+                    output.write(json.dumps(result) + "\n")
+                    interactions_found += len(result["interactions"])
+                    regimens_incomplete += bool(result["missing_drugs"])
+                regimens_done += len(results)
+                now = time.monotonic()
+                if now - last_report >= args.progress_interval:
+                    last_report = now
+                    print(f"⏳ {regimens_done} regimens, {regimens_done / (now - started):.1f}/s, {interactions_found} interactions, {regimens_incomplete} incomplete", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.monotonic() - started
+    print(f"✅ {regimens_done} regimens in {elapsed:.1f}s ({regimens_done / max(elapsed, 1e-9):.1f}/s), {interactions_found} interactions", file=sys.stderr)
+    if regimens_incomplete:
+        print(f"❌ {regimens_incomplete} regimens have missing drugs; see their missing_drugs field.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import contextlib
+import hashlib
+import json
+import math
+import os
+import time
+
+
+class BloomFilter:
+    """Compact probabilistic set: no false negatives, tunable false-positive rate."""
+
+    def __init__(self, capacity, false_positive_rate=0.01):
+        capacity = max(int(capacity), 1)
+        # Standard sizing: m = -n ln(p) / ln(2)^2 bits and k = m/n ln(2) hash functions
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: two 64-bit halves of one digest give all k positions
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key):
+        """Add a key to the filter."""
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        for position in self._positions(key):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def update(self, other):
+        """Add every key of another filter of the same size; returns False, changing nothing, if the sizes differ."""
+        if (other.num_bits, other.num_hashes) != (self.num_bits, self.num_hashes):
+            return False
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(other.bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+        # Keys in both filters would be counted twice, so estimate the union from the bits set
+        set_bits = merged.bit_count()
+        if set_bits >= self.num_bits:
+            estimate = self.capacity + 1
+        else:
+            estimate = int(-self.num_bits / self.num_hashes * math.log(1 - set_bits / self.num_bits))
+        self.count = max(self.count, other.count, estimate)
+        return True
+
+    def save(self, filename, metadata=None):
+        """Write the filter (and optional JSON metadata) to disk atomically."""
+        header = {
+            "capacity": self.capacity,
+            "false_positive_rate": self.false_positive_rate,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "count": self.count,
+            "metadata": metadata or {},
+        }
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, "wb") as file:
+            file.write(json.dumps(header).encode("utf-8") + b"\n")
+            file.write(self.bits)
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a filter written by save(); returns (filter, metadata)."""
+        with open(filename, "rb") as file:
+            header = json.loads(file.readline())
+            bits = file.read()
+        bloom = cls.__new__(cls)
+        bloom.capacity = header["capacity"]
+        bloom.false_positive_rate = header["false_positive_rate"]
+        bloom.num_bits = header["num_bits"]
+        bloom.num_hashes = header["num_hashes"]
+        bloom.count = header["count"]
+        bloom.bits = bytearray(bits)
+        if len(bloom.bits) != (bloom.num_bits + 7) // 8:
+            raise ValueError(f"Corrupt bloom filter file: {filename}")
+        return bloom, header["metadata"]
+
+
+@contextlib.contextmanager
+def file_lock(filename, timeout=10, stale_after=30):
+    """Hold `filename`.lock exclusively across processes; a lock older than stale_after seconds is broken."""
+    lock_filename = f"{filename}.lock"
+    directory = os.path.dirname(lock_filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    give_up_at = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_filename) > stale_after:
+                    os.remove(lock_filename)  # Left behind by a process that died holding it
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > give_up_at:
+                raise TimeoutError(f"Could not lock {filename}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.remove(lock_filename)
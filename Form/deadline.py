@@ -0,0 +1,40 @@
+import contextlib
+import contextvars
+import time
+
+_deadline = contextvars.ContextVar("deadline", default=None)  # monotonic time the budget runs out
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the current request's time budget runs out before a step could finish."""
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Give the enclosed block a time budget of `seconds`; None or 0 lifts any budget.
+
+    A nested budget never extends an outer one.
+    """
+    if seconds:
+        expires_at = time.monotonic() + seconds
+        outer = _deadline.get()
+        if outer is not None:
+            expires_at = min(expires_at, outer)
+    else:
+        expires_at = None
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None if there is no budget."""
+    expires_at = _deadline.get()
+    return None if expires_at is None else max(0.0, expires_at - time.monotonic())
+
+
+def expired():
+    """True once the current budget has run out."""
+    return remaining() == 0
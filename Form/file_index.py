@@ -0,0 +1,46 @@
+import os
+import threading
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class FileIndex:
+    """Value built from a data file, rebuilt whenever the file changes on disk.
+
+    Other workers append to the same files, so every get() re-checks the file's mtime and
+    size; while it is unchanged a lookup costs one os.stat.
+    """
+
+    def __init__(self, filename, build):
+        self.filename = filename
+        self.build = build
+        self._state = (None, None)  # (file signature, built value) -- swapped as one tuple
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The value built from the file's current contents, or None if the file doesn't exist."""
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        # Stat before reading: a write that lands during the build changes the signature again
+        signature = (stat.st_mtime_ns, stat.st_size)
+        state = self._state
+        if state[0] != signature:
+            with self._lock:
+                state = self._state
+                if state[0] != signature:
+                    state = (signature, self.build(self.filename))
+                    self._state = state
+        return state[1]
+
+
+def load_indexed(filename, build):
+    """build(filename), cached per file and builder until the file changes."""
+    key = (filename, build)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(key, FileIndex(filename, build))
+    return index.get()
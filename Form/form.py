@@ -4,46 +4,127 @@ import csv
 import os
 import pandas as pd
 from pymongo import MongoClient
-import pubchempy as pcp
-import requests
-from flask import Blueprint, render_template
+import contextlib
+import itertools
+from collections import Counter, namedtuple
+import threading
+import time
+import datetime
+from flask import Blueprint, render_template, Response, stream_template, jsonify
+from Form.bloom import BloomFilter, file_lock
+from Form.interaction_graph import InteractionGraph, GraphSnapshot, combo_interactions, pack_interaction_graph
+from Form.jobs import JobStore, JobRunner
+from Form.singleflight import SingleFlight, MongoLease
+from Form.result_cache import ResultCache, PairMemo
+from Form.file_index import load_indexed
+from Form.shared_index import (SHARED_INDEX_FOLDER, Segment, StringListMap, StringTable, TopNeighbors, derived_segment,
+                               file_signature, pack_string_lists, pack_strings, pack_top_neighbors, write_segment)
+from Form.metrics import Histogram, FunctionMetric, MongoCommandMetrics, cache_metrics
+from Form.profiling import profiled, authorized, load_profile
+from Form.tracing import traced, span, event, current_span
+from Form.deadline import DeadlineExceeded, deadline
+from Form.scheduler import PriorityScheduler, priority, INTERACTIVE, BATCH, MAINTENANCE
+from Form.upstream import UpstreamUnavailable, chembl, pubchem_compound, download_pubchem_ddi_csv
 
 form = Blueprint('form', __name__, static_folder='static', template_folder='templates')
 
 # MongoDB Atlas connection string (replace with your own)
 connection_string = "mongodb://localhost:27017/"
 
+def connect_mongo():
+    """(Re)create the MongoDB client; child processes must call this again after fork."""
+    global client, db, collection
+    client = MongoClient(connection_string, event_listeners=[MongoCommandMetrics()])
+    db = client["Drug_Interaction"]
+    collection = db["interaction_files"]
+
 # Connect to MongoDB Atlas
-client = MongoClient(connection_string)
-db = client["Drug_Interaction"]
-collection = db["interaction_files"]
+connect_mongo()
 
 print("✅ Connected to MongoDB Atlas.")
 
+# Other workers' ingests are picked up after at most this many seconds
+DATA_VERSION_TTL = float(os.environ.get("DATA_VERSION_TTL", "1.0"))
+interaction_version_state = (0.0, None)  # (monotonic time read, version)
+
+def bump_data_version():
+    """Record in MongoDB that the interaction data changed, so every worker sees a new version."""
+    global interaction_version_state
+    db["metadata"].update_one({"_id": "interaction_data"}, {"$inc": {"version": 1}}, upsert=True)
+    interaction_version_state = (0.0, None)
+
+def interaction_data_version():
+    """Version of the interaction data in MongoDB, re-read at most once per DATA_VERSION_TTL."""
+    global interaction_version_state
+    read_at, version = interaction_version_state
+    if version is None or time.monotonic() - read_at > DATA_VERSION_TTL:
+        document = db["metadata"].find_one({"_id": "interaction_data"}) or {}
+        version = document.get("version", 0)
+        interaction_version_state = (time.monotonic(), version)
+    return version
+
+def data_version():
+    """Snapshot version of the interaction (MongoDB) and similarity (SAME_DRUG.csv, chem_similarity.csv) data."""
+    versions = [str(interaction_data_version())]
+    for filename in ("SAME_DRUG.csv", "Drug_data/chem_similarity.csv"):
+        try:
+            stat = os.stat(filename)
+            versions.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+        except FileNotFoundError:
+            versions.append("none")
+    return ":".join(versions)
+
+# Upstream fetches and heavy lookups share one worker pool; interactive requests get most of its turns
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "8"))
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", "2"))
+scheduler = PriorityScheduler(
+    workers=SCHEDULER_WORKERS,
+    weights={INTERACTIVE: 8, BATCH: 2, MAINTENANCE: 1},
+    # Background classes can never take every worker, so a bulk import can't queue user requests behind it
+    limits={BATCH: max(1, SCHEDULER_WORKERS // 2), MAINTENANCE: REFRESH_WORKERS},
+)
+
+def scheduler_metric(field):
+    return lambda: {(name,): stats[field] for name, stats in scheduler.stats().items()}
+
+FunctionMetric("scheduler_queue_depth", "Tasks waiting in each priority class.", scheduler_metric("depth"), ["priority"])
+FunctionMetric("scheduler_running", "Tasks running in each priority class.", scheduler_metric("running"), ["priority"])
+FunctionMetric("scheduler_wait_p95_seconds", "95th percentile of recent queue waits.", scheduler_metric("wait_p95"), ["priority"],
+               multiprocess_mode="max")
+
+# Time spent in each pipeline stage; stages nest, so a stage includes the ones it calls
+STAGE_SECONDS = Histogram("form_stage_seconds", "Time spent in each Form pipeline stage.", ["stage"])
+
+@contextlib.contextmanager
+def stage(name, **attributes):
+    """Time a pipeline stage into STAGE_SECONDS and trace it as a span of the current request."""
+    with STAGE_SECONDS.time(name), span(name, **attributes) as current:
+        yield current
+
+# Bloom filter over every known interacting pair, persisted next to the interaction store
+INTERACTION_FILTER_FILE = os.path.join("Drug_data", "interaction_filter.bloom")
+INTERACTION_FILTER_FP_RATE = float(os.environ.get("INTERACTION_FILTER_FP_RATE", "0.01"))
+
 def get_pubchem_info(drug_name):
     """Fetch PubChem CID and DrugBank ID from PubChem using the drug name."""
     try:
-        results = pcp.get_compounds(drug_name, 'name')
-        if results:
-            compound = results[0]
-            pubchem_cid = compound.cid  # PubChem CID
+        pubchem_cid, synonyms = pubchem_compound(drug_name)
+        if pubchem_cid is not None:
             # Extract DrugBank ID from synonyms
             drugbank_id = None
-            if compound.synonyms:
-                for synonym in compound.synonyms:
-                    if synonym.startswith("DB"):
-                        drugbank_id = synonym  # DrugBank ID
-                        break
+            for synonym in synonyms:
+                if synonym.startswith("DB"):
+                    drugbank_id = synonym  # DrugBank ID
+                    break
             return pubchem_cid, drugbank_id
     except Exception as e:
-        print(f"PubChem lookup failed for {drug_name}: {e}")
+        event("PubChem lookup failed", drug=drug_name, error=str(e))
     return None, None
 
 def get_chembl_info(drug_name):
     """Fetch ChEMBL ID from ChEMBL using REST API."""
     try:
-        url = f"https://www.ebi.ac.uk/chembl/api/data/molecule.json?pref_name__iexact={drug_name}"
-        response = requests.get(url, timeout=5)
+        response = chembl.get("/molecule.json", params={"pref_name__iexact": drug_name})
         if response.status_code == 200:
             data = response.json()
             molecules = data.get("molecules", [])
@@ -51,9 +132,11 @@ def get_chembl_info(drug_name):
                 chembl_id = molecules[0].get("molecule_chembl_id")  # ChEMBL ID
                 return chembl_id
     except Exception as e:
-        print(f"ChEMBL lookup failed for {drug_name}: {e}")
+        event("ChEMBL lookup failed", drug=drug_name, error=str(e))
     return None
 
+@scheduler.task
+@stage("get_all_drug_ids")
 def get_all_drug_ids(drug_name):
     """Fetch all IDs (PubChem CID, DrugBank ID, and ChEMBL ID) for a given drug name."""
     pubchem_cid, drugbank_id = get_pubchem_info(drug_name)
@@ -75,24 +158,48 @@ def save_to_csv(drug_info, filename="drug_names_ids.csv"):
             writer.writeheader()  # Write header if file doesn't exist
         writer.writerow(drug_info)
 
-def is_drug_in_csv(drug_name, filename="drug_names_ids.csv"):
-    """Check if a drug is already in the CSV file."""
-    if not os.path.isfile(filename):
-        return False
+def read_drug_names(filename):
+    """Lower-cased names of every drug in drug_names_ids.csv."""
     with open(filename, mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row["Drug Name"].lower() == drug_name.lower():
-                return True
-    return False
+        return {row["Drug Name"].lower() for row in csv.DictReader(file)}
+
+def build_drug_name_index(filename):
+    """read_drug_names as a string table every worker maps from one shared index file."""
+    segment = derived_segment(filename, "names", lambda source: pack_strings("names", sorted(read_drug_names(source))))
+    return StringTable(segment, "names")
 
-def load_similarity_matrix(filename="Drug_data/chem_similarity.csv"):
-    """Load the drug similarity matrix from a CSV file."""
-    similarity_matrix = pd.read_csv(filename, index_col=0)
-    return similarity_matrix
+def is_drug_in_csv(drug_name, filename="drug_names_ids.csv"):
+    """Check if a drug is already in the CSV file."""
+    drug_names = load_indexed(filename, build_drug_name_index)
+    return drug_names is not None and drug_name.lower() in drug_names
+
+# Each drug's best matches are precomputed, so the dense matrix is never held in a worker
+SIMILARITY_TOP_K = int(os.environ.get("SIMILARITY_TOP_K", "10"))
+SIMILARITY_CHUNK_ROWS = 256
+
+def build_similarity_neighbors(filename):
+    """Top SIMILARITY_TOP_K neighbours of every drug in the similarity matrix, in a shared index file."""
+    def sections(source):
+        chunks = ((chunk.index, chunk.columns, chunk.to_numpy()) for chunk in pd.read_csv(source, index_col=0, chunksize=SIMILARITY_CHUNK_ROWS))
+        return pack_top_neighbors("similar", chunks, SIMILARITY_TOP_K)
+    segment = derived_segment(filename, f"top{SIMILARITY_TOP_K}", sections, {"k": SIMILARITY_TOP_K})
+    return TopNeighbors(segment, "similar")
+
+@stage("load_similarity_neighbors")
+def load_similarity_neighbors(filename="Drug_data/chem_similarity.csv"):
+    """Load the similarity matrix's top neighbours (built once per change of the CSV, then shared by every worker)."""
+    neighbors = load_indexed(filename, build_similarity_neighbors)
+    if neighbors is None:
+        raise FileNotFoundError(filename)
+    return neighbors
 
 def get_top_similar_drugs(drugbank_id, similarity_matrix, top_n=3):
-    """Get the top N similar drugs for a given DrugBank ID."""
+    """Get the top N similar drugs for a given DrugBank ID.
+
+    Takes the dense matrix or its TopNeighbors, which answer up to SIMILARITY_TOP_K drugs.
+    """
+    if isinstance(similarity_matrix, TopNeighbors):
+        return similarity_matrix.top(drugbank_id, top_n)
     if drugbank_id not in similarity_matrix.index:
         return []
     # Get the similarity scores for the given drug
@@ -101,29 +208,27 @@ def get_top_similar_drugs(drugbank_id, similarity_matrix, top_n=3):
     top_drugs = similarities.sort_values(ascending=False).index[1:top_n + 1]  # Skip self-similarity
     return list(top_drugs)
 
+@stage("get_drug_name_from_drugbank_id")
 def get_drug_name_from_drugbank_id(drugbank_id):
     """Fetch the drug name from PubChem or ChEMBL using the DrugBank ID."""
     # Try fetching from PubChem
     try:
-        results = pcp.get_compounds(drugbank_id, 'name')
-        if results:
-            compound = results[0]
-            if compound.synonyms:
-                return compound.synonyms[0]  # Return the first synonym (usually the common name)
+        _, synonyms = pubchem_compound(drugbank_id)
+        if synonyms:
+            return synonyms[0]  # Return the first synonym (usually the common name)
     except Exception as e:
-        print(f"PubChem lookup failed for {drugbank_id}: {e}")
+        event("PubChem lookup failed", drugbank_id=drugbank_id, error=str(e))
     
     # Try fetching from ChEMBL
     try:
-        url = f"https://www.ebi.ac.uk/chembl/api/data/molecule.json?molecule_chembl_id={drugbank_id}"
-        response = requests.get(url, timeout=5)
+        response = chembl.get("/molecule.json", params={"molecule_chembl_id": drugbank_id})
         if response.status_code == 200:
             data = response.json()
             molecules = data.get("molecules", [])
             if molecules:
                 return molecules[0].get("pref_name")  # Preferred name
     except Exception as e:
-        print(f"ChEMBL lookup failed for {drugbank_id}: {e}")
+        event("ChEMBL lookup failed", drugbank_id=drugbank_id, error=str(e))
     
     # If no name is found, return None
     return None
@@ -156,22 +261,17 @@ def save_similar_drugs_to_csv(input_drug_name, similar_drugbank_ids, filename="S
 
     return similar_drug_names
 
-def generate_combinations_from_same_drug(drug_names, filename="SAME_DRUG.csv"):
-    """Generate combinations of drugs based on similar drugs from SAME_DRUG.csv."""
+def generate_combinations_from_same_drug(drug_names, filename="SAME_DRUG.csv", prune=False):
+    """Generate combinations of drugs based on similar drugs from SAME_DRUG.csv.
+
+    With prune=True only the cross-group pairs that have a recorded interaction are returned.
+    """
     # Load the SAME_DRUG.csv file
-    same_drug_dict = {}
-    if not os.path.isfile(filename):
+    index = load_indexed(filename, build_similar_drug_index)
+    if index is None:
         print(f"❌ {filename} not found. Please ensure the file exists.")
         return []
-    
-    with open(filename, mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            input_drug = row["Input Drug Name"]
-            similar_drugs = [row["Similar Drug 1"], row["Similar Drug 2"], row["Similar Drug 3"]]
-            # Remove empty strings (if any)
-            similar_drugs = [drug for drug in similar_drugs if drug]
-            same_drug_dict[input_drug] = similar_drugs
+    same_drug_dict = index.by_name
     
     # Create a list of all groups (input drugs and their similar drugs)
     groups = []
@@ -182,6 +282,19 @@ def generate_combinations_from_same_drug(drug_names, filename="SAME_DRUG.csv"):
         else:
             print(f"❌ {drug} not found in SAME_DRUG.csv. Skipping...")
     
+    if prune:
+        # Expand from partner sets, then keep only pairs that span two different groups
+        group_indexes = {}
+        for i, group in enumerate(groups):
+            for drug in group:
+                group_indexes.setdefault(drug, set()).add(i)
+        all_drugs = [drug for group in groups for drug in group]
+        combinations = {
+            (drug1, drug2) for drug1, drug2 in expand_interacting_pairs(all_drugs)
+            if any(i != j for i in group_indexes[drug1] for j in group_indexes[drug2])
+        }
+        return sorted([f"{pair[0]},{pair[1]}" for pair in combinations])
+
     # Generate combinations
     combinations = set()  # Use a set to avoid duplicate pairs
     for i in range(len(groups)):
@@ -197,34 +310,420 @@ def generate_combinations_from_same_drug(drug_names, filename="SAME_DRUG.csv"):
     
     return combinations
 
+def pair_key(drug1, drug2):
+    """Order-independent key for a pair of drug names."""
+    return "\x1f".join(sorted((drug1, drug2)))
+
+def iter_interaction_rows(document):
+    """Yield (drug1, drug2, description) for every row of a stored interaction CSV."""
+    reader = csv.DictReader(document["content"].splitlines())
+    for row in reader:
+        yield row["name"], row["name2"], row["descr"]
+
+# Interaction graph used to check a whole regimen at once. Its snapshot of the stored documents is one
+# memory-mapped file every worker shares; a worker privately indexes only the documents it sees change
+# after that, and rebuilds the snapshot once it holds more than INTERACTION_SNAPSHOT_MAX_PRIVATE of them.
+INTERACTION_SNAPSHOT_FILE = os.path.join(SHARED_INDEX_FOLDER, "interaction_graph.idx")
+INTERACTION_SNAPSHOT_MAX_PRIVATE = int(os.environ.get("INTERACTION_SNAPSHOT_MAX_PRIVATE", "1000"))
+interaction_graph = InteractionGraph()
+
+def open_interaction_snapshot():
+    """Map the current interaction graph snapshot, or return None if there is no usable one."""
+    try:
+        return GraphSnapshot(Segment.open(INTERACTION_SNAPSHOT_FILE))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"❌ Ignoring unreadable interaction graph snapshot: {e}")
+        return None
+
+def build_interaction_snapshot():
+    """Snapshot every stored interaction document into INTERACTION_SNAPSHOT_FILE."""
+    documents = collection.find({}, {"drug_name": 1, "content": 1, "fetched_at": 1})
+    sections, metadata = pack_interaction_graph((document["drug_name"], document.get("fetched_at"), iter_interaction_rows(document)) for document in documents)
+    try:
+        write_segment(INTERACTION_SNAPSHOT_FILE, sections, metadata)
+        snapshot = GraphSnapshot(Segment.open(INTERACTION_SNAPSHOT_FILE))
+    except OSError as e:
+        print(f"❌ Could not share the interaction graph snapshot, keeping a private copy: {e}")
+        snapshot = GraphSnapshot(Segment.from_sections(sections, metadata))
+    print(f"✅ Built interaction graph snapshot of {snapshot.document_count} drugs.")
+    return snapshot
+
+def load_interaction_graph():
+    """Map the shared interaction graph snapshot, rebuilding it if it is missing or too far behind MongoDB."""
+    global interaction_graph
+    try:
+        stored = {document["drug_name"]: document.get("fetched_at") for document in collection.find({}, {"drug_name": 1, "fetched_at": 1})}
+        snapshot = open_interaction_snapshot()
+        if snapshot is not None:
+            changed = [drug_name for drug_name, fetched_at in stored.items() if not snapshot.covers(drug_name, fetched_at)]
+            still_stored = sum(1 for drug_name in stored if snapshot.document_id(drug_name) >= 0)
+            if len(changed) > INTERACTION_SNAPSHOT_MAX_PRIVATE or still_stored < snapshot.document_count:
+                snapshot = None
+        if snapshot is None:
+            snapshot, changed = build_interaction_snapshot(), []
+        graph = InteractionGraph(snapshot)
+        for drug_name in changed:
+            document = collection.find_one({"drug_name": drug_name})
+            if document:
+                graph.add_document(drug_name, iter_interaction_rows(document), document.get("fetched_at"))
+        interaction_graph = graph
+        print(f"✅ Loaded interaction graph with {len(graph.indexed_drugs)} drugs ({len(changed)} newer than its shared snapshot).")
+    except Exception as e:
+        print(f"❌ Interaction graph unavailable, drugs will be indexed on demand: {e}")
+
+def maintain_interaction_snapshot():
+    """Map a snapshot another process rebuilt, or rebuild it once this process indexes too many documents privately."""
+    graph = interaction_graph
+    current = graph.snapshot
+    if file_signature(INTERACTION_SNAPSHOT_FILE) != (current.segment.signature if current is not None else None):
+        snapshot = open_interaction_snapshot()
+        if snapshot is not None:
+            graph.attach(snapshot)
+    if graph.private_documents() <= INTERACTION_SNAPSHOT_MAX_PRIVATE:
+        return
+    # One worker rebuilds; the others map its file on their next check
+    lease = MongoLease(db["fetch_leases"], ttl=FETCH_LEASE_TTL)
+    if lease.acquire("interaction_snapshot"):
+        try:
+            graph.attach(build_interaction_snapshot())
+        finally:
+            lease.release("interaction_snapshot")
+
+load_interaction_graph()
+
+# (bloom filter, drugs it covers) -- swapped as one tuple so readers never see a mismatched pair
+interaction_filter_state = (None, set())
+interaction_filter_lock = threading.Lock()
+interaction_filter_version = None  # data version the in-memory filter was last synced at
+interaction_filter_signature = None  # signature of the filter file as this process last read or wrote it
+interaction_filter_unsaved = False  # drugs were covered here since the last save
+
+def rebuild_interaction_filter():
+    """Rebuild the interacting-pair bloom filter from every document the interaction graph has indexed."""
+    global interaction_filter_state
+    with interaction_filter_lock:
+        drugs = set()
+        keys = set()
+        for drug_name, partners in interaction_graph.document_partners():
+            drugs.add(drug_name)
+            keys.update(pair_key(drug_name, partner) for partner in partners)
+
+        # Leave headroom so incremental ingests don't force an immediate rebuild
+        bloom = BloomFilter(max(len(keys) * 2, 1024), INTERACTION_FILTER_FP_RATE)
+        for key in keys:
+            bloom.add(key)
+        interaction_filter_state = (bloom, drugs)
+        save_interaction_filter(merge=False)
+        print(f"✅ Built interaction filter: {len(keys)} pairs from {len(drugs)} drugs.")
+
+def save_interaction_filter(merge=True):
+    """Write the in-memory filter to INTERACTION_FILTER_FILE; the caller holds interaction_filter_lock.
+
+    Whatever other workers saved since this one last read the file is merged in first, so a save
+    never drops their pairs while keeping the drugs they cover.
+    """
+    global interaction_filter_signature, interaction_filter_unsaved
+    bloom, drugs = interaction_filter_state
+    with file_lock(INTERACTION_FILTER_FILE):
+        signature = file_signature(INTERACTION_FILTER_FILE)
+        if merge and signature not in (None, interaction_filter_signature):
+            saved, metadata = BloomFilter.load(INTERACTION_FILTER_FILE)
+            if bloom.update(saved):
+                drugs.update(metadata.get("drugs", []))
+        bloom.save(INTERACTION_FILTER_FILE, {"drugs": sorted(drugs)})
+        interaction_filter_signature = file_signature(INTERACTION_FILTER_FILE)
+    interaction_filter_unsaved = False
+
+def load_interaction_filter():
+    """Load the persisted interaction filter, rebuilding it if MongoDB changed since it was saved."""
+    global interaction_filter_state, interaction_filter_signature
+    try:
+        stored_drugs = set(collection.distinct("drug_name"))
+        if os.path.isfile(INTERACTION_FILTER_FILE):
+            signature = file_signature(INTERACTION_FILTER_FILE)
+            bloom, metadata = BloomFilter.load(INTERACTION_FILTER_FILE)
+            if set(metadata.get("drugs", [])) == stored_drugs and bloom.false_positive_rate == INTERACTION_FILTER_FP_RATE:
+                interaction_filter_state = (bloom, stored_drugs)
+                interaction_filter_signature = signature
+                print(f"✅ Loaded interaction filter for {len(stored_drugs)} drugs.")
+                return
+        rebuild_interaction_filter()
+    except Exception as e:
+        interaction_filter_state = (None, set())
+        print(f"❌ Interaction filter unavailable, using full lookups: {e}")
+
+def add_to_interaction_filter(document):
+    """Add a newly ingested or refreshed document's pairs to the filter.
+
+    Pairs the filter doesn't hold yet are saved at once, before the caller bumps the data
+    version, since any worker may already trust the filter for this drug. A document that adds
+    nothing new, like most refreshes, only marks a newly covered drug for the next
+    flush_interaction_filter().
+    """
+    global interaction_filter_unsaved
+    bloom, drugs = interaction_filter_state
+    if bloom is None:
+        return
+    keys = {pair_key(drug1, drug2) for drug1, drug2, _ in iter_interaction_rows(document)}
+    new_keys = {key for key in keys if key not in bloom}
+    if bloom.count + len(new_keys) > bloom.capacity:
+        rebuild_interaction_filter()
+        return
+    with interaction_filter_lock:
+        # Add the pairs before marking the drug as covered so readers never get a false negative
+        for key in new_keys:
+            bloom.add(key)
+        if document["drug_name"] not in drugs:
+            drugs.add(document["drug_name"])
+            interaction_filter_unsaved = True
+        if new_keys:
+            try:
+                save_interaction_filter()
+            except Exception as e:
+                print(f"❌ Could not save interaction filter: {e}")
+
+def flush_interaction_filter():
+    """Save drugs covered here since the last save, so other workers can use the filter for them too."""
+    with interaction_filter_lock:
+        if interaction_filter_state[0] is not None and interaction_filter_unsaved:
+            save_interaction_filter()
+
+def sync_interaction_filter():
+    """Reload the persisted filter when another worker saved it (it saves before bumping the version)."""
+    global interaction_filter_state, interaction_filter_version, interaction_filter_signature
+    version = interaction_data_version()
+    if version == interaction_filter_version:
+        return
+    interaction_filter_version = version
+    signature = file_signature(INTERACTION_FILTER_FILE)
+    if interaction_filter_state[0] is None or signature in (None, interaction_filter_signature):
+        return
+    try:
+        bloom, metadata = BloomFilter.load(INTERACTION_FILTER_FILE)
+    except Exception as e:
+        print(f"❌ Could not reload interaction filter: {e}")
+        return
+    with interaction_filter_lock:
+        current, drugs = interaction_filter_state
+        # Keep the drugs covered here but not saved yet; a filter of another size can't take their pairs
+        if bloom.update(current):
+            drugs = drugs | set(metadata.get("drugs", []))
+        else:
+            drugs = set(metadata.get("drugs", []))
+        interaction_filter_state = (bloom, drugs)
+        interaction_filter_signature = signature
+
+def may_interact(drugs_to_check):
+    """Return False only when the filter proves no pair of the given drugs has a recorded interaction."""
+    sync_interaction_filter()
+    bloom, drugs = interaction_filter_state
+    if bloom is None:
+        return True
+    # Drugs not ingested yet still need a download, so the filter can't speak for them
+    if not all(drug.strip() in drugs for drug in drugs_to_check):
+        return True
+    for i, drug1 in enumerate(drugs_to_check):
+        for drug2 in drugs_to_check[i:]:
+            if pair_key(drug1, drug2) in bloom:
+                return True
+    return False
+
+load_interaction_filter()
+
+# Only one download per drug is ever in flight; other requests wait for and share its result.
+# Set FETCH_COALESCING=mongo to also coalesce across worker processes with a lease document.
+FETCH_COALESCING = os.environ.get("FETCH_COALESCING", "local")
+FETCH_LEASE_TTL = int(os.environ.get("FETCH_LEASE_TTL", "120"))
+fetch_flights = SingleFlight()
+FunctionMetric("form_downloads_in_flight", "Drug downloads currently in progress.", lambda: fetch_flights.in_flight())
+
+def ensure_interaction_indexes():
+    """Make drug_name unique so racing inserts can never create duplicate documents."""
+    try:
+        collection.create_index("drug_name", unique=True)
+    except Exception as e:
+        print(f"❌ Could not create unique drug_name index (duplicates already stored?): {e}")
+
+ensure_interaction_indexes()
+
+@scheduler.task
+@stage("fetch_drug_data")
 def fetch_drug_data(drug_name):
     """Fetch drug interaction data from PubChem and save it to MongoDB."""
     # Check if the drug data already exists in MongoDB
-    existing_document = collection.find_one({"drug_name": drug_name})
+    existing_document = collection.find_one({"drug_name": drug_name}, {"fetched_at": 1})
     if existing_document:
-        print(f"✅ Data for {drug_name} already exists in MongoDB. Skipping...")
+        event("Data already in MongoDB", drug=drug_name)
+        with refresh_lock:
+            drug_request_counts[drug_name] += 1
+        if is_stale(existing_document.get("fetched_at")):
+            schedule_refresh(drug_name)
         return
-    
-    url = f"https://pubchem.ncbi.nlm.nih.gov/sdq/sdqagent.cgi?infmt=json&outfmt=csv&query={{%22download%22:%22*%22,%22collection%22:%22drugbankddi%22,%22order%22:[%22cid2,asc%22],%22start%22:1,%22limit%22:10000000,%22downloadfilename%22:%22pubchem_name_%5E{drug_name}%24_drugbankddi%22,%22where%22:{{%22ands%22:[{{%22name%22:%22%5E{drug_name}%24%22}}]}}}}"
+    fetch_flights.do(drug_name, download_drug_data, drug_name)
+
+def utcnow():
+    """Naive UTC now, matching the datetimes pymongo returns."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def download_interaction_csv(drug_name):
+    """Download a drug's DrugBank interaction table from PubChem as CSV text."""
+    return download_pubchem_ddi_csv(drug_name).text
+
+def index_document(document):
+    """Make a stored document visible to the bloom filter and the interaction graph."""
+    add_to_interaction_filter(document)
+    interaction_graph.add_document(document["drug_name"], iter_interaction_rows(document), document.get("fetched_at"))
+
+def download_drug_data(drug_name):
+    """Download one drug's interaction CSV from PubChem into MongoDB (run once per drug at a time)."""
+    stored = lambda: collection.find_one({"drug_name": drug_name}, {"_id": 1}) is not None
+    # A flight that finished just before this one started may already have stored it
+    if stored():
+        return
+
+    lease = MongoLease(db["fetch_leases"], ttl=FETCH_LEASE_TTL) if FETCH_COALESCING == "mongo" else None
+    if lease is not None:
+        while not lease.acquire(drug_name):
+            if lease.wait(drug_name, stored):
+                event("Data downloaded by another worker", drug=drug_name)
+                return
 
     try:
-        response = httpx.get(url)
-        response.raise_for_status()
+        content = download_interaction_csv(drug_name)
 
         # Save the CSV content to MongoDB
         file_name = f"{drug_name}_response.csv"
         document = {
             "drug_name": drug_name,
             "file_name": file_name,
-            "content": response.text  # Save the CSV content as text
+            "content": content,  # Save the CSV content as text
+            "fetched_at": utcnow(),
         }
-        collection.insert_one(document)
-        print(f"File saved to MongoDB as '{file_name}'")
+        # Upsert so a document stored meanwhile by another process is kept rather than duplicated
+        result = collection.update_one({"drug_name": drug_name}, {"$setOnInsert": document}, upsert=True)
+        if result.upserted_id is None:
+            event("Data stored by another worker", drug=drug_name)
+            return
+        index_document(document)
+        bump_data_version()
+        event("Data saved to MongoDB", drug=drug_name, file_name=file_name)
 
     except httpx.HTTPStatusError as e:
         print(f"HTTP error occurred: {e}")
+    except UpstreamUnavailable as e:
+        print(f"PubChem unavailable, keeping whatever data is stored: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+    finally:
+        if lease is not None:
+            lease.release(drug_name)
+
+# Stale-while-revalidate: data older than the TTL is still served while a background refresh runs
+INTERACTION_DATA_TTL = int(os.environ.get("INTERACTION_DATA_TTL", str(7 * 24 * 3600)))  # seconds
+pending_refreshes = set()
+refresh_lock = threading.Lock()
+drug_request_counts = Counter()  # requests per drug since the last flush to MongoDB
+FunctionMetric("form_refreshes_pending", "Background refreshes queued or running.", lambda: len(pending_refreshes))
+
+def is_stale(fetched_at, max_age=None):
+    """True if data fetched at `fetched_at` (None for legacy documents) is older than max_age seconds."""
+    max_age = INTERACTION_DATA_TTL if max_age is None else max_age
+    return fetched_at is None or (utcnow() - fetched_at).total_seconds() > max_age
+
+def note_drug_request(drug_name):
+    """Count a request for the drug and start a background refresh if the indexed copy is stale."""
+    with refresh_lock:  # flush_request_counts() reads and clears the counts under the same lock
+        drug_request_counts[drug_name] += 1
+    try:
+        fetched_at = interaction_graph.fetched_at(drug_name)
+    except KeyError:  # Not indexed yet, so there is nothing to refresh
+        return
+    if is_stale(fetched_at):
+        schedule_refresh(drug_name)
+
+def schedule_refresh(drug_name, max_age=None):
+    """Queue a background refresh of the drug unless one is already pending."""
+    with refresh_lock:
+        if drug_name in pending_refreshes:
+            return
+        pending_refreshes.add(drug_name)
+    with priority(MAINTENANCE):
+        scheduler.submit(refresh_drug_data, drug_name, max_age)
+
+def refresh_drug_data(drug_name, max_age=None):
+    """Re-download a drug's interactions and swap them in atomically; readers keep the old copy meanwhile."""
+    lease = MongoLease(db["fetch_leases"], ttl=FETCH_LEASE_TTL) if FETCH_COALESCING == "mongo" else None
+    try:
+        if lease is not None and not lease.acquire(f"refresh:{drug_name}"):
+            return
+        document = collection.find_one({"drug_name": drug_name})
+        if document is None:
+            return
+        # Another worker may have refreshed it already; then only re-index the stored copy
+        if is_stale(document.get("fetched_at"), max_age):
+            content = download_interaction_csv(drug_name)
+            fetched_at = utcnow()
+            collection.update_one({"_id": document["_id"]}, {"$set": {"content": content, "fetched_at": fetched_at}})
+            changed = content != document["content"]
+            document.update(content=content, fetched_at=fetched_at)
+            index_document(document)
+            if changed:
+                bump_data_version()
+            print(f"🔄 Refreshed data for {drug_name}{'' if changed else ' (unchanged)'}.")
+        else:
+            index_document(document)
+    except Exception as e:
+        print(f"❌ Refresh failed for {drug_name}: {e}")
+    finally:
+        if lease is not None:
+            lease.release(f"refresh:{drug_name}")
+        with refresh_lock:
+            pending_refreshes.discard(drug_name)
+
+# Off-peak proactive refresh of the most-requested drugs
+REFRESH_WINDOW = os.environ.get("REFRESH_WINDOW", "2-5")  # local hours [start-end), may wrap midnight
+REFRESH_TOP_N = int(os.environ.get("REFRESH_TOP_N", "100"))
+REFRESH_CHECK_INTERVAL = int(os.environ.get("REFRESH_CHECK_INTERVAL", "600"))  # seconds
+
+def in_refresh_window(hour=None):
+    """True if the given (default: current local) hour falls inside REFRESH_WINDOW."""
+    hour = datetime.datetime.now().hour if hour is None else hour
+    start, end = (int(part) for part in REFRESH_WINDOW.split("-"))
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+def flush_request_counts():
+    """Add this worker's request counts to the documents so every worker ranks drugs the same way."""
+    with refresh_lock:
+        counts = dict(drug_request_counts)
+        drug_request_counts.clear()
+    for drug_name, count in counts.items():
+        collection.update_one({"drug_name": drug_name}, {"$inc": {"request_count": count}})
+
+def refresh_popular_drugs():
+    """Refresh the most-requested drugs that are past half their TTL, before they go stale at peak."""
+    cutoff = utcnow() - datetime.timedelta(seconds=INTERACTION_DATA_TTL / 2)
+    query = {"$or": [{"fetched_at": {"$lt": cutoff}}, {"fetched_at": {"$exists": False}}]}
+    for document in collection.find(query, {"drug_name": 1}).sort("request_count", -1).limit(REFRESH_TOP_N):
+        schedule_refresh(document["drug_name"], max_age=INTERACTION_DATA_TTL / 2)
+
+def run_refresh_scheduler():
+    """Background loop: flush request counts and the filter, keep up with the shared graph snapshot and, off-peak, refresh popular drugs."""
+    while True:
+        time.sleep(REFRESH_CHECK_INTERVAL)
+        try:
+            flush_request_counts()
+            flush_interaction_filter()
+            maintain_interaction_snapshot()
+            if in_refresh_window():
+                refresh_popular_drugs()
+        except Exception as e:
+            print(f"❌ Refresh scheduler error: {e}")
+
+def start_refresh_scheduler():
+    """Start the off-peak refresh scheduler thread in this process."""
+    threading.Thread(target=run_refresh_scheduler, name="refresh-scheduler", daemon=True).start()
 
 # def search_interactions_for_drugs(drugs_to_check):
 #     """Search for interactions between the given drugs using data from MongoDB."""
@@ -259,68 +758,165 @@ def fetch_drug_data(drug_name):
 #         print("No interactions found between the drugs.")
 #     return interactions
 
+# Process-wide memo of pair -> interactions, so popular pairs become dictionary lookups. It serves the
+# per-pair paths (search_interactions_for_drugs and the paged, streamed and job checks);
+# check_regimen reads all its pairs from the graph in one gather, and is cached per regimen instead
+PAIR_MEMO_SIZE = int(os.environ.get("FORM_PAIR_MEMO_SIZE", "100000"))
+pair_memo = PairMemo(PAIR_MEMO_SIZE)
+
+def drug_versions(drugs):
+    """{drug: fetch time of its indexed document} for the drugs the interaction graph has indexed.
+
+    A pair's interactions come from its two drugs' documents only, so these version its memo entry.
+    """
+    versions = {}
+    for drug_name in drugs:
+        try:
+            versions[drug_name] = interaction_graph.fetched_at(drug_name.strip())
+        except KeyError:
+            pass
+    return versions
+
 def search_interactions_for_drugs(drugs_to_check):
     """Search for interactions between the given drugs using data from MongoDB."""
+    # Read before fetching: a result is only memoized under versions that predate it
+    versions = drug_versions(drugs_to_check)
+    memoized = pair_memo.get(drugs_to_check, versions)
+    if memoized is not None:
+        for drug_name in set(drugs_to_check):
+            note_drug_request(drug_name.strip())
+        return memoized
+
     interactions = set()
 
+    # Fast path: most candidate pairs have no recorded interaction and never need a lookup
+    if not may_interact(drugs_to_check):
+        for drug_name in set(drugs_to_check):
+            note_drug_request(drug_name.strip())
+        pair_memo.set(drugs_to_check, versions, interactions)
+        return interactions
+
     # Fetch data for all drugs in the combination
     for drug_name in drugs_to_check:
         fetch_drug_data(drug_name.strip())
 
     # Search for interactions between the drugs
+    complete = True
     for drug_name in drugs_to_check:
         file_name = f"{drug_name.strip()}_response.csv"
         document = collection.find_one({"file_name": file_name})
         if document:
-            content = document["content"]
-            # Parse the CSV content
-            reader = csv.DictReader(content.splitlines())
-            for row in reader:
-                drug1 = row["name"]
-                drug2 = row["name2"]
-                description = row["descr"]
-                
+            for drug1, drug2, description in iter_interaction_rows(document):
                 if drug1 in drugs_to_check and drug2 in drugs_to_check:
                     interaction_tuple = tuple(sorted([drug1, drug2]))
                     if interaction_tuple not in interactions:
                         interactions.add((interaction_tuple, description))
-                        print(f"{drug1} - {drug2}: {description}")
+                        event("Interaction found", drugs=f"{drug1} - {drug2}", description=description)
         else:
-            print(f"File for {drug_name.strip()} not found in MongoDB.")
+            complete = False
+            event("Data not found in MongoDB", drug=drug_name.strip())
     
     if not interactions:
-        print("No interactions found between the drugs.")
+        event("No interactions found")
+    if complete:  # A failed download is retried next time rather than memoized
+        pair_memo.set(drugs_to_check, versions, interactions)
     return interactions
 
-def are_similar_drugs_present(input_drug_name, filename="SAME_DRUG.csv"):
-    """Check if similar drugs for the input drug are already present in SAME_DRUG.csv."""
-    if not os.path.isfile(filename):
-        return False  # File doesn't exist, so similar drugs are not present
-    
+@stage("search_interactions_for_regimen")
+def search_interactions_for_regimen(drugs, pending=None):
+    """Fetch and index every drug in the regimen, then read all its interacting pairs at once.
+
+    Drugs left unfetched because the deadline ran out are added to the `pending` set, if given.
+    """
+    for drug_name in drugs:
+        drug_name = drug_name.strip()
+        if drug_name in interaction_graph.indexed_drugs:
+            note_drug_request(drug_name)
+            continue
+        try:
+            fetch_drug_data(drug_name)
+        except DeadlineExceeded:
+            if pending is not None:  # Out of time: the caller reports this drug as incomplete
+                pending.add(drug_name)
+            continue
+        # Another worker may have stored this drug, so index whatever MongoDB now holds
+        document = collection.find_one({"file_name": f"{drug_name}_response.csv"})
+        if document and document["drug_name"] not in interaction_graph.indexed_drugs:
+            index_document(document)
+        elif not document:
+            event("Data not found in MongoDB", drug=drug_name)
+    return interaction_graph.regimen_interactions(drugs)
+
+# "pruned" expands combinations from each drug's interaction partners; "brute" checks every candidate pair
+EXPANSION_MODE = os.environ.get("FORM_EXPANSION_MODE", "pruned")
+
+def expand_interacting_pairs(all_drugs, fetch=True):
+    """Return every pair of all_drugs with a recorded interaction, via partner-set intersection.
+
+    Yields the same interacting pairs as the brute-force pair loop, but the work scales
+    with the interactions present rather than the number of candidate pairs.
+    Pass fetch=False when the drugs were already fetched and indexed.
+    """
+    if fetch:
+        search_interactions_for_regimen(all_drugs)  # Make sure every drug is fetched and indexed
+    counts = Counter(all_drugs)
+    candidates = set(counts)
+    partners_among = interaction_graph.partners_among(candidates)
+    pairs = set()
+    for drug in candidates:
+        partners = partners_among.get(drug, set())
+        if drug in partners:
+            # A self-interaction is reported for every combination containing the drug
+            pairs.update(tuple(sorted([drug, other])) for other in candidates if other != drug)
+            if counts[drug] > 1:
+                pairs.add((drug, drug))
+        pairs.update(tuple(sorted([drug, partner])) for partner in partners if partner != drug)
+    return pairs
+
+SimilarDrugIndex = namedtuple("SimilarDrugIndex", ["by_name", "first_by_lower", "with_similar"])
+
+def read_similar_drug_index(filename):
+    """Parse SAME_DRUG.csv into the lookups the helpers below used to scan the file for."""
+    by_name = {}  # exact input name -> similar drugs of its last row
+    first_by_lower = {}  # lower-cased input name -> similar drugs of its first row
+    with_similar = set()  # lower-cased input names with a row listing at least one similar drug
     with open(filename, mode="r", encoding="utf-8") as file:
         reader = csv.DictReader(file)
         for row in reader:
-            if row["Input Drug Name"].lower() == input_drug_name.lower():
-                # Check if at least one similar drug is present
-                if row["Similar Drug 1"] or row["Similar Drug 2"] or row["Similar Drug 3"]:
-                    return True  # Similar drugs are already present
-        return False  # Input drug not found or no similar drugs present
+            input_drug = row["Input Drug Name"]
+            similar_drugs = [row["Similar Drug 1"], row["Similar Drug 2"], row["Similar Drug 3"]]
+            # Remove empty strings (if any)
+            similar_drugs = [drug for drug in similar_drugs if drug]
+            by_name[input_drug] = similar_drugs
+            first_by_lower.setdefault(input_drug.lower(), similar_drugs)
+            if similar_drugs:
+                with_similar.add(input_drug.lower())
+    return SimilarDrugIndex(by_name, first_by_lower, with_similar)
+
+def pack_similar_drug_index(filename):
+    """Index segment sections for build_similar_drug_index."""
+    by_name, first_by_lower, with_similar = read_similar_drug_index(filename)
+    sections = pack_string_lists("by_name", by_name)
+    sections.update(pack_string_lists("first_by_lower", first_by_lower))
+    sections.update(pack_strings("with_similar", sorted(with_similar)))
+    return sections
+
+def build_similar_drug_index(filename):
+    """read_similar_drug_index's lookups, mapped from one index file shared by every worker."""
+    segment = derived_segment(filename, "similar", pack_similar_drug_index)
+    return SimilarDrugIndex(StringListMap(segment, "by_name"), StringListMap(segment, "first_by_lower"), StringTable(segment, "with_similar"))
+
+def are_similar_drugs_present(input_drug_name, filename="SAME_DRUG.csv"):
+    """Check if similar drugs for the input drug are already present in SAME_DRUG.csv."""
+    index = load_indexed(filename, build_similar_drug_index)
+    return index is not None and input_drug_name.lower() in index.with_similar
 
 def get_similar_drugs_from_csv(input_drug_name, filename="SAME_DRUG.csv"):
     """Retrieve similar drugs for a given input drug from SAME_DRUG.csv."""
-    similar_drugs = []
-    if not os.path.isfile(filename):
-        return similar_drugs
-    
-    with open(filename, mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row["Input Drug Name"].lower() == input_drug_name.lower():
-                similar_drugs = [row["Similar Drug 1"], row["Similar Drug 2"], row["Similar Drug 3"]]
-                # Remove empty strings (if any)
-                similar_drugs = [drug for drug in similar_drugs if drug]
-                break
-    return similar_drugs        
+    index = load_indexed(filename, build_similar_drug_index)
+    if index is None:
+        return []
+    return list(index.first_by_lower.get(input_drug_name.lower(), []))
 
 # @form.route("/", methods=["GET", "POST"])
 # def index():
@@ -443,80 +1039,504 @@ def get_similar_drugs_from_csv(input_drug_name, filename="SAME_DRUG.csv"):
 #     return render_template("form.html")
 
 
+@scheduler.task
+@stage("find_similar_drugs")
+def find_similar_drugs(drug_name):
+    """Resolve the drug's DrugBank ID, look up its most similar drugs and save them; None if that fails."""
+    # Fetch DrugBank ID for the input drug
+    drug_info = get_all_drug_ids(drug_name)
+    drugbank_id = drug_info["DrugBank ID"]
+    if not drugbank_id:
+        event("No DrugBank ID found", drug=drug_name)
+        return None
+    # Fetch similar DrugBank IDs from the similarity matrix
+    similarity_matrix = load_similarity_neighbors()
+    similar_drugbank_ids = get_top_similar_drugs(drugbank_id, similarity_matrix)
+    similar_drug_names = []
+
+    # Resolve DrugBank IDs to drug names
+    for drugbank_id in similar_drugbank_ids:
+        drug_name_resolved = get_drug_name_from_drugbank_id(drugbank_id)
+        if drug_name_resolved:
+            similar_drug_names.append(drug_name_resolved)
+        else:
+            event("No name resolved for DrugBank ID", drugbank_id=drugbank_id)
+
+    # Save similar drug names to SAME_DRUG.csv
+    if not similar_drug_names:  # Only save if at least one similar drug name was resolved
+        event("No similar drugs resolved", drug=drug_name)
+        return None
+    save_similar_drugs_to_csv(drug_name, similar_drug_names)
+    event("Similar drugs resolved", drug=drug_name, similar_drugs=", ".join(similar_drug_names))
+    return similar_drug_names
+
+def similar_drugs_for(drug_name):
+    """Return the drug's similar drug names from SAME_DRUG.csv, computing and saving them if missing."""
+    if are_similar_drugs_present(drug_name):  # Check if similar drugs are already present
+        event("Similar drugs found in SAME_DRUG.csv", drug=drug_name)
+        return get_similar_drugs_from_csv(drug_name)
+    event("Similar drugs not in SAME_DRUG.csv, fetching", drug=drug_name)
+    return find_similar_drugs(drug_name)
+
+def iter_similar_drugs(input_drug_names):
+    """Yield (drug_name, similar drug names or None) for each input drug as soon as it is resolved."""
+    for drug_name in input_drug_names:
+        yield drug_name, similar_drugs_for(drug_name)
+
+def resolve_similar_drugs(input_drug_names):
+    """Look up (or compute and save) the similar drugs for every input drug."""
+    return {drug_name: similar_drug_names for drug_name, similar_drug_names in iter_similar_drugs(input_drug_names) if similar_drug_names is not None}
+
+def regimen_missing_drugs(input_drug_names, similar_drugs_info, pending=()):
+    """Drugs of the regimen that could not be resolved or whose interaction data could not be fetched.
+
+    An unresolved input stops the regimen from being expanded, so only those are reported then.
+    Drugs in `pending` are still being fetched rather than missing.
+    """
+    pending = set(pending)
+    unresolved = set(input_drug_names) - set(similar_drugs_info) - pending
+    if unresolved:
+        return sorted(unresolved)
+    all_drugs = list(input_drug_names)
+    for drug_name in input_drug_names:
+        all_drugs.extend(similar_drugs_info.get(drug_name, []))
+    return sorted({drug.strip() for drug in all_drugs if drug.strip() not in interaction_graph.indexed_drugs} - pending)
+
+def iter_ranked_combinations(input_drug_names, similar_drugs_info):
+    """Lazily yield each unique drug pair: input-input first, then input-similar, then similar-similar."""
+    similar_drugs = [drug for drug_name in input_drug_names for drug in similar_drugs_info.get(drug_name, [])]
+
+    def candidate_pairs():
+        for i, drug1 in enumerate(input_drug_names):
+            for drug2 in input_drug_names[i + 1:]:
+                yield drug1, drug2
+        for drug1 in input_drug_names:
+            for drug2 in similar_drugs:
+                yield drug1, drug2
+        for i, drug1 in enumerate(similar_drugs):
+            for drug2 in similar_drugs[i + 1:]:
+                yield drug1, drug2
+
+    seen = set()
+    for drug1, drug2 in candidate_pairs():
+        pair = tuple(sorted([drug1, drug2]))
+        if pair not in seen:
+            seen.add(pair)
+            yield pair
+
+# Pairs are indexed and checked in chunks so a page only downloads the drugs it actually covers
+COMBINATION_CHUNK_SIZE = 64
+
+def iter_combination_interactions(input_drug_names, similar_drugs_info, cursor=0, limit=None):
+    """Lazily check up to `limit` pairs of the ranked combination stream, starting at cursor.
+
+    Yields (combo, interaction_results) for every pair checked, interacting or not.
+    """
+    stop = None if limit is None else cursor + limit
+    ranked = itertools.islice(iter_ranked_combinations(input_drug_names, similar_drugs_info), cursor, stop)
+    while True:
+        chunk = list(itertools.islice(ranked, COMBINATION_CHUNK_SIZE))
+        if not chunk:
+            return
+        # Pairs already in the memo skip fetching and indexing entirely
+        versions = drug_versions({drug for pair in chunk for drug in pair})
+        memoized = {pair: pair_memo.get(pair, versions) for pair in chunk}
+        misses = [pair for pair in chunk if memoized[pair] is None]
+        # Pairs the bloom filter rules out need no graph lookup either
+        for pair in misses:
+            if not may_interact(list(pair)):
+                memoized[pair] = set()
+                pair_memo.set(pair, versions, memoized[pair])
+        misses = [pair for pair in misses if memoized[pair] is None]
+        # Hits still count as requests, so popular drugs keep getting refreshed
+        for drug_name in {drug for pair in chunk if pair not in misses for drug in pair}:
+            note_drug_request(drug_name)
+        if misses:
+            regimen_interactions = search_interactions_for_regimen({drug for pair in misses for drug in pair})
+            for pair in misses:
+                memoized[pair] = combo_interactions(regimen_interactions, list(pair))
+                # Versions read before the search, so a document swapped in meanwhile can't be misattributed
+                pair_memo.set(pair, versions, memoized[pair])
+        for pair in chunk:
+            yield f"{pair[0]},{pair[1]}", memoized[pair]
+
+def check_combinations_page(input_drug_names, similar_drugs_info, cursor=0, page_size=None, max_interactions=None):
+    """Check one page of the ranked combination stream.
+
+    Returns (interactions, next_cursor); next_cursor is None once the stream is exhausted.
+    The page ends after page_size pairs or as soon as max_interactions combinations interact.
+    """
+    interactions = []
+    position = cursor
+    for combo, interaction_results in iter_combination_interactions(input_drug_names, similar_drugs_info, cursor, page_size):
+        position += 1
+        if interaction_results:
+            interactions.append((combo, interaction_results))
+            if max_interactions is not None and len(interactions) >= max_interactions:
+                return interactions, position
+    if page_size is not None and position - cursor >= page_size:
+        return interactions, position
+    return interactions, None
+
+def stream_results(input_drug_names):
+    """Render results.html progressively: similar drugs as they resolve, then each interacting combination."""
+    similar_drugs_info = {}
+
+    def similar_drugs_stream():
+        for drug_name, similar_drug_names in iter_similar_drugs(input_drug_names):
+            if similar_drug_names is not None:
+                similar_drugs_info[drug_name] = similar_drug_names
+                yield drug_name, similar_drug_names
+
+    def interactions_stream():
+        # Runs only after the template has finished the similar-drugs section
+        if not all(drug_name in similar_drugs_info for drug_name in input_drug_names):
+            event("Unable to generate combinations: some input drugs have no similar drugs resolved")
+            return
+        for combo, interaction_results in iter_combination_interactions(input_drug_names, similar_drugs_info):
+            if interaction_results:
+                yield combo, interaction_results
+
+    response = Response(stream_template("results_stream.html", input_drug_names=input_drug_names,
+                                        similar_drugs=similar_drugs_stream(), interactions=interactions_stream()))
+    response.headers["X-Accel-Buffering"] = "no"  # Ask reverse proxies not to buffer the chunks
+    return response
+
+def serialize_interactions(interaction_results):
+    """Turn a set of ((drug1, drug2), description) into JSON-friendly dicts."""
+    return [{"drugs": list(drug_pair), "description": description} for drug_pair, description in sorted(interaction_results)]
+
+@traced("form.job")
+@priority(BATCH)
+def run_regimen_job(job, publish):
+    """Run the Form pipeline for a background job, publishing partial results as they are found.
+
+    Like check_regimen, the finished job lists missing_drugs, whose interactions may be missing.
+    """
+    input_drug_names = job["input_drug_names"]
+    similar_drugs_info = job["similar_drugs_info"]
+    for drug_name, similar_drug_names in iter_similar_drugs(input_drug_names):
+        if similar_drug_names is not None:
+            similar_drugs_info[drug_name] = similar_drug_names
+            publish()
+    if not all(drug_name in similar_drugs_info for drug_name in input_drug_names):
+        job["message"] = "Unable to generate combinations. Some input drugs do not have similar drugs resolved."
+        job["missing_drugs"] = regimen_missing_drugs(input_drug_names, similar_drugs_info)
+        return
+    for combo, interaction_results in iter_combination_interactions(input_drug_names, similar_drugs_info):
+        if interaction_results:
+            job["interactions"].append({"combo": combo, "interactions": serialize_interactions(interaction_results)})
+            publish()
+    # Jobs run without a deadline, so every drug is either fetched or missing, never incomplete
+    job["missing_drugs"] = regimen_missing_drugs(input_drug_names, similar_drugs_info)
+
+BATCH_MAX_REGIMENS = int(os.environ.get("FORM_BATCH_MAX_REGIMENS", "1000"))
+
+@traced("form.batch")
+@priority(BATCH)
+def check_regimen_batch(regimens):
+    """Check many regimens against one shared state.
+
+    Every distinct drug across the batch is resolved, fetched and indexed exactly once;
+    each regimen is then just a submatrix extraction on the shared interaction graph.
+    As in check_regimen, each result lists its missing_drugs, whose interactions may be missing.
+    """
+    distinct_inputs = list(dict.fromkeys(drug for regimen in regimens for drug in regimen))
+    similar_drugs_info = resolve_similar_drugs(distinct_inputs)
+    distinct_drugs = set(distinct_inputs)
+    for similar_drug_names in similar_drugs_info.values():
+        distinct_drugs.update(similar_drug_names)
+    search_interactions_for_regimen(distinct_drugs)
+
+    results = []
+    for input_drug_names in regimens:
+        result = {
+            "input_drug_names": input_drug_names,
+            "similar_drugs_info": {drug_name: similar_drugs_info[drug_name] for drug_name in input_drug_names if drug_name in similar_drugs_info},
+            "interactions": [],
+            "incomplete_drugs": [],  # The batch runs without a deadline
+            "message": None,
+        }
+        result["missing_drugs"] = regimen_missing_drugs(input_drug_names, result["similar_drugs_info"])
+        if not all(drug_name in similar_drugs_info for drug_name in input_drug_names):
+            result["message"] = "Unable to generate combinations. Some input drugs do not have similar drugs resolved."
+        else:
+            all_drugs = input_drug_names.copy()
+            for drug_name in input_drug_names:
+                all_drugs.extend(similar_drugs_info[drug_name])
+            regimen_interactions = interaction_graph.regimen_interactions(all_drugs)
+            for pair in sorted(expand_interacting_pairs(all_drugs, fetch=False)):
+                interaction_results = combo_interactions(regimen_interactions, list(pair))
+                if interaction_results:
+                    result["interactions"].append({"combo": f"{pair[0]},{pair[1]}", "interactions": serialize_interactions(interaction_results)})
+        results.append(result)
+    return {"results": results, "distinct_drugs": len(distinct_drugs)}
+
+@form.route("/batch", methods=["POST"])
+def batch():
+    """Check a JSON list of regimens (drug lists or space-separated strings) in one call."""
+    payload = request.get_json(silent=True) or {}
+    regimens = payload.get("regimens")
+    if not isinstance(regimens, list) or not regimens:
+        return jsonify({"error": "Provide a non-empty list of regimens."}), 400
+    if len(regimens) > BATCH_MAX_REGIMENS:
+        return jsonify({"error": f"At most {BATCH_MAX_REGIMENS} regimens per call."}), 400
+    parsed = []
+    for regimen in regimens:
+        drugs = regimen.split() if isinstance(regimen, str) else regimen
+        if not isinstance(drugs, list) or not drugs or not all(isinstance(drug, str) and drug.strip() for drug in drugs):
+            return jsonify({"error": f"Invalid regimen: {regimen!r}"}), 400
+        parsed.append([drug.strip() for drug in drugs])
+    return jsonify(check_regimen_batch(parsed))
+
+@form.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Expose hit/miss counters of the regimen cache and the pair memo."""
+    return jsonify({"regimen_cache": regimen_cache.stats(), "pair_memo": pair_memo.stats()})
+
+@form.route("/scheduler/stats", methods=["GET"])
+def scheduler_stats():
+    """Expose queue depth and wait times of each scheduler priority class."""
+    return jsonify(scheduler.stats())
+
+@form.route("/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    """Return a stored request profile; needs the same admin token as taking one."""
+    if not authorized():
+        return jsonify({"error": "Forbidden."}), 403
+    profile = load_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Unknown profile."}), 404
+    return jsonify(profile)
+
+# Background jobs for regimens too slow to run inside one request
+JOBS_FOLDER = os.path.join("Drug_data", "jobs")
+JOB_WORKERS = int(os.environ.get("FORM_JOB_WORKERS", "4"))
+JOB_MAX_WAIT = 30  # seconds a status request may long-poll
+
+job_runner = None
+
+def start_job_runner():
+    """Start the job worker pool in this process and resume unfinished jobs."""
+    global job_runner
+    job_runner = JobRunner(JobStore(JOBS_FOLDER), run_regimen_job, max_workers=JOB_WORKERS)
+    job_runner.resume_unfinished()
+
+# Set by the pre-fork server (gunicorn.conf.py): the master only builds the shared indexes and
+# each worker starts its own background threads after fork, since threads don't survive it
+FORM_PREFORK = os.environ.get("FORM_PREFORK") == "1"
+
+@form.record_once
+def start_background_workers(state):
+    """Start the refresh scheduler and job runner once the blueprint is registered."""
+    if not FORM_PREFORK:
+        start_refresh_scheduler()
+        start_job_runner()
+
+def preload_indexes():
+    """Build or map every read-only index now, e.g. in a pre-fork master, so no worker has to."""
+    started = time.perf_counter()
+    load_indexed("SAME_DRUG.csv", build_similar_drug_index)
+    load_indexed("drug_names_ids.csv", build_drug_name_index)
+    if os.path.isfile("Drug_data/chem_similarity.csv"):
+        load_similarity_neighbors()
+    print(f"✅ Preloaded indexes in {time.perf_counter() - started:.1f}s.")
+
+def init_forked_worker():
+    """Prepare a freshly forked worker: its own MongoDB client (pymongo clients aren't fork-safe) and background threads."""
+    connect_mongo()
+    if regimen_cache.shared_collection is not None:
+        regimen_cache.shared_collection = db["regimen_cache"]
+    if FORM_PREFORK:
+        start_refresh_scheduler()
+        start_job_runner()
+
+@form.route("/jobs", methods=["POST"])
+def submit_job():
+    """Queue a regimen check and return its job ID immediately."""
+    payload = request.get_json(silent=True) or request.form
+    drugs = payload.get("drugs") or payload.get("drug_names")
+    if isinstance(drugs, str):
+        drugs = drugs.split()
+    if not drugs:
+        return jsonify({"error": "No drugs provided."}), 400
+    if job_runner is None:  # Not started in this process, e.g. FORM_PREFORK=1 without the gunicorn post_fork hook
+        return jsonify({"error": "Job queue unavailable."}), 503
+    job = job_runner.submit([drug.strip() for drug in drugs])
+    return jsonify({"job_id": job["job_id"], "status": job["status"], "status_url": url_for("form.job_status", job_id=job["job_id"])}), 202
+
+@form.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Return a job's status and (partial) results; ?wait=N long-polls for up to N seconds."""
+    wait = min(request.args.get("wait", 0, type=float), JOB_MAX_WAIT)
+    since = request.args.get("since", 0, type=int)
+    if job_runner is None:
+        return jsonify({"error": "Job queue unavailable."}), 503
+    job = job_runner.wait(job_id, since=since, timeout=wait)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(job)
+
+@stage("check_regimen")
+def check_regimen(input_drug_names):
+    """Run the full Form pipeline for a regimen, within the caller's deadline if one is set.
+
+    Returns (similar_drugs_info, combinations, interactions, incomplete_drugs, missing_drugs).
+    incomplete_drugs lists the drugs the deadline ran out for, which are finished in the
+    background; missing_drugs those that could not be resolved or whose data could not be
+    fetched. Interactions involving either may be missing, so the result shouldn't be cached.
+    The pair memo isn't consulted: one graph gather answers every pair of the regimen at once.
+    """
+    # Step 2: Check if similar drugs are already present in SAME_DRUG.csv
+    similar_drugs_info = {}
+    pending_drugs = set()  # drugs that couldn't be resolved or downloaded before the deadline
+    for drug_name in input_drug_names:
+        try:
+            similar_drug_names = similar_drugs_for(drug_name)
+        except DeadlineExceeded:
+            pending_drugs.add(drug_name)
+            continue
+        if similar_drug_names is not None:
+            similar_drugs_info[drug_name] = similar_drug_names
+    
+    # Step 3: Generate combinations including original input drugs
+    if not all(drug_name in similar_drugs_info or drug_name in pending_drugs for drug_name in input_drug_names):
+        event("Unable to generate combinations: some input drugs have no similar drugs resolved")
+        return similar_drugs_info, [], [], sorted(pending_drugs), regimen_missing_drugs(input_drug_names, similar_drugs_info, pending_drugs)
+
+    # Include original input drugs in the list of drugs to combine
+    all_drugs = input_drug_names.copy()
+    for drug_name in similar_drugs_info:
+        all_drugs.extend(similar_drugs_info[drug_name])
+    
+    # Fetch and index the whole expanded regimen once; the expansion and the pair search both read it
+    regimen_interactions = search_interactions_for_regimen(all_drugs, pending=pending_drugs)
+
+    # Generate all possible combinations
+    combinations = set()
+    for i in range(len(all_drugs)):
+        for j in range(i + 1, len(all_drugs)):
+            pair = tuple(sorted([all_drugs[i], all_drugs[j]]))
+            combinations.add(pair)
+    if EXPANSION_MODE == "pruned":
+        # Only combinations with a recorded interaction are searched; the results match the full pair loop
+        searched = expand_interacting_pairs(all_drugs, fetch=False)
+    else:
+        searched = combinations
+    
+    # Convert the set of tuples to a sorted list of comma-separated strings
+    combinations = sorted([f"{pair[0]},{pair[1]}" for pair in combinations])
+    searched = sorted([f"{pair[0]},{pair[1]}" for pair in searched])
+    
+    interactions = []
+    if combinations:
+        event("Generated combinations", combination_count=len(combinations))
+        # Split the whole regimen's interactions per combination
+        with stage("pair_search", pair_count=len(searched)):
+            for combo in searched:
+                drugs_to_check = [drug.strip() for drug in combo.split(",")]
+                interaction_results = combo_interactions(regimen_interactions, drugs_to_check)
+                if interaction_results:
+                    interactions.append((combo, interaction_results))
+    else:
+        event("No combinations generated")
+    # Drugs that simply failed to download are retried by the next request rather than in the background
+    missing_drugs = regimen_missing_drugs(input_drug_names, similar_drugs_info, pending_drugs)
+    current_span().set(drug_count=len(all_drugs), pair_count=len(searched), interaction_count=len(interactions),
+                       incomplete_count=len(pending_drugs), missing_count=len(missing_drugs))
+    if pending_drugs:
+        finish_in_background(input_drug_names, pending_drugs)
+    return similar_drugs_info, combinations, interactions, sorted(pending_drugs), missing_drugs
+
+def finish_in_background(input_drug_names, drugs):
+    """Hand work a request ran out of time for to a batch task, so a later request finds it done."""
+    with deadline(None), priority(BATCH):
+        scheduler.submit(prefetch_regimen, input_drug_names, drugs)
+
+def prefetch_regimen(input_drug_names, drugs):
+    """Resolve the regimen's similar drugs and download every drug involved, without a deadline."""
+    drugs = set(drugs) | set(input_drug_names)
+    for similar_drug_names in resolve_similar_drugs(input_drug_names).values():
+        drugs.update(similar_drug_names)
+    search_interactions_for_regimen(drugs)
+
+# Whole-regimen result cache, keyed by the normalized drug set plus the data-snapshot version
+RESULT_CACHE_SIZE = int(os.environ.get("FORM_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_SHARED = os.environ.get("FORM_RESULT_CACHE_SHARED") == "1"  # also share results across workers via MongoDB
+
+regimen_cache = ResultCache("form", max_size=RESULT_CACHE_SIZE, shared_collection=db["regimen_cache"] if RESULT_CACHE_SHARED else None)
+cache_metrics("form", {"regimen": regimen_cache, "pair_memo": pair_memo})
+
+def cached_check_regimen(input_drug_names):
+    """check_regimen() behind the regimen cache.
+
+    Returns (similar_drugs_info, combinations, interactions, incomplete_drugs, missing_drugs);
+    partial results are never cached.
+    """
+    version = data_version()
+    cached = regimen_cache.get(input_drug_names, version)
+    current_span().set(cache_hit=cached is not None)
+    if cached is None:
+        similar_drugs_info, combinations, interactions, incomplete_drugs, missing_drugs = check_regimen(input_drug_names)
+        if incomplete_drugs or missing_drugs:
+            return similar_drugs_info, combinations, interactions, incomplete_drugs, missing_drugs
+        cached = {
+            "similar_drugs_info": similar_drugs_info,
+            "combinations": combinations,
+            "interactions": [{"combo": combo, "interactions": serialize_interactions(results)} for combo, results in interactions],
+        }
+        # The check itself may have ingested new drugs, so file it under the version it saw last
+        version = data_version()
+        regimen_cache.set(input_drug_names, version, cached)
+
+    # The cache key ignores order, so list the similar drugs in this request's input order
+    similar_drugs_info = {}
+    for drug_name in input_drug_names:
+        similar = cached["similar_drugs_info"].get(drug_name)
+        if similar is not None:
+            similar_drugs_info[drug_name] = similar
+    interactions = [
+        (entry["combo"], {(tuple(item["drugs"]), item["description"]) for item in entry["interactions"]})
+        for entry in cached["interactions"]
+    ]
+    return similar_drugs_info, cached["combinations"], interactions, [], []
+
+# Seconds a results page may spend resolving and downloading before it returns partial results (0 disables)
+FORM_REQUEST_DEADLINE = float(os.environ.get("FORM_REQUEST_DEADLINE", "20"))
+
 @form.route("/", methods=["GET", "POST"])
+@profiled
+@traced("form.index")
 def index():
     if request.method == "POST":
         # Step 1: Take user input
         input_drug_names = request.form.get("drug_names").strip().split()
-        
-        # Step 2: Check if similar drugs are already present in SAME_DRUG.csv
-        similar_drugs_info = {}
-        for drug_name in input_drug_names:
-            if are_similar_drugs_present(drug_name):  # Check if similar drugs are already present
-                print(f"✅ Similar drugs for {drug_name} already exist in SAME_DRUG.csv. Skipping...")
-                similar_drugs_info[drug_name] = get_similar_drugs_from_csv(drug_name)
-            else:
-                print(f"❌ Similar drugs for {drug_name} not found in SAME_DRUG.csv. Fetching...")
-                # Fetch DrugBank ID for the input drug
-                drug_info = get_all_drug_ids(drug_name)
-                drugbank_id = drug_info["DrugBank ID"]
-                if drugbank_id:
-                    # Fetch similar DrugBank IDs from the similarity matrix
-                    similarity_matrix = load_similarity_matrix()
-                    similar_drugbank_ids = get_top_similar_drugs(drugbank_id, similarity_matrix)
-                    similar_drug_names = []
-                    
-                    # Resolve DrugBank IDs to drug names
-                    for drugbank_id in similar_drugbank_ids:
-                        drug_name_resolved = get_drug_name_from_drugbank_id(drugbank_id)
-                        if drug_name_resolved:
-                            similar_drug_names.append(drug_name_resolved)
-                        else:
-                            print(f"❌ No name resolved for DrugBank ID {drugbank_id}. Skipping...")
-                    
-                    # Save similar drug names to SAME_DRUG.csv
-                    if similar_drug_names:  # Only save if at least one similar drug name was resolved
-                        save_similar_drugs_to_csv(drug_name, similar_drug_names)
-                        similar_drugs_info[drug_name] = similar_drug_names
-                        print(f"✅ Similar drugs for {drug_name}: {similar_drug_names}")
-                    else:
-                        print(f"❌ No similar drugs resolved for {drug_name}. Skipping...")
-                else:
-                    print(f"❌ No DrugBank ID found for {drug_name}.")
-        
-        # Step 3: Generate combinations including original input drugs
-        if all(drug_name in similar_drugs_info for drug_name in input_drug_names):
-            # Include original input drugs in the list of drugs to combine
-            all_drugs = input_drug_names.copy()
-            for drug_name in input_drug_names:
-                all_drugs.extend(similar_drugs_info[drug_name])
-            
-            # Generate all possible combinations
-            combinations = set()
-            for i in range(len(all_drugs)):
-                for j in range(i + 1, len(all_drugs)):
-                    pair = tuple(sorted([all_drugs[i], all_drugs[j]]))
-                    combinations.add(pair)
-            
-            # Convert the set of tuples to a sorted list of comma-separated strings
-            combinations = sorted([f"{pair[0]},{pair[1]}" for pair in combinations])
-            
-            if combinations:
-                print("\n✅ Generated Combinations and Interactions:")
-                interactions = []
-                for combo in combinations:
-                    print(f"\n🔍 Checking interactions for: {combo}")
-                    drugs_to_check = [drug.strip() for drug in combo.split(",")]
-                    interaction_results = search_interactions_for_drugs(drugs_to_check)
-                    if interaction_results:
-                        interactions.append((combo, interaction_results))
-                return render_template("results.html", input_drug_names=input_drug_names, similar_drugs_info=similar_drugs_info, combinations=combinations, interactions=interactions)
-            else:
-                print("❌ No combinations generated.")
-                return render_template("results.html", input_drug_names=input_drug_names, similar_drugs_info=similar_drugs_info, combinations=[], interactions=[])
-        else:
-            print("❌ Unable to generate combinations. Some input drugs do not have similar drugs resolved.")
-            return render_template("results.html", input_drug_names=input_drug_names, similar_drugs_info=similar_drugs_info, combinations=[], interactions=[])
+        current_span().set(input_drug_count=len(input_drug_names))
+
+        # Streaming mode: send each section as soon as its stage finishes
+        if request.values.get("stream"):
+            return stream_results(input_drug_names)
+
+        # Paged mode: walk the ranked combination stream lazily from the given cursor
+        page_size = request.form.get("page_size", type=int)
+        max_interactions = request.form.get("max_interactions", type=int)
+        if page_size or max_interactions:
+            similar_drugs_info = resolve_similar_drugs(input_drug_names)
+            if not all(drug_name in similar_drugs_info for drug_name in input_drug_names):
+                event("Unable to generate combinations: some input drugs have no similar drugs resolved")
+                missing_drugs = [drug_name for drug_name in input_drug_names if drug_name not in similar_drugs_info]
+                return render_template("results.html", input_drug_names=input_drug_names, similar_drugs_info=similar_drugs_info, combinations=[], interactions=[],
+                                       missing_drugs=missing_drugs)
+            cursor = request.form.get("cursor", 0, type=int)
+            interactions, next_cursor = check_combinations_page(input_drug_names, similar_drugs_info, cursor, page_size, max_interactions)
+            return render_template("results.html", input_drug_names=input_drug_names, similar_drugs_info=similar_drugs_info, combinations=[combo for combo, _ in interactions], interactions=interactions,
+                                   next_cursor=next_cursor, page_size=page_size, max_interactions=max_interactions)
+
+        # Bound the user-facing latency; whatever isn't done by then is finished in the background
+        with deadline(FORM_REQUEST_DEADLINE):
+            similar_drugs_info, combinations, interactions, incomplete_drugs, missing_drugs = cached_check_regimen(input_drug_names)
+        return render_template("results.html", input_drug_names=input_drug_names, similar_drugs_info=similar_drugs_info, combinations=combinations, interactions=interactions,
+                               incomplete_drugs=incomplete_drugs, missing_drugs=missing_drugs)
     
     return render_template("form.html")
 #---------------------------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,298 @@
+import datetime
+import threading
+
+import numpy as np
+
+from Form.shared_index import StringTable, pack_offsets, pack_strings
+
+EPOCH = datetime.datetime(1970, 1, 1)
+NO_FETCH_TIME = np.iinfo(np.int64).min
+
+
+def document_contributions(drug_name, rows):
+    """{partner: descriptions} that one drug's interaction document records."""
+    contributions = {}
+    for drug1, drug2, description in rows:
+        # search_interactions_for_drugs only reads a row through its own drug's document
+        if drug_name not in (drug1, drug2):
+            continue
+        partner = drug2 if drug1 == drug_name else drug1
+        contributions.setdefault(partner, set()).add(description)
+    return contributions
+
+
+def pack_interaction_graph(documents):
+    """Sections and metadata of a graph snapshot from (drug name, fetched_at, rows) per stored document.
+
+    Layout, with drugs and descriptions interned to IDs:
+        drugs              hashed string table of every drug named anywhere
+        drugs.document     1 where the drug's own document is in the snapshot
+        drugs.fetched_at   the document's fetch time in microseconds since the epoch
+        out.*              CSR: per document, the partners it names and a description set for each
+        in.*               CSR: per drug, the documents that name it
+        sets.*             CSR: per description set, its description IDs
+        descriptions       string table
+    """
+    drug_ids, description_ids, set_ids = {}, {}, {}
+    fetched_at, rows_by_document = {}, {}
+    for drug_name, document_fetched_at, rows in documents:
+        contributions = document_contributions(drug_name, rows)
+        drug_id = drug_ids.setdefault(drug_name, len(drug_ids))
+        fetched_at[drug_id] = document_fetched_at
+        row = []
+        for partner in sorted(contributions):
+            key = tuple(sorted(description_ids.setdefault(description, len(description_ids)) for description in contributions[partner]))
+            row.append((drug_ids.setdefault(partner, len(drug_ids)), set_ids.setdefault(key, len(set_ids))))
+        rows_by_document[drug_id] = sorted(row)
+
+    size = len(drug_ids)
+    out_rows = [rows_by_document.get(drug_id, []) for drug_id in range(size)]
+    in_rows = [[] for _ in range(size)]
+    for drug_id, row in enumerate(out_rows):
+        for partner_id, _ in row:
+            in_rows[partner_id].append(drug_id)
+    document = np.zeros(size, dtype=np.uint8)
+    document[list(rows_by_document)] = 1
+    fetched_at_us = np.full(size, NO_FETCH_TIME, dtype=np.int64)
+    for drug_id, value in fetched_at.items():
+        if value is not None:
+            fetched_at_us[drug_id] = (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+    sections = pack_strings("drugs", list(drug_ids))
+    sections.update(pack_strings("descriptions", list(description_ids), hashed=False))
+    sections.update({
+        "drugs.document": document,
+        "drugs.fetched_at": fetched_at_us,
+        "out.indptr": pack_offsets([len(row) for row in out_rows]),
+        "out.partners": np.array([partner_id for row in out_rows for partner_id, _ in row], dtype=np.int32),
+        "out.sets": np.array([set_id for row in out_rows for _, set_id in row], dtype=np.int32),
+        "in.indptr": pack_offsets([len(row) for row in in_rows]),
+        "in.documents": np.array([drug_id for row in in_rows for drug_id in row], dtype=np.int32),
+        "sets.indptr": pack_offsets([len(key) for key in set_ids]),
+        "sets.descriptions": np.array([description_id for key in set_ids for description_id in key], dtype=np.int32),
+    })
+    return sections, {"documents": len(rows_by_document)}
+
+
+# The graph is plain NumPy CSR arrays rather than a scipy.sparse.csr_matrix: a csr_matrix owns its
+# arrays, so every worker would copy the read-only mapped snapshot, and it cannot leave a row to be
+# overridden by a newer document indexed in this process. Looking a regimen up is the same row gather
+# and searchsorted filter a csr_matrix submatrix index performs.
+def gather_rows(indptr, rows):
+    """Positions of every entry of the given CSR rows, and the row each belongs to."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    row_starts = np.cumsum(lengths) - lengths
+    return np.repeat(starts - row_starts, lengths) + np.arange(lengths.sum()), np.repeat(rows, lengths)
+
+
+class GraphSnapshot:
+    """Read-only view of a segment written from pack_interaction_graph."""
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.drugs = StringTable(segment, "drugs")
+        self.descriptions = StringTable(segment, "descriptions")
+        self.document_count = segment.metadata["documents"]
+        self._document = memoryview(segment["drugs.document"])
+        self._fetched_at = memoryview(segment["drugs.fetched_at"])
+        self.out_indptr = segment["out.indptr"]
+        self.out_partners = segment["out.partners"]
+        self.out_sets = segment["out.sets"]
+        self.in_indptr = segment["in.indptr"]
+        self.in_documents = segment["in.documents"]
+        self._set_indptr = memoryview(segment["sets.indptr"])
+        self._set_descriptions = memoryview(segment["sets.descriptions"])
+
+    def has_document(self, drug_id):
+        return bool(self._document[drug_id])
+
+    def document_id(self, drug_name):
+        """The drug's ID if its document is in the snapshot, else -1."""
+        drug_id = self.drugs.index(drug_name)
+        return drug_id if drug_id >= 0 and self._document[drug_id] else -1
+
+    def fetched_at(self, drug_id):
+        value = self._fetched_at[drug_id]
+        return None if value == NO_FETCH_TIME else EPOCH + datetime.timedelta(microseconds=value)
+
+    def covers(self, drug_name, fetched_at):
+        """True if the snapshot holds the drug's document as fetched at `fetched_at` or later."""
+        drug_id = self.document_id(drug_name)
+        if drug_id < 0:
+            return False
+        if fetched_at is None:
+            return True
+        snapshot_fetched_at = self.fetched_at(drug_id)
+        return snapshot_fetched_at is not None and snapshot_fetched_at >= fetched_at
+
+    def description_set(self, set_id):
+        return [self.descriptions[description_id] for description_id in self._set_descriptions[self._set_indptr[set_id]:self._set_indptr[set_id + 1]]]
+
+
+class InteractionGraph:
+    """Drug-drug interaction graph: a shared snapshot plus the documents this process indexed since.
+
+    The snapshot keeps, per document, the partners it names and the descriptions it gives for
+    each. A pair's descriptions are the union of what the documents of its two drugs say.
+    Documents passed to add_document override the snapshot's copy of that drug.
+    """
+
+    def __init__(self, snapshot=None):
+        # (snapshot, {drug: (contributions, fetched_at)}, {drug: documents naming it}) -- swapped as one tuple
+        self._state = (snapshot, {}, {})
+        self._lock = threading.Lock()
+        self.indexed_drugs = IndexedDrugs(self)
+
+    @property
+    def snapshot(self):
+        return self._state[0]
+
+    def private_documents(self):
+        """Number of documents indexed in this process rather than read from the snapshot."""
+        return len(self._state[1])
+
+    def add_document(self, drug_name, rows, fetched_at=None):
+        """Index the (drug1, drug2, description) rows of one drug's interaction document.
+
+        Re-adding a drug replaces what its previous document contributed.
+        """
+        contributions = {partner: frozenset(descriptions) for partner, descriptions in document_contributions(drug_name, rows).items()}
+        with self._lock:
+            _, documents, mentions = self._state
+            previous = documents.get(drug_name)
+            # Readers may hold these sets, so they are replaced rather than changed
+            for partner in previous[0] if previous else ():
+                remaining = mentions[partner] - {drug_name}
+                if remaining:
+                    mentions[partner] = remaining
+                else:
+                    del mentions[partner]
+            for partner in contributions:
+                mentions[partner] = mentions.get(partner, frozenset()) | {drug_name}
+            documents[drug_name] = (contributions, fetched_at)
+
+    def attach(self, snapshot):
+        """Switch to a newer snapshot, dropping the documents indexed here that it covers."""
+        with self._lock:
+            documents = {drug_name: document for drug_name, document in self._state[1].items() if not snapshot.covers(drug_name, document[1])}
+            mentions = {}
+            for drug_name, (contributions, _) in documents.items():
+                for partner in contributions:
+                    mentions[partner] = mentions.get(partner, frozenset()) | {drug_name}
+            self._state = (snapshot, documents, mentions)
+
+    def fetched_at(self, drug_name):
+        """Fetch time of the indexed copy of the drug's document; KeyError if it isn't indexed."""
+        snapshot, documents, _ = self._state
+        if drug_name in documents:
+            return documents[drug_name][1]
+        drug_id = -1 if snapshot is None else snapshot.document_id(drug_name)
+        if drug_id < 0:
+            raise KeyError(drug_name)
+        return snapshot.fetched_at(drug_id)
+
+    def partners(self, drug_name):
+        """Return the names of every drug with a recorded interaction with the given drug."""
+        snapshot, documents, mentions = self._state
+        partners = set(mentions.get(drug_name, ()))
+        if drug_name in documents:
+            partners.update(documents[drug_name][0])
+        drug_id = -1 if snapshot is None else snapshot.drugs.index(drug_name)
+        if drug_id >= 0:
+            if drug_name not in documents:
+                partner_ids = snapshot.out_partners[snapshot.out_indptr[drug_id]:snapshot.out_indptr[drug_id + 1]]
+                partners.update(snapshot.drugs[partner_id] for partner_id in partner_ids.tolist())
+            for document_id in snapshot.in_documents[snapshot.in_indptr[drug_id]:snapshot.in_indptr[drug_id + 1]].tolist():
+                document_name = snapshot.drugs[document_id]
+                if document_name not in documents:  # A re-indexed document speaks through `mentions`
+                    partners.add(document_name)
+        return partners
+
+    def document_partners(self):
+        """Yield (drug, partners its document names) for every indexed document."""
+        snapshot, documents, _ = self._state
+        for drug_name, (contributions, _) in documents.items():
+            yield drug_name, list(contributions)
+        if snapshot is not None:
+            for drug_id in range(len(snapshot.drugs)):
+                if not snapshot.has_document(drug_id):
+                    continue
+                drug_name = snapshot.drugs[drug_id]
+                if drug_name not in documents:
+                    partner_ids = snapshot.out_partners[snapshot.out_indptr[drug_id]:snapshot.out_indptr[drug_id + 1]]
+                    yield drug_name, [snapshot.drugs[partner_id] for partner_id in partner_ids.tolist()]
+
+    def regimen_interactions(self, drugs):
+        """Return {(drug1, drug2): descriptions} for every interacting pair within the regimen."""
+        return {pair: tuple(sorted(descriptions)) for pair, descriptions in self._find_pairs(drugs, describe=True).items()}
+
+    def partners_among(self, drugs):
+        """Return {drug: its interaction partners among `drugs`} for every drug that has any."""
+        partners = {}
+        for drug1, drug2 in self._find_pairs(drugs, describe=False):
+            partners.setdefault(drug1, set()).add(drug2)
+            partners.setdefault(drug2, set()).add(drug1)
+        return partners
+
+    def _find_pairs(self, drugs, describe):
+        """{(drug1, drug2): set of descriptions} for the interacting pairs among drugs; the sets stay empty unless describe."""
+        snapshot, documents, _ = self._state
+        drugs = set(drugs)
+        found = {}
+
+        def record(drug1, drug2, descriptions):
+            descriptions_found = found.setdefault(tuple(sorted((drug1, drug2))), set())
+            if describe:
+                descriptions_found.update(descriptions)
+
+        for drug_name in drugs & documents.keys():
+            contributions = documents[drug_name][0]
+            for partner in drugs.intersection(contributions):
+                record(drug_name, partner, contributions[partner])
+
+        if snapshot is not None:
+            ids = {}
+            for drug_name in drugs:
+                drug_id = snapshot.drugs.index(drug_name)
+                if drug_id >= 0:
+                    ids[drug_id] = drug_name
+            snapshot_documents = [drug_id for drug_id, drug_name in ids.items() if drug_name not in documents and snapshot.has_document(drug_id)]
+            if snapshot_documents:
+                # Every regimen document's row at once, then only the entries naming regimen drugs
+                positions, owners = gather_rows(snapshot.out_indptr, np.array(snapshot_documents, dtype=np.int64))
+                partner_ids = snapshot.out_partners[positions]
+                regimen_ids = np.array(sorted(ids), dtype=np.int32)
+                keep = regimen_ids[np.searchsorted(regimen_ids, partner_ids).clip(max=len(regimen_ids) - 1)] == partner_ids
+                positions, owners = positions[keep], owners[keep]
+                for owner, partner_id, set_id in zip(owners.tolist(), partner_ids[keep].tolist(), snapshot.out_sets[positions].tolist()):
+                    record(ids[owner], ids[partner_id], snapshot.description_set(set_id) if describe else ())
+        return found
+
+
+class IndexedDrugs:
+    """Membership view of the drugs whose documents an InteractionGraph has indexed."""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __contains__(self, drug_name):
+        snapshot, documents, _ = self.graph._state
+        return drug_name in documents or (snapshot is not None and isinstance(drug_name, str) and snapshot.document_id(drug_name) >= 0)
+
+    def __len__(self):
+        snapshot, documents, _ = self.graph._state
+        if snapshot is None:
+            return len(documents)
+        return snapshot.document_count + sum(1 for drug_name in documents if snapshot.document_id(drug_name) < 0)
+
+
+def combo_interactions(regimen_interactions, drugs_to_check):
+    """Pick the interactions among one combination, in search_interactions_for_drugs' format."""
+    interactions = set()
+    for i, drug1 in enumerate(drugs_to_check):
+        for drug2 in drugs_to_check[i:]:
+            pair = tuple(sorted((drug1, drug2)))
+            for description in regimen_interactions.get(pair, ()):
+                interactions.add((pair, description))
+    return interactions
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobStore:
+    """Keeps each job as its own JSON file so status and results survive a worker restart."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, job_id, suffix=".json"):
+        return os.path.join(self.folder, f"{job_id}{suffix}")
+
+    def create(self, input_drug_names):
+        """Create and persist a new queued job."""
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "input_drug_names": input_drug_names,
+            "similar_drugs_info": {},
+            "interactions": [],
+            "incomplete_drugs": [],
+            "missing_drugs": [],
+            "message": None,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+        }
+        self.save(job)
+        return job
+
+    def save(self, job):
+        """Write the job atomically so readers never see a half-written file; returns the JSON written."""
+        job["updated_at"] = time.time()
+        data = json.dumps(job)
+        temp_path = self._path(job["job_id"], f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(data)
+        os.replace(temp_path, self._path(job["job_id"]))
+        return data
+
+    def load(self, job_id):
+        """Return the stored job, or None if it doesn't exist."""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def claim(self, job_id):
+        """Mark this process as the job's owner; False if a live process already owns it."""
+        claim_path = self._path(job_id, ".claim")
+        for _ in range(2):
+            try:
+                descriptor = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(descriptor, "w") as file:
+                    file.write(str(os.getpid()))
+                return True
+            except FileExistsError:
+                try:
+                    with open(claim_path) as file:
+                        owner = int(file.read() or 0)
+                    if owner != os.getpid() and _process_alive(owner):
+                        return False
+                    os.remove(claim_path)  # Left behind by a worker that died mid-job
+                except (OSError, ValueError):
+                    return False
+        return False
+
+    def release(self, job_id):
+        """Drop this process's claim on a finished job."""
+        try:
+            os.remove(self._path(job_id, ".claim"))
+        except FileNotFoundError:
+            pass
+
+    def unfinished(self):
+        """Yield the jobs that were queued or running when their worker stopped."""
+        for filename in os.listdir(self.folder):
+            if filename.endswith(".json"):
+                job = self.load(filename[:-len(".json")])
+                if job and job["status"] in ("queued", "running"):
+                    yield job
+
+
+def _process_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRunner:
+    """Runs jobs on a background thread pool, persisting partial results as they arrive."""
+
+    def __init__(self, store, pipeline, max_workers=4, save_interval=0.5):
+        self.store = store
+        self.pipeline = pipeline
+        self.save_interval = save_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="form-job")
+        self.changed = threading.Condition()
+        self.snapshots = {}  # job_id -> latest JSON of jobs running in this process
+
+    def submit(self, input_drug_names):
+        """Queue a new job and return it immediately."""
+        job = self.store.create(input_drug_names)
+        self._start(job)
+        return job
+
+    def resume_unfinished(self):
+        """Restart jobs left unfinished by a previous worker."""
+        for job in self.store.unfinished():
+            print(f"🔁 Resuming job {job['job_id']}")
+            self._start(job)
+
+    def _start(self, job):
+        if self.store.claim(job["job_id"]):
+            self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        last_save = 0
+
+        def publish(force=False):
+            nonlocal last_save
+            now = time.monotonic()
+            with self.changed:
+                if force or now - last_save >= self.save_interval:
+                    self.snapshots[job["job_id"]] = self.store.save(job)
+                    last_save = now
+                else:
+                    self.snapshots[job["job_id"]] = json.dumps(job)
+                self.changed.notify_all()
+
+        job.update(status="running", similar_drugs_info={}, interactions=[], incomplete_drugs=[], missing_drugs=[], message=None)
+        publish(force=True)
+        try:
+            self.pipeline(job, publish)
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["message"] = str(e)
+            print(f"❌ Job {job['job_id']} failed: {e}")
+        publish(force=True)
+        with self.changed:
+            self.snapshots.pop(job["job_id"], None)
+        self.store.release(job["job_id"])
+
+    def get(self, job_id):
+        """Return the freshest view of a job: in-memory if it runs here, otherwise from the store."""
+        with self.changed:
+            snapshot = self.snapshots.get(job_id)
+        return json.loads(snapshot) if snapshot else self.store.load(job_id)
+
+    def wait(self, job_id, since=0, timeout=0):
+        """Long-poll: return the job once it finishes or has more than `since` interactions."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in ("done", "failed") or len(job["interactions"]) > since or remaining <= 0:
+                return job
+            # Jobs may run in another worker process, so re-read the store at least twice a second
+            with self.changed:
+                self.changed.wait(min(remaining, self.save_interval))
@@ -0,0 +1,380 @@
+import atexit
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Directory shared by the processes of a multi-worker server. Each process writes its values to
+# a file of its own there, and render() merges every file, so any worker answers a scrape with
+# the totals of all of them. Unset, render() reports this process alone.
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR") or None
+METRICS_WRITE_INTERVAL = float(os.environ.get("METRICS_WRITE_INTERVAL", "1"))  # seconds
+ARCHIVE_FILE = "archive.json"
+
+_registry = []
+_registry_lock = threading.Lock()
+_write_lock = threading.Lock()
+_process_file = None
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode="sum"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # How a gauge's per-process values merge: "sum", "max", "min" or "mean". Counters and
+        # histograms always sum.
+        self.multiprocess_mode = multiprocess_mode
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def samples(self):
+        """List of [label values, value] pairs, as stored in a process file."""
+        with self._lock:
+            return [[list(labelvalues), value] for labelvalues, value in self._values.items()]
+
+    def snapshot(self):
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames),
+                "mode": self.multiprocess_mode, "samples": self.samples()}
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination."""
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, one series per label combination."""
+    type = "gauge"
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class _Timer:
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labelvalues):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+class Histogram(_Metric):
+    """Latency histogram with cumulative buckets, one series per label combination."""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *labelvalues):
+        """Context manager (or decorator) observing the elapsed wall time."""
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            return [[list(labelvalues), [list(counts), total]] for labelvalues, (counts, total) in self._values.items()]
+
+    def snapshot(self):
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+class FunctionMetric(_Metric):
+    """Metric read from a callback at scrape time, so the hot path pays nothing for it.
+
+    The callback returns a number, or a dict of label-value tuple -> number.
+    """
+
+    def __init__(self, name, documentation, function, labelnames=(), type="gauge", multiprocess_mode="sum"):
+        super().__init__(name, documentation, labelnames, multiprocess_mode)
+        self.function = function
+        self.type = type
+
+    def samples(self):
+        try:
+            values = self.function()
+        except Exception as e:
+            print(f"❌ Metric {self.name} unavailable: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [[list(labelvalues), value] for labelvalues, value in values.items()]
+
+
+def process_snapshot():
+    """Every registered metric of this process: name -> type, help, label names and samples."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def _write_json(filename, data):
+    # Written aside and renamed into place, so a scrape never reads half a file
+    temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(data, file)
+    os.replace(temporary, filename)
+
+
+def _read_json(filename):
+    try:
+        with open(filename) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None  # Removed (or replaced by a partial write of a crashed process) since listed
+
+
+def write_process_file():
+    """Save this process's values to its file in METRICS_MULTIPROC_DIR."""
+    if _process_file is None:
+        return
+    with _write_lock:
+        _write_json(_process_file, {"pid": os.getpid(), "metrics": process_snapshot()})
+
+
+def _write_periodically():
+    while True:
+        time.sleep(METRICS_WRITE_INTERVAL)
+        try:
+            write_process_file()
+        except Exception as e:
+            print(f"❌ Could not write metrics to {_process_file}: {e}")
+
+
+def _start_process_file():
+    """Give this process a file of its own and keep it current from a daemon thread."""
+    global _process_file
+    # The start time keeps a later process reusing this PID from taking over the file
+    _process_file = os.path.join(METRICS_MULTIPROC_DIR, f"{os.getpid()}-{time.time_ns()}.json")
+    threading.Thread(target=_write_periodically, name="metrics-writer", daemon=True).start()
+
+
+def _after_fork_in_child():
+    """A forked child starts from zero: its parent keeps reporting the values it inherited."""
+    global _registry_lock, _write_lock
+    # Locks held by another thread at fork time would never be released in the child
+    _registry_lock, _write_lock = threading.Lock(), threading.Lock()
+    for metric in _registry:
+        metric._lock = threading.Lock()
+        metric._values.clear()
+    _start_process_file()
+
+
+if METRICS_MULTIPROC_DIR:
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    _start_process_file()
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+    atexit.register(write_process_file)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_process_files(directory):
+    """(snapshot, alive) for every process file in directory, then the archive of dead ones."""
+    entries = []
+    for filename in sorted(glob.glob(os.path.join(directory, "*-*.json"))):
+        data = _read_json(filename)
+        if data is not None:
+            entries.append((os.path.basename(filename), data["metrics"], _pid_alive(data["pid"])))
+    # Read after the process files: a file compacted meanwhile is then already listed as merged
+    archive = _read_json(os.path.join(directory, ARCHIVE_FILE)) or {"merged": [], "metrics": {}}
+    merged = set(archive["merged"])
+    return [(snapshot, alive) for basename, snapshot, alive in entries if basename not in merged] + [(archive["metrics"], False)]
+
+
+def merge(snapshots):
+    """Merge (snapshot, alive) pairs into one snapshot.
+
+    Counters and histograms are summed over every process, dead ones included, so they never go
+    backwards when a worker is replaced. Gauges describe the present, so only live processes count,
+    combined by the metric's multiprocess_mode.
+    """
+    families, gauge_values = {}, {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            family = families.setdefault(name, dict(metric, samples={}))
+            if metric["type"] == "gauge":
+                if alive:
+                    for labelvalues, value in metric["samples"]:
+                        gauge_values.setdefault((name, tuple(labelvalues)), []).append(value)
+                continue
+            for labelvalues, value in metric["samples"]:
+                key = tuple(labelvalues)
+                if metric["type"] == "histogram":
+                    counts, total = family["samples"].get(key, ([0] * len(value[0]), 0.0))
+                    family["samples"][key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                else:
+                    family["samples"][key] = family["samples"].get(key, 0) + value
+    for (name, key), values in gauge_values.items():
+        family = families[name]
+        combine = {"sum": sum, "max": max, "min": min, "mean": lambda values: sum(values) / len(values)}[family["mode"]]
+        family["samples"][key] = combine(values)
+    for family in families.values():
+        family["samples"] = [[list(key), value] for key, value in family["samples"].items()]
+    return families
+
+
+def mark_process_dead(pid, directory=None):
+    """Fold an exited process's counters and histograms into the archive and drop its file.
+
+    Call it from the process manager once a worker has exited (gunicorn's child_exit hook).
+    Without it the dead worker's file stays and is merged on every scrape; its gauges are
+    ignored either way.
+    """
+    directory = directory or METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    archive_file = os.path.join(directory, ARCHIVE_FILE)
+    for filename in glob.glob(os.path.join(directory, f"{pid}-*.json")):
+        data = _read_json(filename)
+        archive = _read_json(archive_file) or {"merged": [], "metrics": {}}
+        if data is not None:
+            metrics = merge([(archive["metrics"], False), (data["metrics"], False)])
+            archive["metrics"] = {name: metric for name, metric in metrics.items() if metric["type"] != "gauge"}
+        # Names already removed can no longer be read alongside the archive, so forget them
+        merged = [name for name in archive["merged"] if os.path.exists(os.path.join(directory, name))]
+        _write_json(archive_file, {"merged": merged + [os.path.basename(filename)], "metrics": archive["metrics"]})
+        os.remove(filename)
+
+
+def _render_metric(name, metric):
+    lines = [f"# HELP {name} {metric['help']}", f"# TYPE {name} {metric['type']}"]
+    labelnames = metric["labelnames"]
+    for labelvalues, value in metric["samples"]:
+        if metric["type"] != "histogram":
+            lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+            continue
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(metric["buckets"] + [float("inf")], counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, labelvalues, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, labelvalues)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, labelvalues)} {cumulative}")
+    return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format.
+
+    With METRICS_MULTIPROC_DIR set this process saves its values first, then the files of every
+    process are merged, so whichever worker answers the scrape reports the whole server.
+    """
+    if METRICS_MULTIPROC_DIR:
+        write_process_file()
+        snapshots = read_process_files(METRICS_MULTIPROC_DIR)
+    else:
+        snapshots = [(process_snapshot(), True)]
+    lines = []
+    for name, metric in merge(snapshots).items():
+        lines.extend(_render_metric(name, metric))
+    return "\n".join(lines) + "\n"
+
+
+def cache_metrics(prefix, caches):
+    """Register hit/miss counters, size and hit ratio for a dict of name -> object with stats()."""
+    def read(field):
+        return lambda: {(name,): cache.stats()[field] for name, cache in caches.items()}
+    FunctionMetric(f"{prefix}_cache_hits_total", "Cache lookups that found an entry.", read("hits"), ["cache"], type="counter")
+    FunctionMetric(f"{prefix}_cache_misses_total", "Cache lookups that found nothing.", read("misses"), ["cache"], type="counter")
+    FunctionMetric(f"{prefix}_cache_size", "Entries currently held by the cache.", read("size"), ["cache"])
+    # Each worker has its own cache, so the merged ratio is the workers' mean
+    FunctionMetric(f"{prefix}_cache_hit_ratio", "Hits over lookups since start.", read("hit_ratio"), ["cache"],
+                   multiprocess_mode="mean")
+
+
+# Upstream HTTP calls (see Form/upstream.py)
+UPSTREAM_REQUEST_SECONDS = Histogram("upstream_request_seconds", "Latency of upstream HTTP calls, retries included.", ["upstream", "outcome"])
+
+# MongoDB commands, counted by a pymongo command listener
+MONGO_COMMANDS = Counter("mongo_commands_total", "MongoDB commands issued.", ["command", "status"])
+MONGO_COMMAND_SECONDS = Histogram("mongo_command_seconds", "MongoDB command latency.", ["command"])
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo CommandListener recording per-command counts and latencies."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.inc(event.command_name, "ok")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMANDS.inc(event.command_name, "failed")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
@@ -0,0 +1,164 @@
+import cProfile
+import functools
+import hmac
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import make_response, request
+
+from Form.scheduler import run_inline
+
+# Profiling is off unless an admin token is configured; requests opt in with it
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_FOLDER = os.path.join("Drug_data", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))  # seconds
+PROFILE_TOP_N = 30
+PROFILE_MODES = ("cprofile", "sampling")
+
+# Only one request is profiled at a time; Python allows a single active profiler
+_profile_lock = threading.Lock()
+
+
+def authorized():
+    """True if the request carries the admin profiling token in its X-Profile-Token header.
+
+    Never taken from the query string, where it would end up in access logs, proxies and history.
+    """
+    token = request.headers.get("X-Profile-Token", "")
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def requested_mode():
+    """Profiling mode asked for by an authorised request (X-Profile header or ?profile=), else None."""
+    mode = request.headers.get("X-Profile") or request.args.get("profile")
+    if not mode or not authorized():
+        return None
+    return mode if mode in PROFILE_MODES else "cprofile"
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into collapsed flame-graph stacks."""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        """Collapsed stacks plus the functions present in the most samples (inclusive time)."""
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            for label in set(stack.split(";")):
+                inclusive[label] += count
+        total = sum(self.stacks.values())
+        return {
+            "samples": total,
+            "interval": self.interval,
+            "top_functions": [{"function": label, "samples": count, "fraction": count / total}
+                              for label, count in inclusive.most_common(PROFILE_TOP_N)],
+            "collapsed_stacks": [f"{stack} {count}" for stack, count in self.stacks.most_common()],
+        }
+
+
+def _cprofile_summary(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+        rows.append({
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls": calls,
+            "total_time": total_time,
+            "cumulative_time": cumulative_time,
+        })
+    rows.sort(key=lambda row: row["cumulative_time"], reverse=True)
+    return {"top_functions": rows[:PROFILE_TOP_N]}
+
+
+def save_profile(profile_id, profile, profiler=None):
+    """Store the profile as JSON (and raw .pstats for cProfile runs) under PROFILE_FOLDER."""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    with open(os.path.join(PROFILE_FOLDER, f"{profile_id}.json"), "w", encoding="utf-8") as file:
+        json.dump(profile, file)
+    if profiler is not None:
+        profiler.dump_stats(os.path.join(PROFILE_FOLDER, f"{profile_id}.pstats"))
+
+
+def load_profile(profile_id):
+    """Return a stored profile, or None."""
+    if not profile_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(PROFILE_FOLDER, f"{profile_id}.json"), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def profiled(view):
+    """Decorator letting an admin profile a single call of a Flask view.
+
+    Scheduled work runs inline while profiling, so the profile covers the whole pipeline
+    in the request thread. The response carries X-Profile-Id; the profile itself is stored.
+    Requests that don't ask pay only a check of PROFILE_TOKEN.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not PROFILE_TOKEN:
+            return view(*args, **kwargs)
+        mode = requested_mode()
+        if mode is None or not _profile_lock.acquire(blocking=False):
+            return view(*args, **kwargs)
+        try:
+            profile_id = uuid.uuid4().hex
+            started = time.perf_counter()
+            profiler = None
+            with run_inline():
+                if mode == "sampling":
+                    with StackSampler(threading.get_ident()) as sampler:
+                        response = make_response(view(*args, **kwargs))
+                    profile = sampler.summary()
+                else:
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                    try:
+                        response = make_response(view(*args, **kwargs))
+                    finally:
+                        profiler.disable()
+                    profile = _cprofile_summary(profiler)
+            profile.update(profile_id=profile_id, mode=mode, path=request.path, wall_time=time.perf_counter() - started)
+            save_profile(profile_id, profile, profiler)
+        finally:
+            _profile_lock.release()
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+    return wrapper
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "drug_checker_rate_limits.sqlite3"))
+
+
+class TokenBucket:
+    """Token bucket kept in a local SQLite file, so every worker process on the host shares one budget.
+
+    `rate` tokens are added per second up to `burst`; each upstream request takes one.
+    """
+
+    def __init__(self, name, rate, burst=None, path=RATE_LIMIT_DB):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+
+    def _connect(self):
+        # A fresh connection per call keeps this safe across threads and forked workers
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _take(self):
+        """Take one token if available; otherwise return the seconds until one will be."""
+        connection = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so read-refill-write is atomic across processes
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            connection.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)", (self.name, tokens, now))
+            connection.execute("COMMIT")
+            return wait
+        finally:
+            connection.close()
+
+    def acquire(self, timeout=None):
+        """Block until a token is available; False if that would take longer than timeout seconds."""
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return True
+            if give_up_at is not None and time.monotonic() + wait > give_up_at:
+                return False
+            time.sleep(wait)
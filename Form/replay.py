@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+# off: always go to the network
+# record: go to the network and archive every answer
+# record-missing: replay archived answers, fetch and archive the rest
+# replay: replay only; a request missing from the archive raises ReplayMiss
+# fallback: go to the network and archive answers, replaying them while an upstream is unavailable
+UPSTREAM_REPLAY_MODE = os.environ.get("UPSTREAM_REPLAY_MODE", "off")
+UPSTREAM_REPLAY_ARCHIVE = os.environ.get("UPSTREAM_REPLAY_ARCHIVE", os.path.join("Drug_data", "upstream_archive.sqlite3"))
+REPLAY_MODES = ("off", "record", "record-missing", "replay", "fallback")
+# Only answers that describe the upstream's data are archived, never outages or throttling
+ARCHIVED_STATUS = set(range(200, 500)) - {408, 429}
+ARCHIVED_HEADERS = ("content-type",)
+
+
+class ReplayMiss(Exception):
+    """Raised in strict replay mode for a request the archive has no answer for."""
+
+
+def _canonical_value(value):
+    # PubChem's SDQ takes a JSON document as a query parameter; key order and spacing don't matter
+    if value[:1] in ("{", "["):
+        try:
+            return json.dumps(json.loads(value), sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            pass
+    return value
+
+
+def request_key(method, url):
+    """Normalized form of a request: upper-case method, lower-case host, no default port,
+    canonically quoted path, and query parameters sorted (JSON values canonicalized)."""
+    parts = urlsplit(str(url))
+    host = (parts.hostname or "").lower()
+    default_port = {"http": 80, "https": 443}.get(parts.scheme.lower())
+    if parts.port and parts.port != default_port:
+        host = f"{host}:{parts.port}"
+    path = quote(unquote(parts.path) or "/", safe="/")
+    query = urlencode(sorted((name, _canonical_value(value)) for name, value in parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {urlunsplit((parts.scheme.lower(), host, path, query, ''))}"
+
+
+class ResponseArchive:
+    """Upstream answers kept in a local SQLite file, keyed by normalized request, bodies zlib-compressed.
+
+    Every worker process can read and write the same archive.
+    """
+
+    def __init__(self, path=UPSTREAM_REPLAY_ARCHIVE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")  # Readers don't block the recording worker
+            connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, recorded_at REAL)")
+        finally:
+            connection.close()
+
+    def _connect(self):
+        # A fresh connection per call keeps this safe across threads and forked workers
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key, request=None):
+        """The archived response for a request key, or None."""
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT status, headers, body, recorded_at FROM responses WHERE key = ?", (key,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        status, headers, body, recorded_at = row
+        headers = dict(json.loads(headers), **{"X-Upstream-Replay": "1", "X-Upstream-Recorded-At": str(recorded_at)})
+        return httpx.Response(status, headers=headers, content=zlib.decompress(body), request=request)
+
+    def put(self, key, response):
+        """Archive a response that has been read."""
+        headers = {name: response.headers[name] for name in ARCHIVED_HEADERS if name in response.headers}
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO responses (key, status, headers, body, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                                   (key, response.status_code, json.dumps(headers), zlib.compress(response.content), time.time()))
+        finally:
+            connection.close()
+
+    def __len__(self):
+        connection = self._connect()
+        try:
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        finally:
+            connection.close()
+
+
+class RecordReplayTransport(httpx.BaseTransport):
+    """httpx transport that records upstream answers to a ResponseArchive and replays them, per `mode`."""
+
+    def __init__(self, archive, mode, transport=None):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown replay mode {mode!r}; expected one of {', '.join(REPLAY_MODES)}")
+        self.archive = archive
+        self.mode = mode
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        key = request_key(request.method, request.url)
+        if self.mode in ("replay", "record-missing"):
+            response = self.archive.get(key, request)
+            if response is not None:
+                return response
+            if self.mode == "replay":
+                raise ReplayMiss(f"No archived response for {key}")
+        response = self.transport.handle_request(request)
+        if self.mode != "off" and response.status_code in ARCHIVED_STATUS:
+            response.read()
+            self.archive.put(key, response)
+        return response
+
+    def fallback(self, url, params=None):
+        """Archived answer for a GET the upstream couldn't serve (fallback mode only), or None."""
+        if self.mode != "fallback":
+            return None
+        request = httpx.Request("GET", url, params=params)
+        return self.archive.get(request_key("GET", request.url), request)
+
+    def close(self):
+        self.transport.close()
+
+
+def replay_transport(mode=UPSTREAM_REPLAY_MODE, path=UPSTREAM_REPLAY_ARCHIVE):
+    """The configured record/replay transport, or None when replay is off."""
+    return None if mode == "off" else RecordReplayTransport(ResponseArchive(path), mode)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping with hit/miss counters."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def normalize_regimen(drug_names):
+    """Order-independent form of a regimen: its names sorted, repeats kept.
+
+    A repeated drug changes the results (it adds its own combinations), so "a a b" and
+    "a b" are different regimens. Case is kept, since the pipelines match drug names
+    case-sensitively.
+    """
+    return sorted(drug_name.strip() for drug_name in drug_names if drug_name.strip())
+
+
+class ResultCache:
+    """Whole-regimen result cache: an in-process LRU in front of an optional shared MongoDB tier.
+
+    Keys include the data-snapshot version, so entries from older data are never served;
+    the local tier is also dropped as soon as a new version is seen.
+    """
+
+    def __init__(self, namespace, max_size=1024, shared_collection=None, ttl=None):
+        self.namespace = namespace
+        self.local = LRUCache(max_size)
+        self.shared_collection = shared_collection
+        self.ttl = ttl
+        self.shared_hits = 0
+        self._version = None
+
+    def key(self, drug_names, version):
+        """Stable cache key for a regimen at a data version."""
+        payload = json.dumps([self.namespace, normalize_regimen(drug_names), version])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._version = version
+            self.local.clear()
+
+    def get(self, drug_names, version):
+        """Return the cached value for a regimen, or None."""
+        self._check_version(version)
+        key = self.key(drug_names, version)
+        entry = self.local.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if self.ttl is None or time.time() - stored_at < self.ttl:
+                return value
+        if self.shared_collection is not None:
+            try:
+                document = self.shared_collection.find_one({"_id": key})
+            except Exception as e:
+                print(f"❌ Shared result cache unavailable: {e}")
+                document = None
+            if document and (self.ttl is None or time.time() - document["stored_at"] < self.ttl):
+                self.shared_hits += 1
+                self.local.set(key, (document["stored_at"], document["value"]))
+                return document["value"]
+        return None
+
+    def set(self, drug_names, version, value):
+        """Store a JSON-serialisable value for a regimen."""
+        self._check_version(version)
+        key = self.key(drug_names, version)
+        stored_at = time.time()
+        self.local.set(key, (stored_at, value))
+        if self.shared_collection is not None:
+            try:
+                self.shared_collection.replace_one({"_id": key}, {"_id": key, "stored_at": stored_at, "value": value}, upsert=True)
+            except Exception as e:
+                print(f"❌ Shared result cache unavailable: {e}")
+        return key
+
+    def stats(self):
+        """Return local-tier counters plus shared-tier hits."""
+        return dict(self.local.stats(), shared_hits=self.shared_hits)
+
+
+class PairMemo:
+    """Process-wide memo of canonical drug pair -> interaction results.
+
+    Entries are keyed by the version of each drug's data as well, so new data for one drug
+    only retires the entries involving it; outdated entries age out of the LRU.
+    """
+
+    def __init__(self, max_size=100000):
+        self.cache = LRUCache(max_size)
+
+    @staticmethod
+    def _key(drugs, versions):
+        drugs = tuple(sorted(drugs))
+        if not all(drug in versions for drug in drugs):
+            return None
+        return drugs, tuple(versions[drug] for drug in drugs)
+
+    def get(self, drugs, versions):
+        """Return a fresh set of the memoized results for the drugs, or None.
+
+        `versions` maps drugs to the current version of their data; drugs missing from it never hit.
+        """
+        key = self._key(drugs, versions)
+        results = None if key is None else self.cache.get(key)
+        return None if results is None else set(results)
+
+    def set(self, drugs, versions, results):
+        """Memoize results computed from the given versions of the drugs' data."""
+        key = self._key(drugs, versions)
+        if key is not None:
+            self.cache.set(key, frozenset(results))
+
+    def stats(self):
+        return self.cache.stats()
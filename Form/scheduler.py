@@ -0,0 +1,180 @@
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+
+from Form.deadline import DeadlineExceeded, remaining
+
+INTERACTIVE, BATCH, MAINTENANCE = "interactive", "batch", "maintenance"
+PRIORITIES = (INTERACTIVE, BATCH, MAINTENANCE)
+
+_priority = contextvars.ContextVar("priority", default=INTERACTIVE)
+_inside_task = contextvars.ContextVar("inside_task", default=False)
+
+
+def current_priority():
+    """Priority class of the work running in this context (interactive unless set)."""
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(name):
+    """Run the enclosed block, and everything it schedules, under the given priority class."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextlib.contextmanager
+def run_inline():
+    """Run scheduled calls made in the enclosed block inline, in the calling thread."""
+    token = _inside_task.set(True)
+    try:
+        yield
+    finally:
+        _inside_task.reset(token)
+
+
+class _Queue:
+    def __init__(self, weight, limit):
+        self.weight = weight
+        self.limit = limit  # most tasks of this class allowed to run at once
+        self.tasks = deque()
+        self.running = 0
+        self.credit = 0
+        self.submitted = 0
+        self.completed = 0
+        self.waits = deque(maxlen=1024)  # recent queue wait times, seconds
+
+
+class PriorityScheduler:
+    """Runs upstream fetches and heavy computations on one worker pool with per-class queues.
+
+    Eligible queues are served by smooth weighted round robin, so interactive work gets most
+    turns without starving background work. Per-class concurrency limits keep batch and
+    maintenance work from occupying every worker.
+    """
+
+    def __init__(self, workers=8, weights=None, limits=None):
+        weights = weights or {INTERACTIVE: 8, BATCH: 2, MAINTENANCE: 1}
+        limits = limits or {}
+        self.workers = workers
+        self.queues = {name: _Queue(weights.get(name, 1), limits.get(name, workers)) for name in PRIORITIES}
+        self._condition = threading.Condition()
+        self._pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A forked child inherits the parent's queued tasks and the waiters of its workers, which
+        # would swallow every notify; it gets a fresh condition and empty queues instead
+        self._condition = threading.Condition()
+        for queue in self.queues.values():
+            queue.tasks.clear()
+            queue.running = 0
+
+    def _ensure_workers(self):
+        # Threads don't survive fork, so workers start lazily in whichever process submits first
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                for i in range(self.workers):
+                    threading.Thread(target=self._work, name=f"scheduler-{i}", daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn under the caller's priority class; returns a Future."""
+        self._ensure_workers()
+        future = Future()
+        queue = self.queues[current_priority()]
+        with self._condition:
+            queue.tasks.append((time.monotonic(), future, contextvars.copy_context(), fn, args, kwargs))
+            queue.submitted += 1
+            self._condition.notify()
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn through the scheduler and wait for it; nested calls from a task run inline.
+
+        Raises DeadlineExceeded if the caller's deadline passes first. Work still queued is
+        dropped then, while work already running finishes in the background.
+        """
+        if _inside_task.get():
+            return fn(*args, **kwargs)
+        if remaining() == 0:
+            raise DeadlineExceeded(f"No time left to run {fn.__name__}")
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=remaining())
+        except TimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(f"Deadline passed while waiting for {fn.__name__}")
+
+    def task(self, fn):
+        """Decorator routing every call of fn through run()."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.run(fn, *args, **kwargs)
+        return wrapper
+
+    def _next_queue(self):
+        eligible = [queue for queue in self.queues.values() if queue.tasks and queue.running < queue.limit]
+        if not eligible:
+            return None
+        for queue in eligible:
+            queue.credit += queue.weight
+        chosen = max(eligible, key=lambda queue: queue.credit)
+        chosen.credit -= sum(queue.weight for queue in eligible)
+        return chosen
+
+    def _work(self):
+        while True:
+            with self._condition:
+                queue = self._next_queue()
+                while queue is None:
+                    self._condition.wait()
+                    queue = self._next_queue()
+                enqueued_at, future, context, fn, args, kwargs = queue.tasks.popleft()
+                queue.running += 1
+                queue.waits.append(time.monotonic() - enqueued_at)
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(context.run(self._call, fn, args, kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    queue.running -= 1
+                    queue.completed += 1
+                    self._condition.notify_all()  # A class at its limit may be eligible again
+
+    @staticmethod
+    def _call(fn, args, kwargs):
+        _inside_task.set(True)
+        return fn(*args, **kwargs)
+
+    def stats(self):
+        """Queue depth, concurrency and recent wait-time percentiles for each priority class."""
+        with self._condition:
+            stats = {}
+            for name, queue in self.queues.items():
+                waits = sorted(queue.waits)
+                stats[name] = {
+                    "depth": len(queue.tasks),
+                    "running": queue.running,
+                    "limit": queue.limit,
+                    "weight": queue.weight,
+                    "submitted": queue.submitted,
+                    "completed": queue.completed,
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    "wait_max": waits[-1] if waits else 0.0,
+                }
+            return stats
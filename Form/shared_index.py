@@ -0,0 +1,294 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections.abc import Mapping
+
+import numpy as np
+
+# Index segments live here; point it at a tmpfs such as /dev/shm to keep them off disk
+SHARED_INDEX_FOLDER = os.environ.get("SHARED_INDEX_FOLDER", os.path.join("Drug_data", "shared_index"))
+
+# Segment layout (little-endian):
+#   header    magic, section count, metadata length
+#   sections  one entry per array: name, numpy dtype, byte offset, item count
+#   metadata  JSON
+#   arrays    raw array bytes, each starting at a 64-byte aligned offset
+SEGMENT_MAGIC = b"DDIINDX1"
+SEGMENT_HEADER = struct.Struct("<8sIQ")
+SEGMENT_SECTION = struct.Struct("<32s8sQQ")
+SEGMENT_ALIGNMENT = 64
+EMPTY_SLOT = -1
+
+
+def _layout(sections, metadata):
+    """(header bytes, [(offset, array)], total size) of a segment holding the given arrays."""
+    arrays = [(name, np.ascontiguousarray(array)) for name, array in sections.items()]
+    metadata = json.dumps(metadata or {}).encode("utf-8")
+    offset = SEGMENT_HEADER.size + SEGMENT_SECTION.size * len(arrays) + len(metadata)
+    header = [SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(arrays), len(metadata))]
+    placed = []
+    for name, array in arrays:
+        offset = -(-offset // SEGMENT_ALIGNMENT) * SEGMENT_ALIGNMENT
+        header.append(SEGMENT_SECTION.pack(name.encode("utf-8"), array.dtype.str.encode("ascii"), offset, array.size))
+        placed.append((offset, array))
+        offset += array.nbytes
+    header.append(metadata)
+    return b"".join(header), placed, offset
+
+
+def write_segment(filename, sections, metadata=None):
+    """Write named numpy arrays (and JSON metadata) to a segment file atomically."""
+    header, placed, size = _layout(sections, metadata)
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_filename, "wb") as file:
+        file.write(header)
+        for offset, array in placed:
+            file.write(b"\0" * (offset - file.tell()))
+            file.write(array.data)
+        file.write(b"\0" * (size - file.tell()))  # Empty trailing arrays still need their offset inside the file
+    os.replace(temp_filename, filename)
+
+
+class Segment:
+    """Named read-only arrays laid out by write_segment.
+
+    Opened from a file, the arrays are views of one read-only memory map: every process that
+    opens the same file shares its pages, so adding workers doesn't add copies.
+    """
+
+    def __init__(self, buffer, filename=None):
+        self.buffer = buffer
+        self.filename = filename
+        magic, count, metadata_length = SEGMENT_HEADER.unpack_from(buffer, 0)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"Not an index segment: {filename}")
+        self.arrays = {}
+        for i in range(count):
+            name, dtype, offset, size = SEGMENT_SECTION.unpack_from(buffer, SEGMENT_HEADER.size + i * SEGMENT_SECTION.size)
+            dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+            self.arrays[name.rstrip(b"\0").decode("utf-8")] = np.frombuffer(buffer, dtype=dtype, count=size, offset=offset)
+        start = SEGMENT_HEADER.size + count * SEGMENT_SECTION.size
+        self.metadata = json.loads(bytes(buffer[start:start + metadata_length]))
+
+    @classmethod
+    def open(cls, filename):
+        """Map a segment file. The mapping stays valid after the file is replaced or deleted."""
+        with open(filename, "rb") as file:
+            stat = os.fstat(file.fileno())
+            segment = cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), filename)
+        segment.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return segment
+
+    @classmethod
+    def from_sections(cls, sections, metadata=None):
+        """An in-memory segment, private to this process (for when the segment can't be written)."""
+        header, placed, size = _layout(sections, metadata)
+        buffer = bytearray(size)
+        buffer[:len(header)] = header
+        for offset, array in placed:
+            buffer[offset:offset + array.nbytes] = array.tobytes()
+        segment = cls(buffer)
+        segment.signature = None
+        for array in segment.arrays.values():
+            array.flags.writeable = False
+        return segment
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+def file_signature(filename):
+    """(inode, mtime, size) of a file, or None if it doesn't exist; a replaced or appended file gets a new one."""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def string_hash(data):
+    # Must not vary between processes, which rules out hash(); CRC-32 is the cheapest stable choice
+    return zlib.crc32(data)
+
+
+def pack_offsets(lengths):
+    """CSR-style offsets: item i spans offsets[i]:offsets[i + 1]."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(np.asarray(lengths, dtype=np.int64), out=offsets[1:])
+    return offsets
+
+
+def pack_strings(prefix, strings, hashed=True):
+    """Sections of a string table: UTF-8 bytes, their offsets and, if hashed, an open-addressing slot array.
+
+    The strings should be distinct; their positions become their IDs.
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    sections = {
+        f"{prefix}.offsets": pack_offsets([len(data) for data in encoded]),
+        f"{prefix}.bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+    }
+    if hashed:
+        # Linear probing at a load factor of at most 1/2
+        size = 8
+        while size < 2 * len(encoded):
+            size *= 2
+        slots = [EMPTY_SLOT] * size
+        for string_id, data in enumerate(encoded):
+            slot = string_hash(data) & (size - 1)
+            while slots[slot] != EMPTY_SLOT:
+                slot = (slot + 1) & (size - 1)
+            slots[slot] = string_id
+        sections[f"{prefix}.slots"] = np.array(slots, dtype=np.int32)
+    return sections
+
+
+class StringTable:
+    """String table packed by pack_strings, read in place: no per-process dict or str objects."""
+
+    def __init__(self, segment, prefix):
+        # memoryviews index to plain ints, several times faster than numpy scalars
+        self._offsets = memoryview(segment[f"{prefix}.offsets"])
+        self._bytes = memoryview(segment[f"{prefix}.bytes"])
+        slots = segment.arrays.get(f"{prefix}.slots")
+        self._slots = None if slots is None else memoryview(slots)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, string_id):
+        return str(self._bytes[self._offsets[string_id]:self._offsets[string_id + 1]], "utf-8")
+
+    def __iter__(self):
+        for string_id in range(len(self)):
+            yield self[string_id]
+
+    def index(self, string):
+        """ID of the string, or -1 if the table doesn't hold it."""
+        data = string.encode("utf-8")
+        mask = len(self._slots) - 1
+        slot = string_hash(data) & mask
+        while True:
+            string_id = self._slots[slot]
+            if string_id == EMPTY_SLOT:
+                return -1
+            if self._bytes[self._offsets[string_id]:self._offsets[string_id + 1]] == data:
+                return string_id
+            slot = (slot + 1) & mask
+
+    def __contains__(self, string):
+        return isinstance(string, str) and self.index(string) >= 0
+
+
+def pack_string_lists(prefix, mapping):
+    """Sections of a str -> list of str mapping: hashed keys, CSR offsets and the concatenated values."""
+    keys = list(mapping)
+    sections = pack_strings(f"{prefix}.keys", keys)
+    sections.update(pack_strings(f"{prefix}.values", [value for key in keys for value in mapping[key]], hashed=False))
+    sections[f"{prefix}.indptr"] = pack_offsets([len(mapping[key]) for key in keys])
+    return sections
+
+
+class StringListMap(Mapping):
+    """Read-only str -> list of str mapping packed by pack_string_lists."""
+
+    def __init__(self, segment, prefix):
+        self._keys = StringTable(segment, f"{prefix}.keys")
+        self._values = StringTable(segment, f"{prefix}.values")
+        self._indptr = memoryview(segment[f"{prefix}.indptr"])
+
+    def __getitem__(self, key):
+        key_id = self._keys.index(key) if isinstance(key, str) else -1
+        if key_id < 0:
+            raise KeyError(key)
+        return [self._values[i] for i in range(self._indptr[key_id], self._indptr[key_id + 1])]
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def pack_top_neighbors(prefix, chunks, k):
+    """Sections holding the k best-scoring columns of every row of a labelled score matrix.
+
+    `chunks` yields (row labels, column labels, 2-D score array) blocks of rows, so the matrix
+    never has to be in memory at once. As when sorting a row by descending score, the first
+    column (the row's own drug in a similarity matrix) is skipped; missing scores rank last.
+    """
+    rows, neighbors, columns = [], [], None
+    for labels, column_labels, scores in chunks:
+        if columns is None:
+            columns = [str(label) for label in column_labels]
+        scores = np.nan_to_num(np.asarray(scores, dtype=np.float64), nan=-np.inf)
+        take = min(k + 1, scores.shape[1])
+        if take < scores.shape[1]:
+            best = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        else:
+            best = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable")
+        top = np.full((scores.shape[0], k), EMPTY_SLOT, dtype=np.int32)
+        ranked = np.take_along_axis(best, order, axis=1)[:, 1:]
+        top[:, :ranked.shape[1]] = ranked
+        rows.extend(str(label) for label in labels)
+        neighbors.append(top)
+    sections = pack_strings(f"{prefix}.rows", rows)
+    sections.update(pack_strings(f"{prefix}.columns", columns or [], hashed=False))
+    sections[f"{prefix}.neighbors"] = np.concatenate(neighbors) if neighbors else np.zeros((0, k), dtype=np.int32)
+    return sections
+
+
+class TopNeighbors:
+    """Per-row best-scoring columns packed by pack_top_neighbors."""
+
+    def __init__(self, segment, prefix):
+        self.rows = StringTable(segment, f"{prefix}.rows")
+        self.columns = StringTable(segment, f"{prefix}.columns")
+        self.k = segment.metadata["k"]
+        self.neighbors = segment[f"{prefix}.neighbors"].reshape(len(self.rows), self.k)
+
+    def __contains__(self, label):
+        return label in self.rows
+
+    def top(self, label, n):
+        """Labels of the row's n best-scoring columns (at most k), best first; [] for an unknown row."""
+        row = self.rows.index(label) if isinstance(label, str) else -1
+        if row < 0:
+            return []
+        return [self.columns[column] for column in self.neighbors[row, :n].tolist() if column != EMPTY_SLOT]
+
+
+def derived_segment(source, kind, build, metadata=None):
+    """The segment build(source) derives from a data file, rebuilt only when the file changed since.
+
+    Processes share one segment file per source file and kind, so the first process to see
+    a change builds it and the rest just map it.
+    """
+    signature = list(file_signature(source) or ())
+    digest = hashlib.blake2b(os.path.abspath(source).encode("utf-8"), digest_size=4).hexdigest()
+    filename = os.path.join(SHARED_INDEX_FOLDER, f"{os.path.basename(source)}-{digest}.{kind}.idx")
+    metadata = dict(metadata or {}, source=signature)
+    try:
+        segment = Segment.open(filename)
+        if segment.metadata == metadata:
+            return segment
+    except (OSError, ValueError, struct.error):
+        pass
+    sections = build(source)
+    try:
+        write_segment(filename, sections, metadata)
+        return Segment.open(filename)
+    except OSError as e:
+        print(f"❌ Could not share index {filename}, keeping a private copy: {e}")
+        return Segment.from_sections(sections, metadata)
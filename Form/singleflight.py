@@ -0,0 +1,86 @@
+import datetime
+import os
+import socket
+import threading
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution whose result every caller shares."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn once per key at a time; callers arriving meanwhile wait for and share its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self):
+        """Number of keys currently being executed."""
+        with self._lock:
+            return len(self._calls)
+
+
+class MongoLease:
+    """Cross-process lease kept as a MongoDB document, so only one worker works on a key at a time."""
+
+    def __init__(self, collection, ttl=120):
+        self.collection = collection
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def acquire(self, key):
+        """Take the lease; False if another live holder has it."""
+        for _ in range(2):
+            now = datetime.datetime.now(datetime.timezone.utc)
+            try:
+                self.collection.insert_one({"_id": key, "owner": self.owner, "expires_at": now + datetime.timedelta(seconds=self.ttl)})
+                return True
+            except DuplicateKeyError:
+                # Drop a lease whose holder died without releasing it, then try once more
+                if not self.collection.delete_one({"_id": key, "expires_at": {"$lt": now}}).deleted_count:
+                    return False
+        return False
+
+    def release(self, key):
+        self.collection.delete_one({"_id": key, "owner": self.owner})
+
+    def wait(self, key, is_done, interval=0.25):
+        """Poll until is_done() or the lease is released/expired; returns is_done()."""
+        deadline = time.monotonic() + self.ttl
+        while time.monotonic() < deadline:
+            if is_done():
+                return True
+            if self.collection.find_one({"_id": key}) is None:
+                break
+            time.sleep(interval)
+        return is_done()
@@ -0,0 +1,252 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import httpx
+from flask import has_request_context, request
+
+# Fraction of requests traced; 0 keeps tracing off apart from requests sent with a sampled traceparent
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+# "jsonl:<path>" appends one span per line; "otlp:<url>" posts OTLP/HTTP JSON to a collector
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "jsonl:" + os.path.join("Drug_data", "traces.jsonl"))
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "drug-interaction-checker")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage of a traced request, with attributes and timestamped events."""
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.events = []
+        self.error = None
+        self.start = time.time()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, message, **attributes):
+        self.events.append((time.time(), message, attributes))
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "events": [{"time": at, "message": message, "attributes": attributes} for at, message, attributes in self.events],
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def event(self, message, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.finished = False
+
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header, or None."""
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+@contextlib.contextmanager
+def trace(name, traceparent=None, **attributes):
+    """Start a request's root span, sampled at TRACE_SAMPLE_RATE unless traceparent decides."""
+    incoming = parse_traceparent(traceparent)
+    if incoming is not None:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id, parent_id, sampled = None, None, TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        token = _current_span.set(None)
+        try:
+            yield NOOP_SPAN
+        finally:
+            _current_span.reset(token)
+        return
+    root = _Trace(trace_id or os.urandom(16).hex())
+    try:
+        with _open_span(root, name, parent_id, attributes) as span:
+            yield span
+    finally:
+        root.finished = True
+        exporter.submit(root.spans)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Child span of the current one; a no-op when the request isn't traced."""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    try:
+        with _open_span(parent.trace, name, parent.span_id, attributes) as child:
+            yield child
+    finally:
+        if parent.trace.finished:
+            # Background work that outlived its request is exported on its own
+            exporter.submit([child])
+
+
+@contextlib.contextmanager
+def _open_span(trace, name, parent_id, attributes):
+    current = Span(trace, name, parent_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.end = time.time()
+        trace.spans.append(current)
+        _current_span.reset(token)
+
+
+def traced(name):
+    """Decorator making each call the root span of a (sampled) trace, joining an incoming traceparent."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            incoming = request.headers.get("traceparent") if has_request_context() else None
+            with trace(name, traceparent=incoming):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The active span, or a no-op stand-in when the request isn't traced."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def event(message, **attributes):
+    """Record a status message on the active span; free when the request isn't traced."""
+    current = _current_span.get()
+    if current is not None:
+        current.event(message, **attributes)
+
+
+def traceparent():
+    """W3C traceparent header value for the active span, or None when not traced."""
+    current = _current_span.get()
+    return None if current is None else f"00-{current.trace.trace_id}-{current.span_id}-01"
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(spans):
+    """OTLP/HTTP JSON payload for a list of finished spans."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME})},
+        "scopeSpans": [{
+            "scope": {"name": "Form.tracing"},
+            "spans": [{
+                "traceId": span.trace.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int(span.end * 1e9)),
+                "attributes": _otlp_attributes(span.attributes),
+                "events": [{"timeUnixNano": str(int(at * 1e9)), "name": message, "attributes": _otlp_attributes(attributes)}
+                           for at, message, attributes in span.events],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """Writes finished spans from a background thread, so requests never wait on the export."""
+
+    def __init__(self, target):
+        self.kind, _, self.destination = target.partition(":")
+        self.queue = queue.Queue(maxsize=10000)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, spans):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Threads don't survive fork, so each worker starts its own export thread, with a
+                    # fresh queue: the inherited one still lists the parent's exporter as a waiter
+                    self._pid = os.getpid()
+                    self.queue = queue.Queue(maxsize=10000)
+                    threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            pass  # Drop traces rather than slow requests down
+
+    def _run(self):
+        while True:
+            spans = self.queue.get()
+            try:
+                self.export(spans)
+            except Exception as e:
+                print(f"❌ Trace export failed: {e}")
+
+    def export(self, spans):
+        if self.kind == "otlp":
+            httpx.post(self.destination, json=to_otlp(spans), timeout=5).raise_for_status()
+        else:
+            directory = os.path.dirname(self.destination)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.destination, "a", encoding="utf-8") as file:
+                for span in spans:
+                    file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+exporter = SpanExporter(TRACE_EXPORT)
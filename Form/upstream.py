@@ -0,0 +1,231 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import quote
+
+import httpx
+
+from Form.metrics import UPSTREAM_REQUEST_SECONDS, FunctionMetric
+from Form.rate_limit import TokenBucket
+from Form.replay import replay_transport
+
+PUBCHEM_BASE_URL = os.environ.get("PUBCHEM_BASE_URL", "https://pubchem.ncbi.nlm.nih.gov")
+CHEMBL_BASE_URL = os.environ.get("CHEMBL_BASE_URL", "https://www.ebi.ac.uk/chembl/api/data")
+
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "10"))  # seconds per attempt
+UPSTREAM_DEADLINE = float(os.environ.get("UPSTREAM_DEADLINE", "30"))  # seconds per call, retries included
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.environ.get("UPSTREAM_BACKOFF", "0.5"))  # base of the exponential backoff
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))  # consecutive failed calls that open the circuit
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", "30"))  # seconds before a trial call is let through
+UPSTREAM_HEDGE_AFTER = float(os.environ.get("UPSTREAM_HEDGE_AFTER", "0"))  # 0 disables request hedging
+DOWNLOAD_TIMEOUT = float(os.environ.get("UPSTREAM_DOWNLOAD_TIMEOUT", "60"))  # interaction tables can be large
+DOWNLOAD_DEADLINE = float(os.environ.get("UPSTREAM_DOWNLOAD_DEADLINE", "180"))
+# Requests per second shared by every worker on the host; PubChem asks for no more than 5 (0 disables the limit)
+PUBCHEM_RATE_LIMIT = float(os.environ.get("PUBCHEM_RATE_LIMIT", "5"))
+PUBCHEM_RATE_BURST = float(os.environ.get("PUBCHEM_RATE_BURST", "5"))
+CHEMBL_RATE_LIMIT = float(os.environ.get("CHEMBL_RATE_LIMIT", "10"))
+CHEMBL_RATE_BURST = float(os.environ.get("CHEMBL_RATE_BURST", "10"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream's circuit is open or every attempt within the deadline failed."""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, letting one trial call through every reset period."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        """True if a call may go out now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this caller probe, and hold everyone else off for another period
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class _Throttled(Exception):
+    pass
+
+
+class UpstreamClient:
+    """HTTP client for one upstream with per-call deadlines, jittered retries, a circuit breaker and optional hedging.
+
+    `transport` replaces httpx's network transport, e.g. with a Form.replay.RecordReplayTransport;
+    one with a fallback() method also answers calls the upstream can't serve.
+    """
+
+    def __init__(self, name, base_url, timeout=UPSTREAM_TIMEOUT, deadline=UPSTREAM_DEADLINE, retries=UPSTREAM_RETRIES,
+                 backoff=UPSTREAM_BACKOFF, hedge_after=UPSTREAM_HEDGE_AFTER, rate_limiter=None, transport=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self.rate_limiter = rate_limiter
+        self.breaker = CircuitBreaker()
+        self.transport = transport
+        self.client = httpx.Client(follow_redirects=True, transport=transport)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"{name}-hedge") if hedge_after else None
+
+    def url(self, path):
+        """Absolute URL for a path under this upstream's base URL."""
+        return path if path.startswith(("http://", "https://")) else f"{self.base_url}{path}"
+
+    def _send(self, url, params, timeout):
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(timeout=timeout):
+            raise _Throttled()
+        response = self.client.get(url, params=params, timeout=timeout)
+        if response.status_code in RETRYABLE_STATUS:
+            raise _RetryableStatus(response)
+        return response
+
+    def _send_hedged(self, url, params, timeout):
+        # Fire a second identical request if the first is slow, and take whichever answers first
+        first = self._hedge_pool.submit(self._send, url, params, timeout)
+        done, _ = wait([first], timeout=min(self.hedge_after, timeout))
+        if done:
+            return first.result()
+        second = self._hedge_pool.submit(self._send, url, params, timeout)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get(self, path, params=None, timeout=None, deadline=None):
+        """GET with retries inside the deadline; raises UpstreamUnavailable instead of hanging."""
+        start = time.perf_counter()
+        outcome = "unavailable"
+        try:
+            try:
+                response = self._get(path, params, timeout, deadline)
+                outcome = f"{response.status_code // 100}xx"
+            except UpstreamUnavailable:
+                response = self._fallback(path, params)
+                if response is None:
+                    raise
+                outcome = "fallback"
+            return response
+        finally:
+            UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, self.name, outcome)
+
+    def _fallback(self, path, params):
+        fallback = getattr(self.transport, "fallback", None)
+        return None if fallback is None else fallback(self.url(path), params)
+
+    def _get(self, path, params, timeout, deadline):
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"{self.name} circuit is open")
+        url = self.url(path)
+        timeout = timeout or self.timeout
+        give_up_at = time.monotonic() + (deadline or self.deadline)
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                send = self._send_hedged if self._hedge_pool else self._send
+                response = send(url, params, min(timeout, remaining))
+                self.breaker.record_success()
+                return response
+            except (httpx.TransportError, _RetryableStatus) as e:
+                error = e
+            except _Throttled:
+                # Our own pacing ran out of time; the upstream itself did nothing wrong
+                raise UpstreamUnavailable(f"{self.name} rate budget exhausted before the deadline")
+            if attempt < self.retries:
+                # Full jitter keeps retries from many workers from arriving in lockstep
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                time.sleep(max(0, min(delay, give_up_at - time.monotonic())))
+        self.breaker.record_failure()
+        raise UpstreamUnavailable(f"{self.name} request failed: {error or 'deadline exceeded'}")
+
+
+def rate_limiter(name, rate, burst):
+    """Host-wide token bucket for an upstream, or None when its limit is disabled."""
+    return TokenBucket(name, rate, burst) if rate > 0 else None
+
+
+# UPSTREAM_REPLAY_MODE / UPSTREAM_REPLAY_ARCHIVE (see Form/replay.py) record or replay both upstreams
+pubchem = UpstreamClient("pubchem", PUBCHEM_BASE_URL, rate_limiter=rate_limiter("pubchem", PUBCHEM_RATE_LIMIT, PUBCHEM_RATE_BURST),
+                         transport=replay_transport())
+chembl = UpstreamClient("chembl", CHEMBL_BASE_URL, rate_limiter=rate_limiter("chembl", CHEMBL_RATE_LIMIT, CHEMBL_RATE_BURST),
+                        transport=replay_transport())
+
+FunctionMetric("upstream_circuit_open", "1 while an upstream's circuit breaker is failing fast.",
+               lambda: {(client.name,): int(client.breaker.state == "open") for client in (pubchem, chembl)}, ["upstream"],
+               multiprocess_mode="max")
+
+
+def pubchem_ddi_csv_url(drug_name):
+    """PubChem SDQ URL that downloads a drug's DrugBank interaction table as CSV."""
+    return f"{PUBCHEM_BASE_URL}/sdq/sdqagent.cgi?infmt=json&outfmt=csv&query={{%22download%22:%22*%22,%22collection%22:%22drugbankddi%22,%22order%22:[%22cid2,asc%22],%22start%22:1,%22limit%22:10000000,%22downloadfilename%22:%22pubchem_name_%5E{drug_name}%24_drugbankddi%22,%22where%22:{{%22ands%22:[{{%22name%22:%22%5E{drug_name}%24%22}}]}}}}"
+
+
+def download_pubchem_ddi_csv(drug_name):
+    """Download a drug's DrugBank interaction table from PubChem; raises for HTTP errors."""
+    response = pubchem.get(pubchem_ddi_csv_url(drug_name), timeout=DOWNLOAD_TIMEOUT, deadline=DOWNLOAD_DEADLINE)
+    response.raise_for_status()
+    return response
+
+
+def pubchem_compound(name):
+    """Return (CID, synonyms) for the first PubChem compound matching a name, or (None, []) if none does."""
+    response = pubchem.get(f"/rest/pug/compound/name/{quote(name, safe='')}/cids/JSON")
+    if response.status_code == 404:
+        return None, []
+    response.raise_for_status()
+    cids = response.json().get("IdentifierList", {}).get("CID", [])
+    if not cids:
+        return None, []
+    response = pubchem.get(f"/rest/pug/compound/cid/{cids[0]}/synonyms/JSON")
+    if response.status_code == 404:
+        return cids[0], []
+    response.raise_for_status()
+    information = response.json().get("InformationList", {}).get("Information", [])
+    return cids[0], information[0].get("Synonym", []) if information else []
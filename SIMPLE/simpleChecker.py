@@ -4,19 +4,35 @@ import httpx
 import csv
 import os
 from flask import Blueprint, render_template
+from Form.profiling import profiled
+from Form.tracing import traced, span, current_span
+from Form.metrics import FunctionMetric, cache_metrics
+from Form.result_cache import ResultCache
+from Form.singleflight import SingleFlight
+from Form.upstream import UpstreamUnavailable, download_pubchem_ddi_csv
 
 simpleChecker = Blueprint('simpleChecker', __name__, static_folder='static', template_folder='templates')
 
 
 DRUG_DATA_FOLDER = "Drug_data"
 
+# This checker re-downloads on every miss, so cached results simply expire after a TTL
+SIMPLE_RESULT_TTL = int(os.environ.get("SIMPLE_RESULT_TTL", "3600"))
+SIMPLE_RESULT_CACHE_SIZE = int(os.environ.get("SIMPLE_RESULT_CACHE_SIZE", "1024"))
+SIMPLE_DATA_VERSION = "pubchem-live"
+
+result_cache = ResultCache("simple", max_size=SIMPLE_RESULT_CACHE_SIZE, ttl=SIMPLE_RESULT_TTL)
+
+# Concurrent requests for the same drug share one download instead of racing on its file
+fetch_flights = SingleFlight()
+
+FunctionMetric("simple_downloads_in_flight", "Drug downloads currently in progress.", lambda: fetch_flights.in_flight())
+cache_metrics("simple", {"result": result_cache})
+
 def fetch_drug_data(drug_name):
     """Fetch interaction data for a drug from PubChem API."""
-    url = f"https://pubchem.ncbi.nlm.nih.gov/sdq/sdqagent.cgi?infmt=json&outfmt=csv&query={{%22download%22:%22*%22,%22collection%22:%22drugbankddi%22,%22order%22:[%22cid2,asc%22],%22start%22:1,%22limit%22:10000000,%22downloadfilename%22:%22pubchem_name_%5E{drug_name}%24_drugbankddi%22,%22where%22:{{%22ands%22:[{{%22name%22:%22%5E{drug_name}%24%22}}]}}}}"
-
     try:
-        response = httpx.get(url)
-        response.raise_for_status()
+        response = download_pubchem_ddi_csv(drug_name)
         # filename = f"{drug_name}_response.csv"
         filename = os.path.join(DRUG_DATA_FOLDER, f"{drug_name}_response.csv")
 
@@ -27,16 +43,25 @@ def fetch_drug_data(drug_name):
 
     except httpx.HTTPStatusError as e:
         return f"HTTP error: {e}"
+    except UpstreamUnavailable as e:
+        # Any file saved by an earlier download is still read by the caller
+        return f"Upstream unavailable: {e}"
     except Exception as e:
         return f"Error: {e}"
 
-def search_interactions_for_drugs(drugs_to_check):
-    """Check interactions among multiple drugs."""
+def search_interactions_for_drugs(drugs_to_check, failed=None):
+    """Check interactions among multiple drugs.
+
+    Drugs whose download failed or left no file are added to the `failed` set, if given.
+    """
     interactions = []
 
     # Fetch data for each drug
     for drug_name in drugs_to_check:
-        fetch_drug_data(drug_name)
+        with span("fetch_drug_data", drug=drug_name):
+            result = fetch_flights.do(drug_name, fetch_drug_data, drug_name)
+        if failed is not None and result != os.path.join(DRUG_DATA_FOLDER, f"{drug_name}_response.csv"):
+            failed.add(drug_name)  # fetch_drug_data returned an error message instead of the file name
 
     # Read saved files and search for interactions
     for drug_name in drugs_to_check:
@@ -51,6 +76,8 @@ def search_interactions_for_drugs(drugs_to_check):
                     drug1, drug2, interaction = row[3], row[5], row[6]
                     if drug1 in drugs_to_check and drug2 in drugs_to_check:
                         interactions.append(f"{drug1} - {drug2}: {interaction}")
+        elif failed is not None:
+            failed.add(drug_name)
     
     return interactions if interactions else ["No interactions found."]
 
@@ -59,6 +86,8 @@ def index():
     return render_template("simpleChecker.html")
 
 @simpleChecker .route("/check_interaction", methods=["POST"])
+@profiled
+@traced("simple.check_interaction")
 def check_interaction():
     """Handle AJAX requests for drug interaction checks."""
     drugs = request.json.get("drugs")
@@ -66,6 +95,12 @@ def check_interaction():
         return jsonify({"error": "No drugs provided."}), 400
 
     drugs_list = [drug.strip() for drug in drugs.split()]
-    results = search_interactions_for_drugs(drugs_list)
+    results = result_cache.get(drugs_list, SIMPLE_DATA_VERSION)
+    current_span().set(drug_count=len(drugs_list), cache_hit=results is not None)
+    if results is None:
+        failed = set()
+        results = search_interactions_for_drugs(drugs_list, failed)
+        if not failed:  # A failed download is retried next time rather than cached
+            result_cache.set(drugs_list, SIMPLE_DATA_VERSION, results)
     return jsonify({"interactions": results})
 
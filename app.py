@@ -1,6 +1,7 @@
-from flask import Flask , render_template
+from flask import Flask , render_template, Response
 from Form.form import form
 from SIMPLE.simpleChecker import simpleChecker 
+from Form import metrics
 
 app =  Flask(__name__)
 
@@ -11,5 +12,11 @@ app.register_blueprint(simpleChecker , url_prefix='/simpleChecker')
 def test():
     return render_template("main.html")
 
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint; under gunicorn it reports every worker merged (see metrics.render)."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
+    # Development server; in production run the pre-forked workers with `gunicorn -c gunicorn.conf.py app:app`
     app.run(debug=True)
@@ -0,0 +1,134 @@
+"""Synthetic drugs, interaction documents and similarity tables for the benchmarks.
+
+Everything is derived from a seed, so two runs (or two commits) see identical data.
+"""
+import csv
+import datetime
+import itertools
+import random
+
+import numpy as np
+import pandas as pd
+
+INTERACTION_COLUMNS = ["cid", "cid2", "dbid", "name", "dbid2", "name2", "descr"]
+SIMILAR_DRUG_COLUMNS = ["Input Drug Name", "Similar Drug 1", "Similar Drug 2", "Similar Drug 3"]
+DRUG_ID_COLUMNS = ["Drug Name", "PubChem CID", "DrugBank ID", "ChEMBL ID"]
+DESCRIPTIONS = [
+    "The risk or severity of adverse effects can be increased when {0} is combined with {1}.",
+    "{0} may increase the anticoagulant activities of {1}.",
+    "The metabolism of {1} can be decreased when combined with {0}.",
+    "The serum concentration of {1} can be increased when it is combined with {0}.",
+    "{0} may decrease the antihypertensive activities of {1}.",
+]
+
+
+def drug_names(count):
+    return [f"drug{i:05d}" for i in range(count)]
+
+
+def drugbank_id(index):
+    return f"DB{index:05d}"
+
+
+class World:
+    """A synthetic interaction dataset: drug names, interaction edges and similar-drug groups.
+
+    Interaction partners are drawn with Zipf-like popularity, so a few drugs interact with
+    thousands of others while most have a handful, as in DrugBank.
+    """
+
+    def __init__(self, count, seed=0, mean_degree=12, zipf_exponent=1.1):
+        rng = random.Random(seed)
+        self.count = count
+        self.names = drug_names(count)
+        popularity = list(itertools.accumulate(1 / (rank + 1) ** zipf_exponent for rank in range(count)))
+        order = list(range(count))
+        rng.shuffle(order)  # Popular drugs are spread over the name range
+        self.ranked = order  # drug indexes, most popular first
+        self.popularity = popularity
+        self.partners = [set() for _ in range(count)]
+        for _ in range(count * mean_degree // 2):
+            i, j = (order[rank] for rank in rng.choices(range(count), cum_weights=popularity, k=2))
+            if i != j:
+                self.partners[i].add(j)
+                self.partners[j].add(i)
+        # Similar drugs are close in "chemical space", which here is the index
+        self.similar = [
+            [self.names[(i + offset) % count] for offset in rng.sample(range(1, 50), 3)] for i in range(count)
+        ]
+        self.fetched_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def interaction_csv(self, index):
+        """The drug's interaction table in PubChem's drugbankddi CSV layout."""
+        lines = [",".join(INTERACTION_COLUMNS)]
+        name = self.names[index]
+        for partner in sorted(self.partners[index]):
+            description = DESCRIPTIONS[(index + partner) % len(DESCRIPTIONS)].format(name, self.names[partner])
+            lines.append(f'{index + 1},{partner + 1},{drugbank_id(index)},{name},{drugbank_id(partner)},{self.names[partner]},"{description}"')
+        return "\n".join(lines)
+
+    def document(self, index):
+        """The MongoDB document Form stores for the drug."""
+        name = self.names[index]
+        return {
+            "drug_name": name,
+            "file_name": f"{name}_response.csv",
+            "content": self.interaction_csv(index),
+            "fetched_at": self.fetched_at,
+        }
+
+    def documents(self):
+        for index in range(self.count):
+            yield self.document(index)
+
+    def lookup(self, identifier):
+        """Index of the drug with this name, DrugBank ID or ChEMBL ID, or None if it isn't part of the dataset."""
+        for prefix in ("drug", "DB", "CHEMBL"):
+            if identifier.startswith(prefix) and identifier[len(prefix):].isdigit():
+                index = int(identifier[len(prefix):]) - (prefix == "CHEMBL")
+                return index if 0 <= index < self.count else None
+        return None
+
+    def csv_for(self, drug_name):
+        """Interaction CSV for a drug name, or None if it isn't part of the dataset."""
+        index = self.lookup(drug_name)
+        return None if index is None else self.interaction_csv(index)
+
+    def write_similar_drugs(self, filename="SAME_DRUG.csv", indexes=None):
+        """Write SAME_DRUG.csv for every drug, or only for the given drug indexes."""
+        with open(filename, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(SIMILAR_DRUG_COLUMNS)
+            for index in range(self.count) if indexes is None else indexes:
+                writer.writerow([self.names[index]] + self.similar[index])
+
+    def write_drug_ids(self, filename="drug_names_ids.csv"):
+        with open(filename, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(DRUG_ID_COLUMNS)
+            for index, name in enumerate(self.names):
+                writer.writerow([name, index + 1, drugbank_id(index), f"CHEMBL{index + 1}"])
+
+    def similarity_matrix(self, seed=0):
+        """Dense DrugBank ID x DrugBank ID Tanimoto-like matrix (count**2 floats, so keep count modest)."""
+        rng = np.random.default_rng(seed)
+        scores = rng.beta(2, 8, size=(self.count, self.count)).astype(np.float32)
+        scores = (scores + scores.T) / 2
+        np.fill_diagonal(scores, 1.0)
+        ids = [drugbank_id(index) for index in range(self.count)]
+        return pd.DataFrame(scores, index=ids, columns=ids)
+
+    def popular_drugs(self, rng, count, indexes=None):
+        """`count` distinct drug indexes drawn by popularity, optionally restricted to a set of indexes."""
+        chosen = set()
+        for _ in range(count * 20):
+            index = self.ranked[rng.choices(range(self.count), cum_weights=self.popularity)[0]]
+            if indexes is None or index in indexes:
+                chosen.add(index)
+                if len(chosen) == count:
+                    break
+        return list(chosen)
+
+    def regimen(self, size, seed=0):
+        """A reproducible regimen of `size` distinct drugs."""
+        return random.Random(f"{seed}-{size}").sample(self.names, size)
@@ -0,0 +1,197 @@
+"""Generate a reproducible synthetic dataset in the app's file formats, at any scale.
+
+Usage:
+    python -m benchmarks.generate_dataset out/ --drugs 20000 --mean-degree 40 --seed 1
+
+Writes:
+    chem_similarity.csv       DrugBank ID x DrugBank ID similarity matrix (what load_similarity_neighbors reads)
+    drug_names_ids.csv        Drug Name, PubChem CID, DrugBank ID, ChEMBL ID
+    SAME_DRUG.csv             each drug's three most similar drugs, taken from the matrix
+    ddi/<drug>.csv            per-drug interaction tables in PubChem's drugbankddi CSV layout
+    interaction_files.jsonl   the same tables as interaction_files documents (for mongoimport)
+
+Similarity scores are Tanimoto coefficients of clustered binary fingerprints, so most
+pairs score low and structural neighbours score high, like real chemical similarity.
+Interaction degrees follow a power law (Chung-Lu model): a few drugs interact with a
+large share of the others, most with a handful.
+
+Output is streamed row by row and drug by drug. Memory holds the fingerprints, the
+interaction edge list and one block of matrix rows, never a whole output file.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import DESCRIPTIONS, DRUG_ID_COLUMNS, INTERACTION_COLUMNS, SIMILAR_DRUG_COLUMNS, drugbank_id
+
+FINGERPRINT_BITS = 256
+CLUSTER_SIZE = 50  # mean drugs per structural family
+MATRIX_BLOCK_VALUES = 1 << 23  # similarity scores computed at once (32 MB of float32)
+SYLLABLES = ["ab", "ac", "al", "am", "an", "ar", "be", "ca", "ce", "ci", "co", "da", "de", "di", "do", "fe", "fi",
+             "ga", "ge", "la", "le", "li", "lo", "ma", "me", "mi", "mo", "na", "ne", "ni", "no", "pa", "pe", "pi",
+             "pro", "ra", "re", "ri", "ro", "sa", "se", "si", "ta", "te", "ti", "to", "va", "ve", "vi", "xa", "zo"]
+SUFFIXES = ["mab", "pril", "olol", "statin", "sartan", "azole", "cillin", "oxacin", "dipine", "tinib", "vir",
+            "prazole", "parin", "triptan", "afil", "setron", "lukast", "gliptin", "dronate", "caine", "profen", "zepam"]
+# Scores are written with three decimals; formatting through a table is much faster than float formatting
+SCORE_STRINGS = [f"{value / 1000:.3f}" for value in range(1001)]
+
+
+def generate_names(count, rng):
+    """Unique, whitespace- and comma-free drug names such as 'cadiprolol' or 'venotinib'."""
+    names, seen = [], set()
+    while len(names) < count:
+        syllables = rng.choice(SYLLABLES, size=rng.integers(1, 4))
+        name = "".join(syllables) + str(rng.choice(SUFFIXES))
+        if name in seen:
+            name = f"{name}{len(names)}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def generate_fingerprints(count, rng):
+    """Binary fingerprints scattered around per-family centroids, as float32 rows for fast matmuls."""
+    families = max(1, count // CLUSTER_SIZE)
+    centroids = rng.random((families, FINGERPRINT_BITS)) < 0.12
+    family = rng.integers(0, families, size=count)
+    flips = rng.random((count, FINGERPRINT_BITS)) < rng.uniform(0.02, 0.15, size=(count, 1))
+    fingerprints = centroids[family] ^ flips
+    fingerprints[fingerprints.sum(axis=1) == 0, 0] = True  # Tanimoto needs at least one bit set
+    return fingerprints.astype(np.float32)
+
+
+def similarity_blocks(fingerprints):
+    """Yield (first row, block of Tanimoto rows) covering the whole matrix, a bounded block at a time."""
+    count = len(fingerprints)
+    bits = fingerprints.sum(axis=1)
+    rows = max(1, MATRIX_BLOCK_VALUES // count)
+    for start in range(0, count, rows):
+        shared = fingerprints[start:start + rows] @ fingerprints.T
+        block = shared / (bits[start:start + rows, None] + bits[None, :] - shared)
+        for offset in range(len(block)):
+            block[offset, start + offset] = 1.0
+        yield start, block
+
+
+def write_similarity(out_dir, names, fingerprints, write_matrix=True):
+    """Stream chem_similarity.csv and derive SAME_DRUG.csv (top three neighbours) from the same rows."""
+    ids = [drugbank_id(index) for index in range(len(names))]
+    matrix_file = open(os.path.join(out_dir, "chem_similarity.csv"), "w", encoding="utf-8") if write_matrix else None
+    try:
+        if matrix_file is not None:
+            matrix_file.write("," + ",".join(ids) + "\n")
+        with open(os.path.join(out_dir, "SAME_DRUG.csv"), "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(SIMILAR_DRUG_COLUMNS)
+            for start, block in similarity_blocks(fingerprints):
+                quantized = np.rint(block * 1000).astype(np.int16)
+                for offset, row in enumerate(quantized):
+                    index = start + offset
+                    if matrix_file is not None:
+                        matrix_file.write(ids[index] + "," + ",".join(map(SCORE_STRINGS.__getitem__, row.tolist())) + "\n")
+                    row[index] = -1  # Skip self-similarity
+                    top = np.argpartition(row, -3)[-3:] if len(row) > 3 else np.arange(len(row))
+                    top = [int(j) for j in top[np.argsort(-row[top], kind="stable")] if j != index]
+                    writer.writerow([names[index]] + [names[j] for j in top] + [""] * (3 - len(top)))
+    finally:
+        if matrix_file is not None:
+            matrix_file.close()
+
+
+def generate_edges(count, mean_degree, exponent, rng):
+    """Undirected interaction edges with power-law expected degrees, as a CSR (offsets, partners) pair."""
+    weights = (np.arange(count) + 1.0) ** (-1 / (exponent - 1))
+    rng.shuffle(weights)  # Hub drugs are spread over the name range
+    probabilities = weights / weights.sum()
+    edges = count * mean_degree // 2
+    first = rng.choice(count, size=edges, p=probabilities).astype(np.int64)
+    second = rng.choice(count, size=edges, p=probabilities).astype(np.int64)
+    keep = first != second
+    low, high = np.minimum(first[keep], second[keep]), np.maximum(first[keep], second[keep])
+    pairs = np.unique(low * count + high)
+    low, high = pairs // count, pairs % count
+    # Each edge appears in both drugs' tables
+    source = np.concatenate([low, high]).astype(np.int32)
+    target = np.concatenate([high, low]).astype(np.int32)
+    order = np.lexsort((target, source))
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=count), out=offsets[1:])
+    return offsets, target[order]
+
+
+def interaction_csv(index, names, partners):
+    """One drug's interaction table in PubChem's drugbankddi CSV layout."""
+    lines = [",".join(INTERACTION_COLUMNS)]
+    name = names[index]
+    for partner in partners.tolist():
+        description = DESCRIPTIONS[(index + partner) % len(DESCRIPTIONS)].format(name, names[partner])
+        lines.append(f'{index + 1},{partner + 1},{drugbank_id(index)},{name},{drugbank_id(partner)},{names[partner]},"{description}"')
+    return "\n".join(lines) + "\n"
+
+
+def write_interactions(out_dir, names, offsets, partners, formats):
+    """Write every drug's interaction table, one drug at a time."""
+    csv_dir = os.path.join(out_dir, "ddi")
+    if "csv" in formats:
+        os.makedirs(csv_dir, exist_ok=True)
+    jsonl = open(os.path.join(out_dir, "interaction_files.jsonl"), "w", encoding="utf-8") if "jsonl" in formats else None
+    try:
+        for index, name in enumerate(names):
+            content = interaction_csv(index, names, partners[offsets[index]:offsets[index + 1]])
+            if "csv" in formats:
+                with open(os.path.join(csv_dir, f"{name}.csv"), "w", encoding="utf-8") as file:
+                    file.write(content)
+            if jsonl is not None:
+                jsonl.write(json.dumps({"drug_name": name, "file_name": f"{name}_response.csv", "content": content}) + "\n")
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+
+
+def write_drug_ids(out_dir, names):
+    with open(os.path.join(out_dir, "drug_names_ids.csv"), "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(DRUG_ID_COLUMNS)
+        for index, name in enumerate(names):
+            writer.writerow([name, index + 1, drugbank_id(index), f"CHEMBL{index + 1}"])
+
+
+def generate(out_dir, drugs, mean_degree=20, exponent=2.3, seed=0, write_matrix=True, formats=("csv", "jsonl")):
+    """Write a complete dataset for `drugs` drugs to out_dir; the same seed gives byte-identical output."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    names = generate_names(drugs, rng)
+    write_drug_ids(out_dir, names)
+    write_similarity(out_dir, names, generate_fingerprints(drugs, rng), write_matrix)
+    print(f"✅ Wrote similarity tables for {drugs} drugs ({time.perf_counter() - started:.1f}s)")
+    offsets, partners = generate_edges(drugs, mean_degree, exponent, rng)
+    write_interactions(out_dir, names, offsets, partners, formats)
+    degrees = np.diff(offsets)
+    print(f"✅ Wrote {len(partners) // 2} interactions (max degree {degrees.max()}, median {int(np.median(degrees))}) "
+          f"({time.perf_counter() - started:.1f}s)")
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic drug similarity and interaction dataset.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--drugs", type=int, default=1000)
+    parser.add_argument("--mean-degree", type=int, default=20, help="mean interaction partners per drug")
+    parser.add_argument("--exponent", type=float, default=2.3, help="power-law exponent of the degree distribution (> 2)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-matrix", action="store_true", help="skip chem_similarity.csv (it has drugs**2 scores)")
+    parser.add_argument("--ddi", choices=["csv", "jsonl", "both"], default="both", help="interaction table outputs")
+    args = parser.parse_args(argv)
+    if args.exponent <= 2:
+        parser.error("--exponent must be greater than 2")
+    generate(args.out_dir, args.drugs, args.mean_degree, args.exponent, args.seed,
+             write_matrix=not args.no_matrix, formats=("csv", "jsonl") if args.ddi == "both" else (args.ddi,))
+
+
+if __name__ == "__main__":
+    main()
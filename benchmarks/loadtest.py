@@ -0,0 +1,237 @@
+"""End-to-end load test of the full app (both blueprints) against local upstream stand-ins.
+
+Usage:
+    python -m benchmarks.loadtest --drugs 2000 --duration 20 --concurrency 1 8 32 --latency 0 0.2 --error-rate 0 0.05
+
+app.py is served in-process by a threaded werkzeug server. PubChem and ChEMBL are replaced
+by benchmarks.stub_pubchem, with injected latency and errors, and MongoDB by the in-memory
+stand-in. Client threads then drive a weighted mix of requests:
+
+    form_warm        Form regimen of stored, resolved drugs (popular drugs more often)
+    form_cold        one drug has to be downloaded from the PubChem stub
+    form_unresolved  one drug is missing from SAME_DRUG.csv, so its similar drugs are looked up
+    simple           SIMPLE check_interaction, which downloads every drug it hasn't cached
+
+Every combination of --concurrency, --latency and --error-rate is run from the same fresh
+data. For each one the test reports p50/p95/p99 latency, requests per second, errors,
+partial Form results and upstream calls per endpoint. The report is written as JSON to
+benchmarks/results/.
+"""
+import argparse
+import datetime
+import glob
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from benchmarks import memory_mongo
+from benchmarks.fixtures import World
+from benchmarks.run import REPO_ROOT, RESULTS_FOLDER, git_commit, load_world
+from benchmarks.stub_pubchem import StubPubChem
+
+PARTIAL_MARKER = "These results are incomplete"
+DEFAULT_MIX = "form_warm=70,form_cold=15,form_unresolved=5,simple=10"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"form_warm", "form_cold", "form_unresolved", "simple"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class LoadTest:
+    def __init__(self, args, world, stub, base_url, form_module, simple_module):
+        self.args = args
+        self.world = world
+        self.stub = stub
+        self.base_url = base_url
+        self.f = form_module
+        self.simple = simple_module
+        rng = random.Random(args.seed)
+        indexes = list(range(world.count))
+        rng.shuffle(indexes)
+        cold_count = int(world.count * args.cold_fraction)
+        unresolved_count = int(world.count * args.unresolved_fraction)
+        self.cold = indexes[:cold_count]  # no MongoDB document yet
+        self.unresolved = indexes[cold_count:cold_count + unresolved_count]  # no SAME_DRUG.csv row yet
+        self.warm = set(indexes[cold_count + unresolved_count:])
+
+    def reset(self):
+        """Give every configuration the same starting data and empty caches."""
+        unresolved = set(self.unresolved)
+        load_world(self.f, self.world, stored=[i for i in range(self.world.count) if i not in self.cold],
+                   resolved=[i for i in range(self.world.count) if i not in unresolved])
+        self.simple.result_cache.local.clear()
+        for filename in glob.glob(os.path.join(self.simple.DRUG_DATA_FOLDER, "*_response.csv")):
+            os.remove(filename)
+
+    def make_request(self, scenario, rng):
+        """(method, path, keyword arguments) for one request of the scenario."""
+        world = self.world
+        size = rng.choice(self.args.regimen_sizes)
+        drugs = [world.names[index] for index in world.popular_drugs(rng, size, self.warm)]
+        if scenario == "form_cold" and self.cold:
+            drugs[-1:] = [world.names[rng.choice(self.cold)]]
+        elif scenario == "form_unresolved" and self.unresolved:
+            drugs[-1:] = [world.names[rng.choice(self.unresolved)]]
+        if scenario == "simple":
+            return "POST", "/simpleChecker/check_interaction", {"json": {"drugs": " ".join(drugs)}}
+        return "POST", "/form/", {"data": {"drug_names": " ".join(drugs)}}
+
+    def client(self, worker, stop_at, samples):
+        rng = random.Random(f"{self.args.seed}-{worker}")
+        scenarios, weights = zip(*self.args.mix.items())
+        with httpx.Client(base_url=self.base_url, timeout=self.args.timeout) as client:
+            while time.monotonic() < stop_at:
+                scenario = rng.choices(scenarios, weights)[0]
+                method, path, kwargs = self.make_request(scenario, rng)
+                started = time.perf_counter()
+                try:
+                    response = client.request(method, path, **kwargs)
+                    status = response.status_code
+                    partial = PARTIAL_MARKER in response.text
+                except httpx.HTTPError:
+                    status, partial = None, False
+                samples.append((scenario, time.perf_counter() - started, status, partial))
+
+    def drive(self, concurrency, duration):
+        samples = []  # list.append is atomic, so client threads share it
+        stop_at = time.monotonic() + duration
+        threads = [threading.Thread(target=self.client, args=(worker, stop_at, samples)) for worker in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    def run(self, concurrency, latency, error_rate):
+        self.reset()
+        self.stub.latency, self.stub.error_rate = latency, error_rate
+        if self.args.warmup:
+            self.drive(concurrency, self.args.warmup)
+        self.stub.reset_counts()
+        samples, elapsed = self.drive(concurrency, self.args.duration)
+        report = {
+            "concurrency": concurrency,
+            "upstream_latency": latency,
+            "upstream_error_rate": error_rate,
+            "elapsed": elapsed,
+            "upstream_calls": dict(self.stub.calls),
+            "scheduler": self.f.scheduler.stats(),
+        }
+        report.update(summarize(samples, elapsed))
+        report["scenarios"] = {scenario: summarize([s for s in samples if s[0] == scenario], elapsed) for scenario in self.args.mix}
+        return report
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for _, latency, _, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, status, _ in samples if status is None or status >= 400),
+        "partial": sum(1 for *_, partial in samples if partial),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def print_report(report):
+    print(f"\nconcurrency={report['concurrency']} upstream latency={report['upstream_latency']}s errors={report['upstream_error_rate']:.0%}")
+    print(f"  {'scenario':<16} {'requests':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'partial':>8}")
+    for name, stats in [("all", report)] + list(report["scenarios"].items()):
+        print(f"  {name:<16} {stats['requests']:>8} {stats['rps']:>8.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['errors']:>7} {stats['partial']:>8}")
+    print("  upstream calls: " + ", ".join(f"{name}={count}" for name, count in sorted(report["upstream_calls"].items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the app against local PubChem/ChEMBL stand-ins.")
+    parser.add_argument("--drugs", type=int, default=2000, help="synthetic drug count (the similarity matrix has drugs**2 scores)")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each configuration")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.05], help="mean upstream latency in seconds")
+    parser.add_argument("--error-rate", type=float, nargs="+", default=[0.0], help="fraction of upstream calls answered 503")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--regimen-sizes", type=int, nargs="+", default=[2, 3, 4, 5])
+    parser.add_argument("--cold-fraction", type=float, default=0.1, help="drugs not stored in MongoDB at the start")
+    parser.add_argument("--unresolved-fraction", type=float, default=0.02, help="drugs missing from SAME_DRUG.csv at the start")
+    parser.add_argument("--rate-limit", default="0", help="PubChem/ChEMBL requests per second across workers (0 disables)")
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="report file (default: benchmarks/results/loadtest-<time>-<commit>.json)")
+    args = parser.parse_args(argv)
+    args.output = args.output and os.path.abspath(args.output)
+
+    world = World(args.drugs, seed=args.seed)
+    stub = StubPubChem(world, seed=args.seed).start()
+    # Configure the app before it is imported: local stubs, no tracing, no real MongoDB
+    os.environ.update(PUBCHEM_BASE_URL=stub.url, CHEMBL_BASE_URL=stub.chembl_url, TRACE_SAMPLE_RATE="0",
+                      PUBCHEM_RATE_LIMIT=args.rate_limit, CHEMBL_RATE_LIMIT=args.rate_limit)
+    memory_mongo.install()
+    os.chdir(tempfile.mkdtemp(prefix="drug-loadtest-"))  # The app reads and writes its data files in the working directory
+    os.makedirs("Drug_data", exist_ok=True)
+    if args.mix.get("form_unresolved"):
+        world.similarity_matrix(args.seed).to_csv(os.path.join("Drug_data", "chem_similarity.csv"))
+    sys.path.insert(0, REPO_ROOT)
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as app_module
+    import Form.form as form_module
+    import SIMPLE.simpleChecker as simple_module
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="app-server", daemon=True).start()
+    test = LoadTest(args, world, stub, f"http://127.0.0.1:{server.server_port}", form_module, simple_module)
+
+    reports = []
+    for concurrency, latency, error_rate in itertools.product(args.concurrency, args.latency, args.error_rate):
+        reports.append(test.run(concurrency, latency, error_rate))
+        print_report(reports[-1])
+    server.shutdown()
+    stub.stop()
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_FOLDER, f"loadtest-{datetime.datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({
+            "commit": commit,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+            "runs": reports,
+        }, file, indent=1)
+    print(f"\n✅ Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
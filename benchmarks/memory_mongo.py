@@ -0,0 +1,245 @@
+"""In-memory stand-in for the parts of pymongo the app uses.
+
+install() replaces pymongo.MongoClient, so it must run before Form.form is imported.
+"""
+import copy
+import itertools
+import threading
+
+import pymongo
+from pymongo.errors import DuplicateKeyError
+
+_ids = itertools.count(1)
+
+
+def _hashable(value):
+    return repr(value) if isinstance(value, (dict, list)) else value
+
+
+def _matches(document, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+            continue
+        value = document.get(key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            for op, operand in condition.items():
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$exists" and (key in document) != operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.copy(document)
+    projected = {key: document[key] for key, include in projection.items() if include and key in document}
+    if projection.get("_id", 1):
+        projected["_id"] = document["_id"]
+    return projected
+
+
+class _Result:
+    def __init__(self, matched_count=0, upserted_id=None, deleted_count=0):
+        self.matched_count = matched_count
+        self.modified_count = matched_count
+        self.upserted_id = upserted_id
+        self.deleted_count = deleted_count
+
+
+class Cursor:
+    def __init__(self, documents, projection=None):
+        self._documents = documents
+        self._projection = projection  # Applied last, so sort() can use fields it leaves out
+
+    def sort(self, key, direction=1):
+        self._documents.sort(key=lambda document: (document.get(key) is not None, document.get(key)), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def __iter__(self):
+        return (_project(document, self._projection) for document in self._documents)
+
+
+class Collection:
+    """Thread-safe in-memory collection. Equality lookups on a field build a hash index on
+    first use, which is then kept up to date, so lookups cost about what an indexed one would."""
+
+    def __init__(self):
+        self._documents = {}
+        self._unique = set()
+        self._indexes = {}  # field -> {value: {_id, ...}}
+        self._lock = threading.RLock()
+
+    def _index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            index = self._indexes[field] = {}
+            for document in self._documents.values():
+                if field in document:
+                    index.setdefault(_hashable(document[field]), set()).add(document["_id"])
+        return index
+
+    def _add_to_indexes(self, document):
+        for field, index in self._indexes.items():
+            if field in document:
+                index.setdefault(_hashable(document[field]), set()).add(document["_id"])
+
+    def _remove_from_indexes(self, document):
+        for field, index in self._indexes.items():
+            if field in document:
+                ids = index.get(_hashable(document[field]))
+                if ids is not None:
+                    ids.discard(document["_id"])
+
+    def create_index(self, key, unique=False, **kwargs):
+        with self._lock:
+            index = self._index(key)
+            if unique:
+                if any(len(ids) > 1 for ids in index.values()):
+                    raise DuplicateKeyError(f"duplicate values for {key}")
+                self._unique.add(key)
+        return f"{key}_1"
+
+    def _check_unique(self, document, ignore_id=None):
+        for key in self._unique:
+            if key in document and self._index(key).get(_hashable(document[key]), set()) - {ignore_id}:
+                raise DuplicateKeyError(f"duplicate {key}: {document[key]!r}")
+
+    def _store(self, document):
+        old = self._documents.get(document["_id"])
+        if old is not None:
+            self._remove_from_indexes(old)
+        self._documents[document["_id"]] = document
+        self._add_to_indexes(document)
+
+    def insert_one(self, document):
+        with self._lock:
+            document.setdefault("_id", next(_ids))
+            if document["_id"] in self._documents:
+                raise DuplicateKeyError(f"duplicate _id: {document['_id']!r}")
+            self._check_unique(document)
+            self._store(copy.copy(document))
+        return _Result(upserted_id=document["_id"])
+
+    def insert_many(self, documents):
+        for document in documents:
+            self.insert_one(document)
+
+    def _find(self, query):
+        if "_id" in query and not isinstance(query["_id"], dict):
+            document = self._documents.get(query["_id"])
+            candidates = [document] if document is not None else []
+        else:
+            # Narrow down by the first plain equality condition, if there is one
+            field = next((key for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)), None)
+            if field is None:
+                candidates = self._documents.values()
+            else:
+                candidates = [self._documents[_id] for _id in self._index(field).get(_hashable(query[field]), ())]
+        return [document for document in candidates if _matches(document, query)]
+
+    def find_one(self, query=None, projection=None):
+        with self._lock:
+            found = self._find(query or {})
+            return _project(found[0], projection) if found else None
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            return Cursor([copy.copy(document) for document in self._find(query or {})], projection)
+
+    def distinct(self, key):
+        with self._lock:
+            return list({document[key] for document in self._documents.values() if key in document})
+
+    def count_documents(self, query):
+        with self._lock:
+            return len(self._find(query))
+
+    def update_one(self, query, update, upsert=False):
+        with self._lock:
+            found = self._find(query)
+            if found:
+                document = dict(found[0])
+                document.update(update.get("$set", {}))
+                for key, amount in update.get("$inc", {}).items():
+                    document[key] = document.get(key, 0) + amount
+                self._check_unique(document, ignore_id=document["_id"])
+                self._store(document)
+                return _Result(matched_count=1)
+            if not upsert:
+                return _Result()
+            document = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+            document.update(update.get("$setOnInsert", {}))
+            document.update(update.get("$set", {}))
+            document.update(update.get("$inc", {}))
+            return self.insert_one(document)
+
+    def replace_one(self, query, replacement, upsert=False):
+        with self._lock:
+            found = self._find(query)
+            if found:
+                replacement = dict(replacement, _id=found[0]["_id"])
+                self._check_unique(replacement, ignore_id=found[0]["_id"])
+                self._store(replacement)
+                return _Result(matched_count=1)
+            if upsert:
+                return self.insert_one(dict(replacement))
+            return _Result()
+
+    def delete_one(self, query):
+        with self._lock:
+            found = self._find(query)[:1]
+            for document in found:
+                self._remove_from_indexes(document)
+                del self._documents[document["_id"]]
+            return _Result(deleted_count=len(found))
+
+    def delete_many(self, query):
+        with self._lock:
+            found = self._find(query)
+            for document in found:
+                self._remove_from_indexes(document)
+                del self._documents[document["_id"]]
+            return _Result(deleted_count=len(found))
+
+
+class Database:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            return self._collections.setdefault(name, Collection())
+
+    __getattr__ = __getitem__
+
+
+class MemoryMongoClient:
+    """Process-wide in-memory server: every client sees the same databases."""
+    _databases = {}
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getitem__(self, name):
+        with self._lock:
+            return self._databases.setdefault(name, Database())
+
+    def close(self):
+        pass
+
+
+def install():
+    """Make every later MongoClient(...) an in-memory client."""
+    pymongo.MongoClient = MemoryMongoClient
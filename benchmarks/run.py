@@ -0,0 +1,207 @@
+"""Microbenchmarks for the Form similarity and interaction hot paths.
+
+Usage:
+    python -m benchmarks.run --sizes 1000 10000 50000 --regimen-sizes 2 10 50
+    python -m benchmarks.run --sizes 1000 --compare benchmarks/results/<earlier run>.json
+
+MongoDB is replaced by an in-memory stand-in and PubChem by a local stub server, so runs
+are offline and repeatable. Each run is written to benchmarks/results/<time>-<commit>.json;
+--compare prints the median speedup of this run over an earlier one.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import memory_mongo
+from benchmarks.fixtures import World, drugbank_id
+from benchmarks.stub_pubchem import StubPubChem
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FOLDER = os.path.join(REPO_ROOT, "benchmarks", "results")
+SIMILARITY_FILE = os.path.join("Drug_data", "chem_similarity.csv")  # Where Form looks for the matrix
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(fn, setup=None, min_runs=3, max_runs=50, min_time=0.5):
+    """Time fn() at least min_runs times and until min_time seconds passed; setup() runs untimed before each call."""
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < max_runs and (len(durations) < min_runs or time.perf_counter() - started < min_time):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {
+        "runs": len(durations),
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "median_ms": statistics.median(durations) * 1000,
+        "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+        "min_ms": durations[0] * 1000,
+    }
+
+
+def load_world(f, world, stored=None, resolved=None):
+    """Replace the app's stored data with the world's and rebuild every in-process index.
+
+    `stored` limits which drug indexes get a MongoDB document and `resolved` which get a
+    SAME_DRUG.csv row; the others are downloaded or resolved through the upstream stub.
+    """
+    memory_mongo.MemoryMongoClient._databases.clear()
+    f.connect_mongo()
+    f.ensure_interaction_indexes()
+    f.collection.insert_many(world.documents() if stored is None else (world.document(index) for index in stored))
+    world.write_similar_drugs(indexes=resolved)
+    world.write_drug_ids()
+    for filename in (f.INTERACTION_FILTER_FILE, f.INTERACTION_SNAPSHOT_FILE):
+        if os.path.isfile(filename):
+            os.remove(filename)
+    f.interaction_version_state = (0.0, None)
+    f.interaction_filter_version = None
+    f.pair_memo.cache.clear()
+    f.regimen_cache.local.clear()
+    f.load_interaction_graph()
+    f.load_interaction_filter()
+
+
+class Suite:
+    def __init__(self, form_module, stub, args):
+        self.f = form_module
+        self.stub = stub
+        self.args = args
+        self.results = []
+
+    def bench(self, name, fn, drugs, regimen_size=None, setup=None):
+        stats = measure(fn, setup, self.args.min_runs, self.args.max_runs, self.args.min_time)
+        self.results.append(dict(name=name, drugs=drugs, regimen_size=regimen_size, **stats))
+        label = f"{name} [drugs={drugs}" + (f", regimen={regimen_size}]" if regimen_size else "]")
+        print(f"{label:<70} median {stats['median_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms  ({stats['runs']} runs)")
+
+    def run_size(self, count):
+        f = self.f
+        started = time.perf_counter()
+        world = World(count, seed=self.args.seed)
+        self.stub.world = world
+        load_world(f, world)
+        print(f"✅ Loaded {count} synthetic drugs in {time.perf_counter() - started:.1f}s")
+
+        # SAME_DRUG.csv / drug_names_ids.csv helpers scan the whole file; the last row is the worst case
+        last = world.names[-1]
+        self.bench("are_similar_drugs_present", lambda: f.are_similar_drugs_present(last), count)
+        self.bench("get_similar_drugs_from_csv", lambda: f.get_similar_drugs_from_csv(last), count)
+        self.bench("is_drug_in_csv", lambda: f.is_drug_in_csv(last), count)
+
+        if count <= self.args.matrix_max:
+            # The app answers from the top-K neighbours shared index built from the CSV; the dense
+            # matrix lookup is kept as the reference point
+            matrix = world.similarity_matrix(self.args.seed)
+            os.makedirs(os.path.dirname(SIMILARITY_FILE), exist_ok=True)
+            matrix.to_csv(SIMILARITY_FILE)
+            started = time.perf_counter()
+            neighbors = f.load_similarity_neighbors(SIMILARITY_FILE)
+            print(f"✅ Built the similarity neighbours index in {time.perf_counter() - started:.1f}s")
+            probe = drugbank_id(count // 2)
+            self.bench("load_similarity_neighbors", lambda: f.load_similarity_neighbors(SIMILARITY_FILE), count)
+            self.bench("get_top_similar_drugs", lambda: f.get_top_similar_drugs(probe, neighbors), count)
+            self.bench("get_top_similar_drugs[dense]", lambda: f.get_top_similar_drugs(probe, matrix), count)
+            assert f.get_top_similar_drugs(probe, neighbors) == f.get_top_similar_drugs(probe, matrix)
+            # Later sizes run without a matrix, not with this one
+            os.remove(SIMILARITY_FILE)
+            del matrix, neighbors
+
+        # A drug missing from MongoDB is downloaded from the stub, stored and indexed
+        target = world.names[count // 2]
+        self.bench("fetch_drug_data[cold]", lambda: f.fetch_drug_data(target), count,
+                   setup=lambda: f.collection.delete_one({"drug_name": target}))
+
+        for size in self.args.regimen_sizes:
+            regimen = world.regimen(size, self.args.seed)
+            all_drugs = regimen + [drug for drug_name in regimen for drug in world.similar[int(drug_name[4:])]]
+            pairs = list(itertools.combinations(regimen, 2))
+            self.bench("generate_combinations_from_same_drug", lambda: f.generate_combinations_from_same_drug(regimen), count, size)
+            self.bench("generate_combinations_from_same_drug[prune]", lambda: f.generate_combinations_from_same_drug(regimen, prune=True), count, size)
+            self.bench("search_interactions_for_drugs[cold]", lambda: [f.search_interactions_for_drugs(list(pair)) for pair in pairs], count, size,
+                       setup=f.pair_memo.cache.clear)
+            self.bench("search_interactions_for_drugs[warm]", lambda: [f.search_interactions_for_drugs(list(pair)) for pair in pairs], count, size)
+            self.bench("search_interactions_for_regimen", lambda: f.search_interactions_for_regimen(all_drugs), count, size)
+            self.bench("expand_interacting_pairs", lambda: f.expand_interacting_pairs(all_drugs, fetch=False), count, size)
+            self.bench("check_regimen", lambda: f.check_regimen(regimen), count, size)
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, encoding="utf-8") as file:
+        baseline = {(r["name"], r["drugs"], r["regimen_size"]): r for r in json.load(file)["results"]}
+    print(f"\nMedian speedup over {os.path.basename(baseline_file)} (>1 is faster):")
+    for result in results:
+        before = baseline.get((result["name"], result["drugs"], result["regimen_size"]))
+        if before is not None and result["median_ms"] > 0:
+            print(f"  {result['name']:<50} drugs={result['drugs']:<6} regimen={result['regimen_size'] or '-':<4} {before['median_ms'] / result['median_ms']:6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Form similarity and interaction hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="synthetic drug counts")
+    parser.add_argument("--regimen-sizes", type=int, nargs="+", default=[2, 10, 50])
+    parser.add_argument("--matrix-max", type=int, default=5000,
+                        help="largest drug count to build a dense similarity matrix for (it needs count**2 * 4 bytes)")
+    parser.add_argument("--min-runs", type=int, default=3)
+    parser.add_argument("--max-runs", type=int, default=50)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds each benchmark runs for at least")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+    # Paths given on the command line are relative to where the suite was started, not its scratch directory
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    stub = StubPubChem().start()
+    # Configure the app before it is imported: local stub, no rate limiting or tracing, no real MongoDB
+    os.environ.update(PUBCHEM_BASE_URL=stub.url, PUBCHEM_RATE_LIMIT="0", UPSTREAM_RETRIES="0", TRACE_SAMPLE_RATE="0")
+    memory_mongo.install()
+    os.chdir(tempfile.mkdtemp(prefix="drug-benchmarks-"))  # The app reads and writes its CSVs in the working directory
+    sys.path.insert(0, REPO_ROOT)
+    import Form.form as form_module
+
+    suite = Suite(form_module, stub, args)
+    for count in args.sizes:
+        suite.run_size(count)
+    stub.stop()
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_FOLDER, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({
+            "commit": commit,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "upstream_calls": stub.calls,
+            "results": suite.results,
+        }, file, indent=1)
+    print(f"✅ Results written to {output}")
+    if args.compare:
+        compare(suite.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Local stand-in for the PubChem (SDQ download, PUG REST) and ChEMBL endpoints the app calls.
+
+Answers come from a benchmarks.fixtures.World. Latency and errors can be injected to see how
+the app behaves when upstreams are slow or failing.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from benchmarks.fixtures import INTERACTION_COLUMNS, drugbank_id
+
+CHEMBL_PREFIX = "/chembl/api/data"
+
+
+def ddi_query_drug(query):
+    """Drug name from an sdqagent.cgi query string (the "^name$" in its where clause)."""
+    arguments = parse_qs(query)
+    request = json.loads(arguments["query"][0])
+    return request["where"]["ands"][0]["name"].strip("^$")
+
+
+class StubPubChem:
+    """Serves the world's data over HTTP from a background thread.
+
+    latency is the mean added delay per request in seconds (exponentially distributed), and
+    error_rate the fraction of requests answered with a 503. Calls are counted per endpoint.
+    """
+
+    def __init__(self, world=None, latency=0.0, error_rate=0.0, seed=0):
+        self.world = world
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.chembl_url = self.url + CHEMBL_PREFIX
+
+    def count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls = {}
+
+    def _draw(self):
+        with self._lock:
+            delay = self._random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            return delay, self._random.random() < self.error_rate
+
+    def handle(self, handler):
+        parsed = urlparse(handler.path)
+        endpoint, status, body = self.route(parsed.path, parse_qs(parsed.query), parsed.query)
+        self.count(endpoint)
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            self.count("injected_errors")
+            status, body = 503, b"Service unavailable (injected)"
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json" if body[:1] in (b"{", b"[") else "text/csv")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def route(self, path, arguments, query):
+        """Return (endpoint name, status, body) for a request."""
+        world = self.world
+        if path == "/sdq/sdqagent.cgi":
+            content = world.csv_for(ddi_query_drug(query)) if world else None
+            return "pubchem_ddi", 200, (content or ",".join(INTERACTION_COLUMNS)).encode()
+        parts = path.strip("/").split("/")
+        if parts[:3] == ["rest", "pug", "compound"] and len(parts) == 7:
+            kind, identifier, operation = parts[3], unquote(parts[4]), parts[5]
+            if kind == "name" and operation == "cids":
+                index = world.lookup(identifier) if world else None
+                if index is None:
+                    return "pubchem_cids", 404, b'{"Fault": {"Code": "PUGREST.NotFound"}}'
+                return "pubchem_cids", 200, json.dumps({"IdentifierList": {"CID": [index + 1]}}).encode()
+            if kind == "cid" and operation == "synonyms":
+                index = int(identifier) - 1 if identifier.isdigit() else -1
+                if world is None or not 0 <= index < world.count:
+                    return "pubchem_synonyms", 404, b'{"Fault": {"Code": "PUGREST.NotFound"}}'
+                synonyms = [world.names[index], drugbank_id(index), f"CHEMBL{index + 1}"]
+                return "pubchem_synonyms", 200, json.dumps({"InformationList": {"Information": [{"CID": index + 1, "Synonym": synonyms}]}}).encode()
+        if path == CHEMBL_PREFIX + "/molecule.json":
+            identifier = (arguments.get("pref_name__iexact") or arguments.get("molecule_chembl_id") or [""])[0]
+            index = world.lookup(identifier) if world else None
+            molecules = [] if index is None else [{"molecule_chembl_id": f"CHEMBL{index + 1}", "pref_name": world.names[index].upper()}]
+            return "chembl_molecule", 200, json.dumps({"molecules": molecules}).encode()
+        return "unknown", 404, b"Not found"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub-pubchem", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
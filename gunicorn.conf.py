@@ -0,0 +1,68 @@
+"""Production server settings.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master, which builds (or maps, if they are current) the
+shared index files -- interaction graph snapshot, similar-drug and name indexes, similarity
+neighbours -- and the bloom filter, then forks the workers. The index files are memory-mapped,
+so every worker reads the same pages and RAM stays flat as workers are added. Each worker opens
+its own MongoDB client and background threads after fork.
+
+Every process writes its metrics to METRICS_MULTIPROC_DIR (a fresh temporary directory unless
+set), and /metrics merges them, so whichever worker answers a scrape reports the whole server.
+"""
+import gc
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# Tell Form to leave its background threads to the workers (see Form.form.init_forked_worker)
+os.environ.setdefault("FORM_PREFORK", "1")
+# Read by Form.metrics when the app is imported, so it must be set here
+os.environ.setdefault("METRICS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="drug-checker-metrics-"))
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))  # above FORM_REQUEST_DEADLINE plus rendering
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None  # empty disables it
+
+
+def on_starting(server):
+    """Runs once in the master at startup (not on reload)."""
+    # A previous run's files would add its counts to this run's; the master's own file stays
+    for filename in glob.glob(os.path.join(os.environ["METRICS_MULTIPROC_DIR"], "*.json")):
+        if not os.path.basename(filename).startswith(f"{os.getpid()}-"):
+            os.remove(filename)
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded and before the first fork."""
+    import Form.form
+
+    Form.form.preload_indexes()
+    # Move everything loaded so far out of the collector's reach, so collections in the
+    # workers don't write to (and so un-share) the pages holding the preloaded indexes
+    gc.collect()
+    gc.freeze()
+    server.log.info("Indexes preloaded; %d objects frozen for copy-on-write sharing", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after fork."""
+    import Form.form
+
+    Form.form.init_forked_worker()
+
+
+def child_exit(server, worker):
+    """Runs in the master after a worker has exited."""
+    from Form import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,79 @@
+"""Shared test setup: the app runs against the benchmarks' in-memory MongoDB and PubChem stub.
+
+Everything is configured before any test module imports Form, because Form reads its settings
+and connects to MongoDB at import time. The app reads and writes its CSVs and index files in
+the working directory, so the tests run in a scratch directory.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import memory_mongo  # noqa: E402
+from benchmarks.fixtures import World  # noqa: E402
+from benchmarks.run import load_world  # noqa: E402
+from benchmarks.stub_pubchem import StubPubChem  # noqa: E402
+
+stub = StubPubChem().start()
+os.environ.update(
+    PUBCHEM_BASE_URL=stub.url,
+    CHEMBL_BASE_URL=stub.chembl_url,
+    PUBCHEM_RATE_LIMIT="0",
+    CHEMBL_RATE_LIMIT="0",
+    UPSTREAM_RETRIES="0",
+    TRACE_SAMPLE_RATE="0",
+)
+memory_mongo.install()
+os.chdir(tempfile.mkdtemp(prefix="drug-checker-tests-"))
+
+
+@pytest.fixture(scope="session")
+def form():
+    """The Form module, imported against the stand-ins."""
+    import Form.form
+    return Form.form
+
+
+@pytest.fixture
+def world(form):
+    """A small synthetic dataset, freshly loaded into MongoDB, the CSVs and every index."""
+    world = World(200, seed=0)
+    stub.world = world
+    stub.reset_counts()
+    load_world(form, world)
+    return world
+
+
+@pytest.fixture
+def upstream():
+    """The PubChem/ChEMBL stub, to count calls or inject latency and errors."""
+    yield stub
+    stub.latency = 0.0
+    stub.error_rate = 0.0
+
+
+@pytest.fixture(scope="session")
+def client(form):
+    """Test client of the full app, with both blueprints registered."""
+    import app
+    return app.app.test_client()
+
+
+@pytest.fixture
+def unfetchable(form, world, monkeypatch):
+    """Name of a world drug with no stored interaction data, whose download always fails."""
+    drug_name = world.names[0]
+    load_world(form, world, stored=range(1, world.count))
+    download = form.download_interaction_csv
+
+    def failing_download(name):
+        if name == drug_name:
+            raise form.UpstreamUnavailable("PubChem is down")
+        return download(name)
+
+    monkeypatch.setattr(form, "download_interaction_csv", failing_download)
+    return drug_name
@@ -0,0 +1,35 @@
+from benchmarks.run import load_world
+
+
+def test_batch_matches_single_regimen_checks(form, world):
+    regimens = [world.regimen(3, seed=seed) for seed in range(4)]
+    batch = form.check_regimen_batch(regimens)
+    for regimen, result in zip(regimens, batch["results"]):
+        _, _, interactions, _, _ = form.check_regimen(regimen)
+        assert [entry["combo"] for entry in result["interactions"]] == [combo for combo, _ in interactions]
+        assert (result["missing_drugs"], result["incomplete_drugs"], result["message"]) == ([], [], None)
+
+
+def test_batch_downloads_each_distinct_drug_once(form, world, upstream):
+    load_world(form, world, stored=[])
+    shared = world.regimen(3)
+    regimens = [shared, shared + [world.names[0]], list(reversed(shared))]
+    upstream.reset_counts()
+    batch = form.check_regimen_batch(regimens)
+    assert upstream.calls["pubchem_ddi"] == batch["distinct_drugs"]
+
+
+def test_batch_lists_unresolved_and_unfetchable_drugs(form, world, unfetchable):
+    batch = form.check_regimen_batch([[world.names[1], "notadrug"], [unfetchable, world.names[1]], [world.names[1]]])
+    unresolved, unfetched, complete = batch["results"]
+    assert unresolved["missing_drugs"] == ["notadrug"] and unresolved["message"]
+    assert unfetched["missing_drugs"] == [unfetchable] and unfetched["message"] is None
+    assert complete["missing_drugs"] == []
+
+
+def test_batch_endpoint_validates_regimens(client, world):
+    assert client.post("/form/batch", json={}).status_code == 400
+    assert client.post("/form/batch", json={"regimens": [["a", ""]]}).status_code == 400
+    response = client.post("/form/batch", json={"regimens": [" ".join(world.regimen(3)), world.regimen(2)]})
+    assert response.status_code == 200
+    assert len(response.get_json()["results"]) == 2
@@ -0,0 +1,45 @@
+import json
+
+from Form import batch_cli
+
+
+def test_read_regimens_from_csv(tmp_path):
+    filename = tmp_path / "regimens.csv"
+    filename.write_text("id,drugs\np1,a b\n,c\n")
+    assert list(batch_cli.read_regimens(str(filename))) == [("p1", ["a", "b"]), (2, ["c"])]
+
+
+def test_read_regimens_from_jsonl(tmp_path):
+    filename = tmp_path / "regimens.jsonl"
+    filename.write_text('{"id": "p1", "drugs": ["a", "b"]}\n\n{"drugs": "c d"}\n')
+    assert list(batch_cli.read_regimens(str(filename))) == [("p1", ["a", "b"]), (3, ["c", "d"])]
+
+
+def test_chunked_keeps_order_and_the_remainder():
+    assert list(batch_cli.chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def run_cli(tmp_path, regimens):
+    source, output = tmp_path / "regimens.jsonl", tmp_path / "results.jsonl"
+    source.write_text("".join(json.dumps({"id": index, "drugs": drugs}) + "\n" for index, drugs in enumerate(regimens)))
+    status = batch_cli.main([str(source), "-o", str(output), "--workers", "2", "--chunk-size", "2"])
+    results = sorted((json.loads(line) for line in output.read_text().splitlines()), key=lambda result: result["id"])
+    return status, results
+
+
+def test_cli_checks_every_regimen(form, world, tmp_path):
+    regimens = [world.regimen(3, seed=seed) for seed in range(5)]
+    status, results = run_cli(tmp_path, regimens)
+    assert status == 0
+    assert [result["input_drug_names"] for result in results] == regimens
+    for regimen, result in zip(regimens, results):
+        _, _, interactions, _, _ = form.check_regimen(regimen)
+        assert [entry["combo"] for entry in result["interactions"]] == [combo for combo, _ in interactions]
+        assert result["missing_drugs"] == []
+
+
+def test_cli_fails_when_a_regimen_is_incomplete(world, tmp_path, capsys):
+    status, results = run_cli(tmp_path, [world.regimen(3), [world.names[1], "notadrug"]])
+    assert status == 1
+    assert [result["missing_drugs"] for result in results] == [[], ["notadrug"]]
+    assert "1 regimens have missing drugs" in capsys.readouterr().err
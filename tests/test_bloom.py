@@ -0,0 +1,125 @@
+import itertools
+import os
+import threading
+import time
+
+from Form.bloom import BloomFilter, file_lock
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"key{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate_is_near_the_configured_one():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"key{i}")
+    false_positives = sum(f"other{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.03
+
+
+def test_bloom_filter_round_trips_through_a_file(tmp_path):
+    bloom = BloomFilter(100, 0.01)
+    bloom.add("a\x1fb")
+    filename = str(tmp_path / "filter.bloom")
+    bloom.save(filename, {"drugs": ["a", "b"]})
+    loaded, metadata = BloomFilter.load(filename)
+    assert "a\x1fb" in loaded
+    assert metadata == {"drugs": ["a", "b"]}
+    assert (loaded.num_bits, loaded.num_hashes, loaded.count) == (bloom.num_bits, bloom.num_hashes, bloom.count)
+
+
+def test_update_merges_filters_of_the_same_size_only():
+    first, second = BloomFilter(100, 0.01), BloomFilter(100, 0.01)
+    first.add("a")
+    second.add("b")
+    assert first.update(second)
+    assert "a" in first and "b" in first
+    assert not first.update(BloomFilter(5000, 0.01))
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    filename = str(tmp_path / "filter.bloom")
+    holders, overlaps = [], []
+
+    def hold():
+        with file_lock(filename):
+            holders.append(1)
+            overlaps.append(len(holders))
+            time.sleep(0.01)
+            holders.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1] * 5
+    assert not os.path.exists(filename + ".lock")
+
+
+def test_file_lock_breaks_a_stale_lock(tmp_path):
+    filename = str(tmp_path / "filter.bloom")
+    open(filename + ".lock", "w").close()
+    os.utime(filename + ".lock", (time.time() - 60, time.time() - 60))
+    with file_lock(filename, timeout=1):
+        pass
+
+
+def interacting_and_not(world):
+    interacting = next((world.names[i], world.names[j]) for i in range(world.count) for j in sorted(world.partners[i]))
+    quiet = next((world.names[i], world.names[j]) for i, j in itertools.combinations(range(world.count), 2)
+                 if j not in world.partners[i])
+    return interacting, quiet
+
+
+def test_may_interact_rules_out_only_pairs_without_a_recorded_interaction(form, world):
+    interacting, quiet = interacting_and_not(world)
+    assert form.may_interact(list(interacting))
+    bloom, _ = form.interaction_filter_state
+    if form.pair_key(*quiet) not in bloom:  # Otherwise this pair is one of the allowed false positives
+        assert not form.may_interact(list(quiet))
+
+
+def test_may_interact_cannot_speak_for_drugs_not_ingested(form, world):
+    _, quiet = interacting_and_not(world)
+    assert form.may_interact([quiet[0], "not-ingested-yet"])
+
+
+def test_filter_is_loaded_from_its_file_when_current(form, world):
+    bloom, drugs = form.interaction_filter_state
+    assert drugs == set(world.names)
+    form.interaction_filter_state = (None, set())
+    form.load_interaction_filter()
+    loaded, drugs = form.interaction_filter_state
+    assert drugs == set(world.names)
+    assert loaded.bits == bloom.bits
+
+
+def test_new_pairs_for_a_covered_drug_are_saved_at_once(form, world):
+    document = world.document(0)
+    document["content"] += f'\n1,2,DB00000,{world.names[0]},DB99999,brand-new-partner,"New interaction."'
+    form.add_to_interaction_filter(document)
+    saved, _ = form.BloomFilter.load(form.INTERACTION_FILTER_FILE)
+    assert form.pair_key(world.names[0], "brand-new-partner") in saved
+
+
+def test_unchanged_refresh_does_not_rewrite_the_filter(form, world):
+    signature = form.file_signature(form.INTERACTION_FILTER_FILE)
+    form.add_to_interaction_filter(world.document(0))
+    assert form.file_signature(form.INTERACTION_FILTER_FILE) == signature
+
+
+def test_filter_does_not_change_paged_results(form, world):
+    regimen = world.regimen(4)
+    similar_drugs_info = form.resolve_similar_drugs(regimen)
+    with_filter = list(form.iter_combination_interactions(regimen, similar_drugs_info))
+    form.pair_memo.cache.clear()
+    form.interaction_filter_state = (None, set())
+    without_filter = list(form.iter_combination_interactions(regimen, similar_drugs_info))
+    assert with_filter == without_filter
+    assert any(results for _, results in with_filter)
@@ -0,0 +1,61 @@
+import time
+
+from benchmarks.run import load_world
+from Form.deadline import deadline, expired, remaining
+
+
+def test_no_budget_by_default():
+    assert remaining() is None and not expired()
+
+
+def test_nested_budget_never_extends_the_outer_one():
+    with deadline(0.05):
+        with deadline(10):
+            assert remaining() <= 0.05
+        with deadline(None):
+            assert remaining() is None  # Lifted explicitly, e.g. for background work
+    assert remaining() is None
+
+
+def test_budget_runs_out():
+    with deadline(0.01):
+        time.sleep(0.02)
+        assert expired() and remaining() == 0
+
+
+def wait_until(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+def background_work_done(form):
+    return all(stats["depth"] == 0 and stats["running"] == 0 for stats in form.scheduler.stats().values())
+
+
+def test_slow_downloads_give_partial_results_and_finish_in_the_background(form, world, upstream):
+    load_world(form, world, stored=[])
+    regimen = world.regimen(3)
+    upstream.latency = 0.2
+    started = time.monotonic()
+    with deadline(0.1):
+        _, _, _, incomplete_drugs, missing_drugs = form.cached_check_regimen(regimen)
+    assert time.monotonic() - started < 1
+    assert incomplete_drugs and missing_drugs == []
+    assert form.regimen_cache.get(regimen, form.data_version()) is None  # Partial results aren't cached
+
+    upstream.latency = 0
+    assert wait_until(lambda: all(drug in form.interaction_graph.indexed_drugs for drug in incomplete_drugs))
+    _, _, interactions, incomplete_drugs, missing_drugs = form.check_regimen(regimen)
+    assert (incomplete_drugs, missing_drugs) == ([], [])
+
+
+def test_results_page_says_when_results_are_incomplete(form, client, world, upstream, monkeypatch):
+    load_world(form, world, stored=[])
+    monkeypatch.setattr(form, "FORM_REQUEST_DEADLINE", 0.05)
+    upstream.latency = 0.2
+    response = client.post("/form/", data={"drug_names": " ".join(world.regimen(3))})
+    assert "These results are incomplete" in response.get_data(as_text=True)
+    upstream.latency = 0
+    assert wait_until(lambda: background_work_done(form))  # Don't let it run into the next test's data
@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.fixture
+def expansion_mode(form, monkeypatch):
+    def set_mode(mode):
+        monkeypatch.setattr(form, "EXPANSION_MODE", mode)
+    return set_mode
+
+
+@pytest.mark.parametrize("size", [3, 6, 10])
+def test_pruned_and_brute_expansion_give_identical_results(form, world, expansion_mode, size):
+    regimen = world.regimen(size)
+    results = {}
+    for mode in ("brute", "pruned"):
+        expansion_mode(mode)
+        form.pair_memo.cache.clear()
+        results[mode] = form.check_regimen(regimen)
+    assert results["pruned"] == results["brute"]
+    assert results["brute"][2]
+
+
+def test_pruned_expansion_handles_self_interactions_and_repeats(form, world):
+    drug, partner = world.names[0], world.names[min(world.partners[0])]
+    form.interaction_graph.add_document(drug, [(drug, drug, "Self."), (drug, partner, "Pair.")])
+    other = next(name for index, name in enumerate(world.names) if index not in world.partners[0] and index != 0)
+    pairs = form.expand_interacting_pairs([drug, drug, partner, other], fetch=False)
+    assert (drug, drug) in pairs
+    assert tuple(sorted((drug, other))) in pairs
+    assert tuple(sorted((drug, partner))) in pairs
+
+
+def test_expansion_only_visits_interacting_pairs(form, world):
+    regimen = world.regimen(8)
+    interacting = {tuple(sorted(pair)) for pair in form.interaction_graph.regimen_interactions(regimen)}
+    assert form.expand_interacting_pairs(regimen, fetch=False) == interacting
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import generate_dataset
+from benchmarks.fixtures import INTERACTION_COLUMNS, SIMILAR_DRUG_COLUMNS
+
+
+def generated(tmp_path, name="out", drugs=120, **kwargs):
+    out_dir = str(tmp_path / name)
+    return out_dir, generate_dataset.generate(out_dir, drugs, **kwargs)
+
+
+def contents(out_dir):
+    """Relative path -> bytes of every file written to out_dir."""
+    files = {}
+    for directory, _, filenames in os.walk(out_dir):
+        for filename in filenames:
+            with open(os.path.join(directory, filename), "rb") as file:
+                files[os.path.relpath(os.path.join(directory, filename), out_dir)] = file.read()
+    return files
+
+
+def test_same_seed_gives_identical_files(tmp_path):
+    first, _ = generated(tmp_path, "first", seed=3)
+    second, _ = generated(tmp_path, "second", seed=3)
+    other, _ = generated(tmp_path, "other", seed=4)
+    assert contents(first) == contents(second)
+    assert contents(first) != contents(other)
+
+
+def test_block_size_does_not_change_the_output(tmp_path, monkeypatch):
+    whole, _ = generated(tmp_path, "whole")
+    monkeypatch.setattr(generate_dataset, "MATRIX_BLOCK_VALUES", 1000)  # A few rows per block
+    blocked, _ = generated(tmp_path, "blocked")
+    assert contents(whole) == contents(blocked)
+
+
+def test_similarity_matrix_is_symmetric_and_skewed_low(tmp_path):
+    out_dir, names = generated(tmp_path)
+    matrix = pd.read_csv(os.path.join(out_dir, "chem_similarity.csv"), index_col=0)
+    scores = matrix.to_numpy()
+    assert list(matrix.index) == list(matrix.columns) and len(matrix) == len(names)
+    assert np.array_equal(scores, scores.T)
+    assert (np.diag(scores) == 1.0).all()
+    off_diagonal = scores[~np.eye(len(scores), dtype=bool)]
+    assert off_diagonal.min() >= 0 and np.median(off_diagonal) < 0.3 < off_diagonal.max()
+
+
+def test_same_drug_rows_are_each_drugs_best_matrix_scores(tmp_path):
+    out_dir, names = generated(tmp_path)
+    scores = pd.read_csv(os.path.join(out_dir, "chem_similarity.csv"), index_col=0).to_numpy()
+    with open(os.path.join(out_dir, "SAME_DRUG.csv"), newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == SIMILAR_DRUG_COLUMNS and [row[0] for row in rows[1:]] == names
+    position = {name: index for index, name in enumerate(names)}
+    for index, row in enumerate(rows[1:]):
+        others = np.delete(scores[index], index)
+        expected = sorted(others, reverse=True)[:3]
+        assert [scores[index, position[name]] for name in row[1:]] == expected
+
+
+def test_interaction_tables_are_symmetric_and_in_pubchem_layout(tmp_path):
+    out_dir, names = generated(tmp_path, drugs=300, mean_degree=10)
+    partners = {}
+    for name in names:
+        with open(os.path.join(out_dir, "ddi", f"{name}.csv"), newline="") as file:
+            table = pd.read_csv(file)
+        assert list(table.columns) == INTERACTION_COLUMNS
+        assert (table["name"] == name).all() and table["descr"].notna().all()
+        partners[name] = set(table["name2"])
+    assert all(name in partners[partner] for name in names for partner in partners[name])
+    degrees = sorted(len(partners[name]) for name in names)
+    assert degrees[-1] > 4 * degrees[len(degrees) // 2]  # Power-law hubs
+
+
+def test_jsonl_documents_match_the_csv_tables(tmp_path):
+    out_dir, names = generated(tmp_path, drugs=50)
+    with open(os.path.join(out_dir, "interaction_files.jsonl")) as file:
+        documents = [json.loads(line) for line in file]
+    assert [document["drug_name"] for document in documents] == names
+    for document in documents:
+        with open(os.path.join(out_dir, "ddi", f"{document['drug_name']}.csv")) as file:
+            assert file.read() == document["content"]
+        assert next(csv.reader(io.StringIO(document["content"]))) == INTERACTION_COLUMNS
+
+
+def test_command_line_options(tmp_path):
+    out_dir = str(tmp_path / "cli")
+    generate_dataset.main([out_dir, "--drugs", "40", "--no-matrix", "--ddi", "jsonl"])
+    assert sorted(os.listdir(out_dir)) == ["SAME_DRUG.csv", "drug_names_ids.csv", "interaction_files.jsonl"]
+
+
+def test_app_reads_the_generated_matrix(form, tmp_path):
+    out_dir, names = generated(tmp_path)
+    filename = os.path.join(out_dir, "chem_similarity.csv")
+    neighbors = form.load_similarity_neighbors(filename)
+    scores = pd.read_csv(filename, index_col=0)
+    drugbank_id = scores.index[7]
+    top = form.get_top_similar_drugs(drugbank_id, neighbors)
+    assert [scores.loc[drugbank_id, column] for column in top] == sorted(scores.loc[drugbank_id].drop(drugbank_id), reverse=True)[:3]
@@ -0,0 +1,89 @@
+import datetime
+import random
+
+import numpy as np
+
+from Form.interaction_graph import GraphSnapshot, InteractionGraph, combo_interactions, gather_rows, pack_interaction_graph
+from Form.shared_index import Segment
+
+FETCHED_AT = datetime.datetime(2024, 1, 1)
+
+
+def snapshot_of(documents):
+    """Snapshot of {drug: rows}, every document fetched at FETCHED_AT."""
+    sections, metadata = pack_interaction_graph((drug_name, FETCHED_AT, rows) for drug_name, rows in documents.items())
+    return GraphSnapshot(Segment.from_sections(sections, metadata))
+
+
+def test_gather_rows_lists_every_entry_of_the_given_rows():
+    indptr = np.array([0, 2, 2, 5], dtype=np.int64)
+    positions, owners = gather_rows(indptr, np.array([2, 1, 0], dtype=np.int64))
+    assert positions.tolist() == [2, 3, 4, 0, 1]
+    assert owners.tolist() == [2, 2, 2, 0, 0]
+
+
+def test_gather_rows_of_no_rows_is_empty():
+    positions, owners = gather_rows(np.array([0, 3], dtype=np.int64), np.array([], dtype=np.int64))
+    assert positions.tolist() == [] and owners.tolist() == []
+
+
+def test_pair_descriptions_are_the_union_of_both_documents():
+    graph = InteractionGraph(snapshot_of({"a": [("a", "b", "from a")], "b": [("b", "a", "from b")]}))
+    assert graph.regimen_interactions(["a", "b"]) == {("a", "b"): ("from a", "from b")}
+
+
+def test_private_documents_override_the_snapshot_and_add_to_it():
+    graph = InteractionGraph(snapshot_of({"a": [("a", "b", "from a")], "b": [("b", "a", "old b")]}))
+    graph.add_document("b", [("b", "a", "new b")])
+    graph.add_document("c", [("c", "a", "from c")])
+    assert graph.regimen_interactions(["a", "b", "c"]) == {("a", "b"): ("from a", "new b"), ("a", "c"): ("from c",)}
+    assert graph.partners("a") == {"b", "c"}
+    assert dict(graph.document_partners()) == {"a": ["b"], "b": ["a"], "c": ["a"]}
+    assert len(graph.indexed_drugs) == 3 and "c" in graph.indexed_drugs
+
+
+def test_attach_drops_private_documents_the_snapshot_covers():
+    graph = InteractionGraph(snapshot_of({"a": [("a", "b", "old")]}))
+    graph.add_document("a", [("a", "b", "new")], fetched_at=FETCHED_AT)
+    graph.add_document("c", [("c", "a", "newer")], fetched_at=FETCHED_AT + datetime.timedelta(days=1))
+    graph.attach(snapshot_of({"a": [("a", "b", "new")], "c": [("c", "a", "older")]}))
+    assert graph.private_documents() == 1
+    assert graph.regimen_interactions(["a", "b", "c"]) == {("a", "b"): ("new",), ("a", "c"): ("newer",)}
+
+
+def test_empty_and_single_drug_regimens_have_no_interactions():
+    for graph in (InteractionGraph(), InteractionGraph(snapshot_of({"a": [("a", "b", "x")]}))):
+        assert graph.regimen_interactions([]) == {}
+        assert graph.partners_among([]) == {}
+        assert graph.regimen_interactions(["a"]) == {}
+
+
+def test_drugs_unknown_to_the_snapshot_are_ignored():
+    graph = InteractionGraph(snapshot_of({"a": [("a", "b", "x")]}))
+    assert graph.regimen_interactions(["a", "b", "unknown"]) == {("a", "b"): ("x",)}
+    assert "unknown" not in graph.indexed_drugs
+    assert "b" not in graph.indexed_drugs  # Named by a document but without its own
+
+
+def test_snapshot_lookup_matches_the_private_graph():
+    rng = random.Random(0)
+    names = [f"drug{i}" for i in range(60)]
+    documents = {}
+    for drug_name in names:
+        partners = rng.sample([name for name in names if name != drug_name], rng.randint(0, 6))
+        documents[drug_name] = [(drug_name, partner, f"{drug_name}-{partner}-{rng.randint(0, 2)}") for partner in partners]
+    shared = InteractionGraph(snapshot_of(documents))
+    private = InteractionGraph()
+    for drug_name, rows in documents.items():
+        private.add_document(drug_name, rows)
+    for _ in range(50):
+        # Includes the highest drug IDs, which searchsorted clips at the end of the regimen
+        regimen = rng.sample(names, rng.randint(0, 12)) + names[-1:]
+        assert shared.regimen_interactions(regimen) == private.regimen_interactions(regimen)
+        assert shared.partners_among(regimen) == private.partners_among(regimen)
+
+
+def test_combo_interactions_picks_the_combination_pairs():
+    found = {("a", "b"): ("x",), ("b", "c"): ("y", "z")}
+    assert combo_interactions(found, ["c", "b"]) == {(("b", "c"), "y"), (("b", "c"), "z")}
+    assert combo_interactions(found, []) == set()
@@ -0,0 +1,113 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from Form.jobs import JobRunner, JobStore
+
+
+def wait_for(runner, job_id, timeout=10):
+    end = time.monotonic() + timeout
+    while True:
+        job = runner.wait(job_id, timeout=0.2)
+        if job["status"] in ("done", "failed") or time.monotonic() > end:
+            return job
+
+
+def test_store_persists_jobs(tmp_path):
+    store = JobStore(str(tmp_path))
+    job = store.create(["a", "b"])
+    loaded = JobStore(str(tmp_path)).load(job["job_id"])
+    assert loaded == job
+    assert loaded["status"] == "queued" and loaded["missing_drugs"] == []
+    assert os.listdir(tmp_path) == [f"{job['job_id']}.json"]
+
+
+def test_store_rejects_job_ids_that_are_not_plain_names(tmp_path):
+    store = JobStore(str(tmp_path))
+    assert store.load("../etc/passwd") is None
+    assert store.load("unknown") is None
+
+
+def test_claim_is_exclusive_but_taken_over_from_a_dead_process(tmp_path):
+    store = JobStore(str(tmp_path))
+    job_id = store.create(["a"])["job_id"]
+    claim_path = os.path.join(str(tmp_path), f"{job_id}.claim")
+    with open(claim_path, "w") as file:
+        file.write(str(os.getppid()))
+    assert not store.claim(job_id)
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    with open(claim_path, "w") as file:
+        file.write(str(dead.pid))
+    assert store.claim(job_id)
+    store.release(job_id)
+    assert not os.path.exists(claim_path)
+
+
+def test_partial_results_are_visible_while_the_job_runs(tmp_path):
+    proceed = threading.Event()
+
+    def pipeline(job, publish):
+        job["interactions"].append({"combo": "a,b", "interactions": []})
+        publish()
+        proceed.wait(5)
+
+    runner = JobRunner(JobStore(str(tmp_path)), pipeline, max_workers=1)
+    job_id = runner.submit(["a", "b"])["job_id"]
+    partial = runner.wait(job_id, since=0, timeout=5)
+    assert partial["status"] == "running" and len(partial["interactions"]) == 1
+    proceed.set()
+    assert wait_for(runner, job_id)["status"] == "done"
+
+
+def test_failed_jobs_report_the_error(tmp_path):
+    def pipeline(job, publish):
+        raise RuntimeError("boom")
+
+    runner = JobRunner(JobStore(str(tmp_path)), pipeline, max_workers=1)
+    job = wait_for(runner, runner.submit(["a"])["job_id"])
+    assert (job["status"], job["message"]) == ("failed", "boom")
+
+
+def test_unfinished_jobs_are_resumed(tmp_path):
+    store = JobStore(str(tmp_path))
+    job = store.create(["a"])
+    job["status"] = "running"
+    store.save(job)
+    runner = JobRunner(store, lambda job, publish: None, max_workers=1)
+    runner.resume_unfinished()
+    assert wait_for(runner, job["job_id"])["status"] == "done"
+
+
+def run_job(client, drugs):
+    response = client.post("/form/jobs", json={"drugs": drugs})
+    assert response.status_code == 202
+    status_url = response.get_json()["status_url"]
+    for _ in range(50):
+        job = client.get(f"{status_url}?wait=1").get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+    raise AssertionError(f"job did not finish: {job}")
+
+
+def test_job_finds_the_regimen_interactions(form, client, world):
+    regimen = world.regimen(4)
+    job = run_job(client, regimen)
+    _, _, interactions, _, _ = form.check_regimen(regimen)
+    assert job["status"] == "done"
+    assert {entry["combo"] for entry in job["interactions"]} == {combo for combo, _ in interactions}
+    assert (job["missing_drugs"], job["incomplete_drugs"]) == ([], [])
+
+
+def test_job_lists_unresolved_drugs(client, world):
+    job = run_job(client, [world.names[1], "notadrug"])
+    assert job["missing_drugs"] == ["notadrug"]
+    assert job["message"]
+
+
+def test_job_lists_drugs_whose_data_could_not_be_fetched(client, world, unfetchable):
+    job = run_job(client, [unfetchable, world.names[1]])
+    assert job["status"] == "done"
+    assert job["missing_drugs"] == [unfetchable]
@@ -0,0 +1,73 @@
+import argparse
+import random
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from benchmarks import loadtest
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 0.5) == 51
+    assert loadtest.percentile(values, 0.99) == 100
+    assert loadtest.percentile([], 0.5) == 0.0
+
+
+def test_parse_mix():
+    assert loadtest.parse_mix("form_warm=3, simple=1") == {"form_warm": 3.0, "simple": 1.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        loadtest.parse_mix("form_warm=1,slow=2")
+
+
+def test_summarize_counts_errors_and_partial_results():
+    samples = [("form_warm", 0.010, 200, False), ("form_warm", 0.020, 200, True),
+               ("simple", 0.030, 500, False), ("simple", 0.040, None, False)]
+    summary = loadtest.summarize(samples, elapsed=2.0)
+    assert (summary["requests"], summary["errors"], summary["partial"], summary["rps"]) == (4, 2, 1, 2.0)
+    assert summary["p50_ms"] == pytest.approx(30) and summary["max_ms"] == pytest.approx(40)
+
+
+def load_test(form, world, stub, base_url, **overrides):
+    import SIMPLE.simpleChecker as simple
+    args = argparse.Namespace(seed=0, cold_fraction=0.1, unresolved_fraction=0.05, regimen_sizes=[2, 3], timeout=30,
+                              warmup=0, duration=0.5, mix=loadtest.parse_mix("form_warm=2,form_cold=1,simple=1"))
+    vars(args).update(overrides)
+    return loadtest.LoadTest(args, world, stub, base_url, form, simple)
+
+
+def test_requests_follow_their_scenario(form, world, upstream):
+    test = load_test(form, world, upstream, "http://unused")
+    rng = random.Random(0)
+    for _ in range(20):
+        _, path, kwargs = test.make_request("form_warm", rng)
+        drugs = kwargs["data"]["drug_names"].split()
+        assert path == "/form/" and all(world.names.index(name) in test.warm for name in drugs)
+        _, _, kwargs = test.make_request("form_cold", rng)
+        assert world.names.index(kwargs["data"]["drug_names"].split()[-1]) in test.cold
+        _, _, kwargs = test.make_request("form_unresolved", rng)
+        assert world.names.index(kwargs["data"]["drug_names"].split()[-1]) in test.unresolved
+        _, path, kwargs = test.make_request("simple", rng)
+        assert path == "/simpleChecker/check_interaction" and kwargs["json"]["drugs"]
+
+
+@pytest.fixture
+def served_app(client):
+    import app
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_run_reports_latency_throughput_and_upstream_calls(form, world, upstream, served_app):
+    test = load_test(form, world, upstream, served_app)
+    report = test.run(concurrency=2, latency=0.0, error_rate=0.0)
+    assert report["requests"] > 0 and report["errors"] == 0
+    assert report["rps"] > 0 and 0 < report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"] <= report["max_ms"]
+    assert sum(report["scenarios"][name]["requests"] for name in ("form_warm", "form_cold", "simple")) == report["requests"]
+    assert report["upstream_calls"]  # Cold drugs and SIMPLE checks download from the stub
+    # Each configuration starts from the same data: the cold drugs are missing again
+    test.reset()
+    assert form.collection.find_one({"drug_name": world.names[test.cold[0]]}) is None
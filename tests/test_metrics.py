@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from Form import metrics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORKING_SERVER = textwrap.dedent("""
+    import os
+    from Form import metrics
+
+    jobs = metrics.Counter("jobs_total", "Jobs run.", ["kind"])
+    busy = metrics.Gauge("busy_workers", "Workers busy.")
+    jobs.inc("a")
+    busy.set(1)
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:
+            jobs.inc("a", amount=10)
+            busy.set(1)
+            metrics.write_process_file()
+            os._exit(0)
+        os.waitpid(pid, 0)
+    print(metrics.render())
+""")
+
+
+def counter(value, labelvalues=()):
+    return {"type": "counter", "help": "Jobs run.", "labelnames": ["kind"][:len(labelvalues)], "mode": "sum",
+            "samples": [[list(labelvalues), value]]}
+
+
+def gauge(value, mode="sum"):
+    return {"type": "gauge", "help": "Workers busy.", "labelnames": [], "mode": mode, "samples": [[[], value]]}
+
+
+def write_process(directory, pid, snapshot):
+    with open(os.path.join(directory, f"{pid}-1.json"), "w") as file:
+        json.dump({"pid": pid, "metrics": snapshot}, file)
+
+
+def test_scrape_merges_every_process_of_the_directory(tmp_path):
+    env = dict(os.environ, METRICS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=REPO_ROOT)
+    output = subprocess.run([sys.executable, "-c", FORKING_SERVER], env=env, cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    # Forked children start from zero instead of reporting their parent's count again
+    assert 'jobs_total{kind="a"} 21' in output
+    # The exited children's gauges no longer count
+    assert "busy_workers{} 1" in output
+    assert "worker=" not in output
+
+
+def test_counters_sum_and_gauges_follow_their_mode():
+    merged = metrics.merge([
+        ({"jobs_total": counter(2, ["a"]), "busy": gauge(1), "ratio": gauge(0.5, "mean")}, True),
+        ({"jobs_total": counter(3, ["a"]), "busy": gauge(1), "ratio": gauge(1.0, "mean")}, True),
+        ({"jobs_total": counter(4, ["b"]), "busy": gauge(1), "ratio": gauge(0.0, "mean")}, False),
+    ])
+    assert sorted((tuple(labels), value) for labels, value in merged["jobs_total"]["samples"]) == [(("a",), 5), (("b",), 4)]
+    assert merged["busy"]["samples"] == [[[], 2]]
+    assert merged["ratio"]["samples"] == [[[], 0.75]]
+
+
+def test_histograms_merge_bucket_by_bucket():
+    histogram = metrics.Histogram("merge_test_seconds", "Test latency.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    snapshot = {histogram.name: histogram.snapshot()}
+    lines = metrics._render_metric(histogram.name, metrics.merge([(snapshot, True), (snapshot, False)])[histogram.name])
+    assert 'merge_test_seconds_bucket{le="0.1"} 2' in lines
+    assert 'merge_test_seconds_bucket{le="1"} 4' in lines
+    assert 'merge_test_seconds_bucket{le="+Inf"} 4' in lines
+    assert "merge_test_seconds_sum{} 1.1" in lines
+    assert "merge_test_seconds_count{} 4" in lines
+
+
+def test_dead_process_counters_survive_compaction(tmp_path):
+    directory = str(tmp_path)
+    write_process(directory, os.getpid(), {"jobs_total": counter(1), "busy_workers": gauge(1)})
+    dead = int(subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True).stdout)
+    write_process(directory, dead, {"jobs_total": counter(5), "busy_workers": gauge(1)})
+
+    def scrape():
+        return metrics.merge(metrics.read_process_files(directory))
+
+    before = scrape()
+    assert before["jobs_total"]["samples"] == [[[], 6]]
+    assert before["busy_workers"]["samples"] == [[[], 1]]  # The dead process's gauge is ignored
+    metrics.mark_process_dead(dead, directory)
+    assert not os.path.exists(os.path.join(directory, f"{dead}-1.json"))
+    assert scrape() == before
+    with open(os.path.join(directory, metrics.ARCHIVE_FILE)) as file:
+        assert "busy_workers" not in json.load(file)["metrics"]
+
+
+def test_a_file_already_in_the_archive_is_not_counted_twice(tmp_path):
+    directory = str(tmp_path)
+    write_process(directory, 12345678, {"jobs_total": counter(5)})
+    archive = {"merged": ["12345678-1.json"], "metrics": {"jobs_total": counter(5)}}
+    with open(os.path.join(directory, metrics.ARCHIVE_FILE), "w") as file:
+        json.dump(archive, file)
+    assert metrics.merge(metrics.read_process_files(directory))["jobs_total"]["samples"] == [[[], 5]]
+
+
+def test_metrics_endpoint_serves_unlabelled_series(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    assert "# TYPE form_stage_seconds histogram" in body
+    assert "worker=" not in body
@@ -0,0 +1,60 @@
+import itertools
+
+
+def test_ranked_combinations_come_input_pairs_first(form):
+    pairs = list(form.iter_ranked_combinations(["a", "b"], {"a": ["c"], "b": ["d"]}))
+    assert pairs == [("a", "b"), ("a", "c"), ("a", "d"), ("b", "c"), ("b", "d"), ("c", "d")]
+
+
+def test_ranked_combinations_skip_repeated_pairs(form):
+    pairs = list(form.iter_ranked_combinations(["a", "b"], {"a": ["b"], "b": ["a"]}))
+    assert pairs == [("a", "b"), ("a", "a"), ("b", "b")]
+
+
+def test_ranked_combinations_are_generated_lazily(form):
+    names = [f"drug{i}" for i in range(5000)]
+    pairs = form.iter_ranked_combinations(names, {name: names for name in names})
+    assert list(itertools.islice(pairs, 2)) == [("drug0", "drug1"), ("drug0", "drug2")]
+
+
+def all_interactions(form, regimen, similar_drugs_info):
+    return [(combo, results) for combo, results in form.iter_combination_interactions(regimen, similar_drugs_info) if results]
+
+
+def test_pages_cover_the_whole_stream_once(form, world):
+    regimen = world.regimen(5)
+    similar_drugs_info = form.resolve_similar_drugs(regimen)
+    pages, cursor = [], 0
+    while cursor is not None:
+        interactions, cursor = form.check_combinations_page(regimen, similar_drugs_info, cursor, page_size=7)
+        pages.extend(interactions)
+    assert pages == all_interactions(form, regimen, similar_drugs_info)
+    assert pages
+
+
+def test_page_stops_after_max_interactions(form, world):
+    regimen = world.regimen(5)
+    similar_drugs_info = form.resolve_similar_drugs(regimen)
+    expected = all_interactions(form, regimen, similar_drugs_info)
+    first, cursor = form.check_combinations_page(regimen, similar_drugs_info, max_interactions=2)
+    rest, end = form.check_combinations_page(regimen, similar_drugs_info, cursor)
+    assert first == expected[:2]
+    assert first + rest == expected
+    assert end is None
+
+
+def test_first_page_only_downloads_the_drugs_it_covers(form, world, upstream):
+    from benchmarks.run import load_world
+    load_world(form, world, stored=[])
+    regimen = world.regimen(6)
+    similar_drugs_info = form.resolve_similar_drugs(regimen)
+    upstream.reset_counts()
+    form.check_combinations_page(regimen, similar_drugs_info, page_size=1)
+    assert upstream.calls.get("pubchem_ddi") == 2
+
+
+def test_paged_form_links_the_next_page(client, world):
+    regimen = world.regimen(4)
+    response = client.post("/form/", data={"drug_names": " ".join(regimen), "page_size": "3"})
+    assert response.status_code == 200
+    assert b'name="cursor" value="3"' in response.data
@@ -0,0 +1,126 @@
+import gc
+import json
+import multiprocessing
+import os
+import runpy
+import threading
+import time
+
+import pytest
+
+from Form import file_index, metrics
+from Form.file_index import FileIndex, load_indexed
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingBuild:
+    def __init__(self, delay=0.0):
+        self.calls, self.delay = 0, delay
+
+    def __call__(self, filename):
+        self.calls += 1
+        time.sleep(self.delay)
+        with open(filename) as file:
+            return file.read()
+
+
+def test_file_index_rebuilds_only_when_the_file_changes(tmp_path):
+    filename = tmp_path / "data.csv"
+    filename.write_text("a\n")
+    build = CountingBuild()
+    index = FileIndex(str(filename), build)
+    assert index.get() == "a\n" and index.get() == "a\n"
+    assert build.calls == 1
+    filename.write_text("a\nb\n")
+    assert index.get() == "a\nb\n" and build.calls == 2
+
+
+def test_file_index_of_a_missing_file_is_none(tmp_path):
+    assert FileIndex(str(tmp_path / "missing.csv"), CountingBuild()).get() is None
+
+
+def test_concurrent_lookups_build_once(tmp_path):
+    filename = tmp_path / "data.csv"
+    filename.write_text("a\n")
+    build = CountingBuild(delay=0.05)
+    index = FileIndex(str(filename), build)
+    threads = [threading.Thread(target=index.get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert build.calls == 1
+
+
+def test_load_indexed_keeps_one_index_per_file_and_builder(tmp_path):
+    filename = tmp_path / "data.csv"
+    filename.write_text("a\n")
+    first, second = CountingBuild(), CountingBuild()
+    for _ in range(3):
+        load_indexed(str(filename), first)
+        load_indexed(str(filename), second)
+    assert (first.calls, second.calls) == (1, 1)
+
+
+def lookup_without_building(form, drug_name, results):
+    # Any rebuild in the child would now fail: it must answer from what the parent preloaded
+    for (filename, _), index in file_index._indexes.items():
+        if filename in ("SAME_DRUG.csv", "drug_names_ids.csv"):
+            index.build = None
+    results.put((form.are_similar_drugs_present(drug_name), form.is_drug_in_csv(drug_name)))
+
+
+def test_preloaded_indexes_serve_forked_workers(form, world):
+    form.preload_indexes()
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    child = context.Process(target=lookup_without_building, args=(form, world.names[5], results))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    assert results.get(timeout=1) == (True, True)
+
+
+@pytest.fixture
+def gunicorn_conf(tmp_path, monkeypatch):
+    """gunicorn.conf.py's settings and hooks, with the metrics directory under tmp_path."""
+    monkeypatch.setenv("FORM_PREFORK", "1")
+    monkeypatch.setenv("METRICS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+    return runpy.run_path(os.path.join(REPO_ROOT, "gunicorn.conf.py"))
+
+
+class Server:
+    class log:
+        @staticmethod
+        def info(*args):
+            pass
+
+
+def test_when_ready_preloads_and_freezes(form, world, gunicorn_conf):
+    try:
+        gunicorn_conf["when_ready"](Server())
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert gunicorn_conf["preload_app"] and gunicorn_conf["worker_class"] == "gthread"
+
+
+def test_starting_clears_a_previous_runs_metrics(tmp_path, gunicorn_conf):
+    for name in ("1-1.json", metrics.ARCHIVE_FILE, f"{os.getpid()}-1.json"):
+        (tmp_path / name).write_text("{}")
+    gunicorn_conf["on_starting"](Server())
+    assert os.listdir(tmp_path) == [f"{os.getpid()}-1.json"]
+
+
+def test_child_exit_archives_the_workers_metrics(tmp_path, gunicorn_conf):
+    snapshot = {"jobs_total": {"type": "counter", "help": "Jobs.", "labelnames": [], "mode": "sum", "samples": [[[], 3]]}}
+    (tmp_path / "4242-1.json").write_text(json.dumps({"pid": 4242, "metrics": snapshot}))
+
+    class Worker:
+        pid = 4242
+
+    gunicorn_conf["child_exit"](Server(), Worker())
+    assert sorted(os.listdir(tmp_path)) == [metrics.ARCHIVE_FILE]
+    assert metrics.merge(metrics.read_process_files(str(tmp_path)))["jobs_total"]["samples"] == [[[], 3]]
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from Form import profiling
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", TOKEN)
+    return TOKEN
+
+
+def post_regimen(client, world, query="", headers=None):
+    return client.post(f"/form/{query}", data={"drug_names": " ".join(world.regimen(3))}, headers=headers or {})
+
+
+def test_header_token_profiles_the_request(client, world, token):
+    response = post_regimen(client, world, "?profile=sampling", {"X-Profile-Token": token})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+    profile = client.get(f"/form/profiles/{profile_id}", headers={"X-Profile-Token": token}).get_json()
+    assert profile["mode"] == "sampling" and profile["path"] == "/form/"
+    assert "collapsed_stacks" in profile
+
+
+def test_unknown_mode_falls_back_to_cprofile(client, world, token):
+    response = post_regimen(client, world, headers={"X-Profile-Token": token, "X-Profile": "flamegraph"})
+    profile = client.get(f"/form/profiles/{response.headers['X-Profile-Id']}", headers={"X-Profile-Token": token}).get_json()
+    assert profile["mode"] == "cprofile"
+    assert any("check_regimen" in row["function"] for row in profile["top_functions"])
+
+
+def test_query_string_token_is_ignored(client, world, token):
+    response = post_regimen(client, world, f"?profile=cprofile&profile_token={token}")
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert client.get(f"/form/profiles/anything?profile_token={token}").status_code == 403
+
+
+def test_wrong_or_unset_token_does_not_profile(client, world, token, monkeypatch):
+    assert "X-Profile-Id" not in post_regimen(client, world, "?profile=cprofile", {"X-Profile-Token": "guess"}).headers
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", None)
+    assert "X-Profile-Id" not in post_regimen(client, world, "?profile=cprofile", {"X-Profile-Token": ""}).headers
+    assert client.get("/form/profiles/anything", headers={"X-Profile-Token": ""}).status_code == 403
+
+
+def test_unknown_profiles(client, token):
+    headers = {"X-Profile-Token": token}
+    assert client.get("/form/profiles/0123abcd", headers=headers).status_code == 404
+    assert profiling.load_profile("../secrets") is None
+
+
+def test_stack_sampler_attributes_time_to_the_busy_function():
+    def busy_wait():
+        deadline = time.perf_counter() + 0.2
+        while time.perf_counter() < deadline:
+            pass
+
+    with profiling.StackSampler(threading.get_ident(), interval=0.002) as sampler:
+        busy_wait()
+    summary = sampler.summary()
+    assert summary["samples"] > 10
+    busy = next(row for row in summary["top_functions"] if row["function"].startswith("busy_wait "))
+    assert busy["fraction"] > 0.8
+    assert all(stack.rsplit(" ", 1)[1].isdigit() for stack in summary["collapsed_stacks"])
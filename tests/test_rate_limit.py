@@ -0,0 +1,50 @@
+import multiprocessing
+import time
+
+from Form.rate_limit import TokenBucket
+
+
+def test_burst_is_free_then_requests_are_paced(tmp_path):
+    bucket = TokenBucket("pubchem", rate=20, burst=3, path=str(tmp_path / "buckets.sqlite3"))
+    started = time.monotonic()
+    for _ in range(3):
+        assert bucket.acquire()
+    assert time.monotonic() - started < 0.04
+    for _ in range(4):
+        assert bucket.acquire()
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+
+
+def test_acquire_gives_up_when_the_wait_exceeds_the_timeout(tmp_path):
+    bucket = TokenBucket("pubchem", rate=1, burst=1, path=str(tmp_path / "buckets.sqlite3"))
+    assert bucket.acquire(timeout=0)
+    started = time.monotonic()
+    assert not bucket.acquire(timeout=0.1)
+    assert time.monotonic() - started < 0.1
+
+
+def test_upstreams_have_separate_budgets(tmp_path):
+    path = str(tmp_path / "buckets.sqlite3")
+    assert TokenBucket("pubchem", rate=1, burst=1, path=path).acquire(timeout=0)
+    assert TokenBucket("chembl", rate=1, burst=1, path=path).acquire(timeout=0)
+
+
+def take_tokens(path, count):
+    bucket = TokenBucket("pubchem", rate=20, burst=1, path=path)
+    for _ in range(count):
+        bucket.acquire()
+
+
+def test_processes_on_the_host_share_one_budget(tmp_path):
+    path = str(tmp_path / "buckets.sqlite3")
+    TokenBucket("pubchem", rate=20, burst=1, path=path)
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=take_tokens, args=(path, 4)) for _ in range(3)]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    # 12 tokens at 20/s with a burst of 1: at least 11 waits of 50 ms, whichever process takes them
+    assert time.monotonic() - started >= 11 / 20 * 0.9
+    assert all(worker.exitcode == 0 for worker in workers)
@@ -0,0 +1,81 @@
+import datetime
+import time
+
+import pytest
+
+
+def wait_for_refreshes(form, timeout=10):
+    end = time.monotonic() + timeout
+    while form.pending_refreshes and time.monotonic() < end:
+        time.sleep(0.01)
+    assert not form.pending_refreshes
+
+
+def test_is_stale(form, monkeypatch):
+    monkeypatch.setattr(form, "INTERACTION_DATA_TTL", 60)
+    now = form.utcnow()
+    assert form.is_stale(None)
+    assert not form.is_stale(now)
+    assert form.is_stale(now - datetime.timedelta(seconds=61))
+    assert not form.is_stale(now - datetime.timedelta(seconds=61), max_age=120)
+
+
+@pytest.mark.parametrize("window, inside, outside", [("2-5", [2, 4], [1, 5, 12]), ("22-3", [22, 23, 0, 2], [3, 12, 21])])
+def test_refresh_window(form, monkeypatch, window, inside, outside):
+    monkeypatch.setattr(form, "REFRESH_WINDOW", window)
+    assert all(form.in_refresh_window(hour) for hour in inside)
+    assert not any(form.in_refresh_window(hour) for hour in outside)
+
+
+def test_stale_data_is_served_at_once_and_refreshed_in_the_background(form, world, upstream, monkeypatch):
+    drug_name = world.names[0]
+    stored = form.collection.find_one({"drug_name": drug_name})
+    form.collection.update_one({"_id": stored["_id"]}, {"$set": {"content": stored["content"].splitlines()[0]}})
+    monkeypatch.setattr(form, "INTERACTION_DATA_TTL", 0)
+    version = form.interaction_data_version()
+    upstream.latency = 0.3
+    upstream.reset_counts()
+
+    started = time.perf_counter()
+    interactions = form.search_interactions_for_regimen([drug_name, world.names[min(world.partners[0])]])
+    assert time.perf_counter() - started < 0.3  # Served from the indexed copy, not the download
+    assert interactions
+
+    wait_for_refreshes(form)
+    assert upstream.calls["pubchem_ddi"] == 2  # Both drugs were stale
+    refreshed = form.collection.find_one({"drug_name": drug_name})
+    assert refreshed["fetched_at"] > stored["fetched_at"]
+    assert refreshed["content"] == stored["content"]
+    assert form.interaction_graph.fetched_at(drug_name) == refreshed["fetched_at"]
+    assert form.interaction_data_version() == version + 1  # Only the first drug's data changed
+
+
+def test_one_refresh_per_drug_at_a_time(form, world, upstream, monkeypatch):
+    monkeypatch.setattr(form, "INTERACTION_DATA_TTL", 0)
+    upstream.latency = 0.1
+    upstream.reset_counts()
+    for _ in range(5):
+        form.note_drug_request(world.names[0])
+    wait_for_refreshes(form)
+    assert upstream.calls["pubchem_ddi"] == 1
+
+
+def test_request_counts_are_flushed_to_the_documents(form, world):
+    form.drug_request_counts.clear()  # Left over from earlier tests' requests
+    for _ in range(3):
+        form.note_drug_request(world.names[1])
+    form.flush_request_counts()
+    assert form.collection.find_one({"drug_name": world.names[1]})["request_count"] == 3
+    assert not form.drug_request_counts
+
+
+def test_off_peak_refresh_picks_the_most_requested_old_drugs(form, world, monkeypatch):
+    old = form.utcnow() - datetime.timedelta(seconds=form.INTERACTION_DATA_TTL)
+    for index, count in [(1, 10), (2, 30), (3, 20), (4, 40)]:
+        fetched_at = old if index != 4 else form.utcnow()  # Drug 4 is popular but fresh
+        form.collection.update_one({"drug_name": world.names[index]}, {"$set": {"request_count": count, "fetched_at": fetched_at}})
+    scheduled = []
+    monkeypatch.setattr(form, "schedule_refresh", lambda drug_name, max_age=None: scheduled.append(drug_name))
+    monkeypatch.setattr(form, "REFRESH_TOP_N", 2)
+    form.refresh_popular_drugs()
+    assert scheduled == [world.names[2], world.names[3]]
@@ -0,0 +1,99 @@
+import httpx
+import pytest
+
+from Form.replay import RecordReplayTransport, ReplayMiss, ResponseArchive, replay_transport, request_key
+from Form.upstream import UpstreamClient
+
+
+class Upstream(httpx.MockTransport):
+    """Answers every request with `status` and a body naming the call, counting requests."""
+
+    def __init__(self, status=200):
+        self.status, self.calls = status, 0
+        super().__init__(self.respond)
+
+    def respond(self, request):
+        self.calls += 1
+        return httpx.Response(self.status, text=f"answer {self.calls}", headers={"Content-Type": "text/csv", "X-Other": "1"})
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return ResponseArchive(str(tmp_path / "archive" / "upstream.sqlite3"))
+
+
+def get(transport, url="http://upstream.test/data?b=2&a=1"):
+    with httpx.Client(transport=transport) as client:
+        return client.get(url)
+
+
+def test_request_key_normalizes_equivalent_requests():
+    key = request_key("get", 'HTTP://PubChem.test:80/a%20b?query={"b": 1, "a": [2]}&cid=5')
+    assert key == request_key("GET", 'http://pubchem.test/a b?cid=5&query={"a":[2],"b":1}')
+    assert key != request_key("GET", 'http://pubchem.test:8080/a b?cid=5&query={"a":[2],"b":1}')
+    assert key != request_key("POST", 'http://pubchem.test/a b?cid=5&query={"a":[2],"b":1}')
+    assert request_key("GET", "http://x.test/p?q=") != request_key("GET", "http://x.test/p")
+
+
+def test_archive_round_trip(archive):
+    response = httpx.Response(404, text="not found", headers={"Content-Type": "text/plain", "Set-Cookie": "x"})
+    archive.put("GET http://x.test/", response)
+    replayed = archive.get("GET http://x.test/")
+    assert (replayed.status_code, replayed.text) == (404, "not found")
+    assert replayed.headers["content-type"] == "text/plain" and "set-cookie" not in replayed.headers
+    assert replayed.headers["X-Upstream-Replay"] == "1"
+    assert archive.get("GET http://y.test/") is None
+    assert len(archive) == 1
+
+
+def test_record_fetches_every_time_and_archives(archive):
+    upstream = Upstream()
+    transport = RecordReplayTransport(archive, "record", upstream)
+    get(transport)
+    assert get(transport).text == "answer 2"
+    assert archive.get(request_key("GET", "http://upstream.test/data?a=1&b=2")).text == "answer 2"
+
+
+def test_replay_answers_from_the_archive_only(archive):
+    get(RecordReplayTransport(archive, "record", Upstream()))
+    upstream = Upstream()
+    transport = RecordReplayTransport(archive, "replay", upstream)
+    assert get(transport, "http://upstream.test/data?a=1&b=2").text == "answer 1"
+    with pytest.raises(ReplayMiss):
+        get(transport, "http://upstream.test/other")
+    assert upstream.calls == 0
+
+
+def test_record_missing_fetches_only_what_is_not_archived(archive):
+    upstream = Upstream()
+    transport = RecordReplayTransport(archive, "record-missing", upstream)
+    assert [get(transport).text for _ in range(3)] == ["answer 1"] * 3
+    assert get(transport, "http://upstream.test/other").text == "answer 2"
+    assert upstream.calls == 2
+
+
+def test_outages_and_throttling_are_not_archived(archive):
+    for status in (503, 429):
+        transport = RecordReplayTransport(archive, "record", Upstream(status))
+        assert get(transport).status_code == status
+    assert len(archive) == 0
+    get(RecordReplayTransport(archive, "off", Upstream()))
+    assert len(archive) == 0
+
+
+def test_unknown_modes_are_rejected(archive, tmp_path):
+    with pytest.raises(ValueError):
+        RecordReplayTransport(archive, "sometimes")
+    assert replay_transport("off", str(tmp_path / "unused.sqlite3")) is None
+
+
+def test_fallback_replays_while_the_upstream_is_down(archive):
+    upstream = Upstream()
+    transport = RecordReplayTransport(archive, "fallback", upstream)
+    client = UpstreamClient("test", "http://upstream.test", retries=0, transport=transport)
+    assert client.get("/data", params={"a": "1"}).text == "answer 1"
+    upstream.status = 503
+    response = client.get("/data", params={"a": "1"})
+    assert (response.status_code, response.text) == (200, "answer 1")
+    assert response.headers["X-Upstream-Replay"] == "1"
+    assert upstream.calls == 2
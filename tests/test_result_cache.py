@@ -0,0 +1,134 @@
+import time
+
+from benchmarks import memory_mongo
+from Form.result_cache import LRUCache, PairMemo, ResultCache, normalize_regimen
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1, "hit_ratio": 0.75}
+
+
+def test_normalized_regimens_ignore_order_and_whitespace_only():
+    assert normalize_regimen([" b", "a", ""]) == normalize_regimen(["a", "b "]) == ["a", "b"]
+    assert normalize_regimen(["a", "a", "b"]) != normalize_regimen(["a", "b"])
+    assert normalize_regimen(["Aspirin"]) != normalize_regimen(["aspirin"])
+
+
+def test_keys_change_with_the_data_version():
+    cache = ResultCache("test")
+    assert cache.key(["a", "b"], "1") == cache.key(["b", "a"], "1")
+    assert cache.key(["a", "b"], "1") != cache.key(["a", "b"], "2")
+    assert cache.key(["a", "a", "b"], "1") != cache.key(["a", "b"], "1")
+
+
+def test_a_new_version_drops_the_local_tier():
+    cache = ResultCache("test")
+    cache.set(["a"], "1", {"result": 1})
+    assert cache.get(["a"], "1") == {"result": 1}
+    assert cache.get(["a"], "2") is None
+    assert cache.get(["a"], "1") is None
+    assert cache.local.stats()["size"] == 0
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResultCache("test", ttl=0.05)
+    cache.set(["a"], "1", "value")
+    assert cache.get(["a"], "1") == "value"
+    time.sleep(0.06)
+    assert cache.get(["a"], "1") is None
+
+
+def test_shared_tier_serves_other_processes():
+    collection = memory_mongo.MemoryMongoClient()["test"]["regimen_cache"]
+    ResultCache("test", shared_collection=collection).set(["a", "b"], "1", {"result": 1})
+    other = ResultCache("test", shared_collection=collection)
+    assert other.get(["b", "a"], "1") == {"result": 1}
+    assert other.stats()["shared_hits"] == 1
+
+
+def test_form_serves_a_reordered_regimen_from_the_cache(form, world):
+    regimen = world.regimen(3)
+    first = form.cached_check_regimen(regimen)
+    hits = form.regimen_cache.stats()["hits"]
+    second = form.cached_check_regimen(list(reversed(regimen)))
+    assert form.regimen_cache.stats()["hits"] == hits + 1
+    assert second[1:] == first[1:]
+    assert list(second[0]) == list(reversed(regimen))
+
+
+def test_form_does_not_serve_a_repeated_drug_from_the_plain_regimen(form, world):
+    regimen = world.regimen(2)
+    form.cached_check_regimen(regimen)
+    combinations = form.cached_check_regimen([regimen[0]] + regimen)[1]
+    assert f"{regimen[0]},{regimen[0]}" in combinations
+
+
+def test_form_does_not_cache_results_with_missing_drugs(form, world, unfetchable):
+    regimen = [unfetchable, world.names[1]]
+    assert form.cached_check_regimen(regimen)[4] == [unfetchable]
+    assert form.regimen_cache.get(regimen, form.data_version()) is None
+
+
+def test_pair_memo_is_keyed_by_pair_and_versions():
+    memo = PairMemo(10)
+    memo.set(["b", "a"], {"a": 1, "b": 1}, {"x"})
+    assert memo.get(["a", "b"], {"a": 1, "b": 1}) == {"x"}
+    assert memo.get(["a", "b"], {"a": 1, "b": 2}) is None
+    assert memo.get(["a", "b"], {"a": 1}) is None
+
+
+def test_pair_memo_hands_out_copies():
+    memo = PairMemo(10)
+    memo.set(["a", "b"], {"a": 1, "b": 1}, {"x"})
+    memo.get(["a", "b"], {"a": 1, "b": 1}).add("y")
+    assert memo.get(["a", "b"], {"a": 1, "b": 1}) == {"x"}
+
+
+def test_pair_memo_never_memoizes_unversioned_drugs():
+    memo = PairMemo(10)
+    memo.set(["a", "b"], {"a": 1}, {"x"})
+    assert memo.stats()["size"] == 0
+
+
+def test_pair_memo_is_bounded():
+    memo = PairMemo(2)
+    for i in range(5):
+        memo.set(["a", str(i)], {"a": 1, str(i): 1}, set())
+    assert memo.stats()["size"] == 2
+
+
+def test_repeated_pair_checks_hit_the_memo(form, world):
+    drugs = [world.names[0], world.names[min(world.partners[0])]]
+    first = form.search_interactions_for_drugs(drugs)
+    hits = form.pair_memo.stats()["hits"]
+    assert form.search_interactions_for_drugs(list(reversed(drugs))) == first
+    assert form.pair_memo.stats()["hits"] == hits + 1
+    assert first
+
+
+def test_new_data_for_a_drug_retires_its_memo_entries(form, world):
+    drugs = [world.names[0], world.names[min(world.partners[0])]]
+    form.search_interactions_for_drugs(drugs)
+    document = world.document(0)
+    document["fetched_at"] = form.utcnow()
+    form.index_document(document)
+    assert form.pair_memo.get(drugs, form.drug_versions(drugs)) is None
+
+
+def test_paged_checks_of_memoized_pairs_skip_the_graph(form, world, monkeypatch):
+    regimen = world.regimen(4)
+    similar_drugs_info = form.resolve_similar_drugs(regimen)
+    first = list(form.iter_combination_interactions(regimen, similar_drugs_info))
+
+    def unexpected_search(drugs, pending=None):
+        raise AssertionError("memoized pairs were searched again")
+
+    monkeypatch.setattr(form, "search_interactions_for_regimen", unexpected_search)
+    assert list(form.iter_combination_interactions(regimen, similar_drugs_info)) == first
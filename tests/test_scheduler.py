@@ -0,0 +1,107 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from Form.deadline import DeadlineExceeded, deadline
+from Form.scheduler import BATCH, INTERACTIVE, PriorityScheduler, priority, run_inline
+
+
+def blocked(scheduler):
+    """Occupy the scheduler's only worker until the returned event is set."""
+    release, started = threading.Event(), threading.Event()
+    scheduler.submit(lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    return release
+
+
+def test_run_returns_the_result_or_raises():
+    scheduler = PriorityScheduler(workers=2)
+    assert scheduler.run(lambda x: x * 2, 21) == 42
+    with pytest.raises(ZeroDivisionError):
+        scheduler.run(lambda: 1 / 0)
+
+
+def test_tasks_calling_tasks_run_inline():
+    scheduler = PriorityScheduler(workers=1)
+
+    @scheduler.task
+    def inner():
+        return threading.current_thread().name
+
+    @scheduler.task
+    def outer():
+        return threading.current_thread().name, inner()
+
+    outer_thread, inner_thread = outer()
+    assert outer_thread == inner_thread == "scheduler-0"
+
+
+def test_run_inline_uses_the_calling_thread():
+    scheduler = PriorityScheduler(workers=1)
+    with run_inline():
+        assert scheduler.run(lambda: threading.current_thread()) is threading.current_thread()
+
+
+def test_interactive_work_goes_before_queued_batch_work():
+    scheduler = PriorityScheduler(workers=1)
+    release = blocked(scheduler)
+    order = []
+    futures = []
+    for name in (BATCH, BATCH, BATCH, INTERACTIVE, INTERACTIVE, INTERACTIVE):
+        with priority(name):
+            futures.append(scheduler.submit(order.append, name))
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order[0] == INTERACTIVE
+    assert order.index(BATCH) > 0 and order[-1] == BATCH
+
+
+def test_class_limits_cap_concurrency():
+    scheduler = PriorityScheduler(workers=3, limits={BATCH: 1})
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def work():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    with priority(BATCH):
+        futures = [scheduler.submit(work) for _ in range(4)]
+    for future in futures:
+        future.result(5)
+    assert peak[0] == 1
+    assert scheduler.stats()[BATCH]["completed"] == 4
+
+
+def test_deadline_drops_work_still_queued():
+    scheduler = PriorityScheduler(workers=1)
+    release = blocked(scheduler)
+    ran = []
+    with deadline(0.05), pytest.raises(DeadlineExceeded):
+        scheduler.run(ran.append, 1)
+    release.set()
+    scheduler.run(lambda: None)  # Everything queued before it has been handled by now
+    assert ran == []
+
+
+def run_in_child(scheduler, results):
+    results.put(scheduler.run(lambda: "child"))
+
+
+def test_scheduler_works_in_a_forked_child():
+    scheduler = PriorityScheduler(workers=2)
+    assert scheduler.run(lambda: "parent") == "parent"  # Parent workers now wait on the condition
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    child = context.Process(target=run_in_child, args=(scheduler, results))
+    child.start()
+    child.join(10)
+    if child.is_alive():
+        child.kill()
+    assert results.get(timeout=1) == "child"
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Form import shared_index
+from Form.shared_index import (EMPTY_SLOT, SEGMENT_ALIGNMENT, Segment, StringListMap, StringTable, TopNeighbors, derived_segment,
+                               file_signature, pack_string_lists, pack_strings, pack_top_neighbors, write_segment)
+
+SECTIONS = {
+    "ints": np.arange(10, dtype=np.int64),
+    "bytes": np.frombuffer(b"abc", dtype=np.uint8),
+    "floats": np.array([[1.5, 2.5], [3.5, 4.5]], dtype=np.float32).ravel(),
+    "empty": np.zeros(0, dtype=np.int32),
+}
+
+
+def opened(tmp_path, sections=SECTIONS, metadata=None):
+    filename = str(tmp_path / "index" / "test.idx")
+    write_segment(filename, sections, metadata)
+    return Segment.open(filename)
+
+
+def test_segment_round_trips_arrays_and_metadata(tmp_path):
+    for segment in (opened(tmp_path, metadata={"k": 3}), Segment.from_sections(SECTIONS, {"k": 3})):
+        assert segment.metadata == {"k": 3}
+        for name, array in SECTIONS.items():
+            assert segment[name].dtype == array.dtype and np.array_equal(segment[name], array)
+            assert not segment[name].flags.writeable
+        assert "empty" in segment.arrays and len(segment["empty"]) == 0
+
+
+def test_mapped_arrays_are_aligned(tmp_path):
+    segment = opened(tmp_path)
+    for array in segment.arrays.values():
+        assert array.__array_interface__["data"][0] % SEGMENT_ALIGNMENT == 0
+
+
+def test_a_mapping_survives_its_file_being_replaced(tmp_path):
+    segment = opened(tmp_path)
+    replacement = opened(tmp_path, {"ints": np.zeros(3, dtype=np.int64)})
+    assert segment["ints"].tolist() == list(range(10))
+    assert replacement["ints"].tolist() == [0, 0, 0]
+    assert segment.signature != replacement.signature
+
+
+def test_other_files_are_rejected(tmp_path):
+    filename = tmp_path / "other.idx"
+    filename.write_bytes(b"NOTINDEX" + b"\0" * 64)
+    with pytest.raises(ValueError):
+        Segment.open(str(filename))
+
+
+def test_file_signature():
+    assert file_signature("/nonexistent/file") is None
+
+
+def table(strings, hashed=True):
+    return StringTable(Segment.from_sections(pack_strings("t", strings, hashed)), "t")
+
+
+def test_string_table_lookups():
+    strings = [f"drug{i}" for i in range(500)] + ["", "é-ñ", "ü"]  # Enough to collide in the slot array
+    names = table(strings)
+    assert len(names) == len(strings) and list(names) == strings
+    assert all(names.index(string) == i for i, string in enumerate(strings))
+    assert names[501] == "é-ñ"
+    assert "drug499" in names and "drug500" not in names and 5 not in names
+    assert names.index("missing") == -1
+
+
+def test_empty_string_table():
+    names = table([])
+    assert len(names) == 0 and "a" not in names and list(names) == []
+
+
+def test_unhashed_table_reads_by_position():
+    assert list(table(["b", "a", "b"], hashed=False)) == ["b", "a", "b"]
+
+
+def test_string_list_map_is_a_read_only_mapping():
+    mapping = {"aspirin": ["ibuprofen", "naproxen"], "none": [], "é": ["ü"]}
+    packed = StringListMap(Segment.from_sections(pack_string_lists("m", mapping)), "m")
+    assert dict(packed) == mapping
+    assert "none" in packed and "other" not in packed and len(packed) == 3
+    with pytest.raises(KeyError):
+        packed["other"]
+    assert packed.get(3) is None
+
+
+def neighbors_of(matrix, k, chunk_rows):
+    chunks = ((matrix.index[i:i + chunk_rows], matrix.columns, matrix.to_numpy()[i:i + chunk_rows])
+              for i in range(0, len(matrix), chunk_rows))
+    return TopNeighbors(Segment.from_sections(pack_top_neighbors("n", chunks, k), {"k": k}), "n")
+
+
+def test_top_neighbors_match_sorting_each_row():
+    rng = np.random.default_rng(0)
+    scores = rng.random((40, 40))
+    np.fill_diagonal(scores, 1.0)
+    ids = [f"DB{i:05d}" for i in range(40)]
+    matrix = pd.DataFrame(scores, index=ids, columns=ids)
+    neighbors = neighbors_of(matrix, k=5, chunk_rows=7)
+    for drug in ids:
+        expected = list(matrix.loc[drug].sort_values(ascending=False).index[1:6])
+        assert neighbors.top(drug, 5) == expected
+        assert neighbors.top(drug, 2) == expected[:2]
+    assert neighbors.top("DB99999", 3) == [] and "DB00001" in neighbors
+
+
+def test_missing_scores_rank_last_and_short_rows_leave_empty_slots():
+    matrix = pd.DataFrame([[1.0, np.nan, 0.2], [0.3, 1.0, np.nan], [0.1, 0.9, 1.0]], index=list("abc"), columns=list("abc"))
+    neighbors = neighbors_of(matrix, k=4, chunk_rows=2)
+    assert neighbors.top("a", 4) == ["c", "b"]
+    assert neighbors.top("c", 4) == ["b", "a"]
+    assert (neighbors.neighbors[:, 2:] == EMPTY_SLOT).all()
+
+
+def test_derived_segment_is_rebuilt_only_when_its_source_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_index, "SHARED_INDEX_FOLDER", str(tmp_path / "shared"))
+    source = tmp_path / "source.csv"
+    source.write_text("a\n")
+    builds = []
+
+    def build(filename):
+        builds.append(filename)
+        with open(filename) as file:
+            return pack_strings("lines", file.read().split())
+
+    first = derived_segment(str(source), "lines", build)
+    assert list(StringTable(derived_segment(str(source), "lines", build), "lines")) == ["a"]
+    assert len(builds) == 1 and first.filename is not None
+    source.write_text("a\nb\n")
+    assert list(StringTable(derived_segment(str(source), "lines", build), "lines")) == ["a", "b"]
+    derived_segment(str(source), "lines", build, {"version": 2})  # Different metadata is a different build
+    assert len(builds) == 3
+
+
+def test_derived_segment_falls_back_to_a_private_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_index, "SHARED_INDEX_FOLDER", str(tmp_path / "shared"))
+
+    def unwritable(*args, **kwargs):
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr(shared_index, "write_segment", unwritable)
+    source = tmp_path / "source.csv"
+    source.write_text("a\n")
+    segment = derived_segment(str(source), "lines", lambda filename: pack_strings("lines", ["a"]))
+    assert segment.filename is None and list(StringTable(segment, "lines")) == ["a"]
@@ -0,0 +1,102 @@
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks import memory_mongo
+from benchmarks.run import load_world
+from Form.singleflight import MongoLease, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights, calls, release = SingleFlight(), [], threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flights.do, "drug", fetch) for _ in range(8)]
+        while not calls:
+            time.sleep(0.001)
+        time.sleep(0.05)  # Let the other callers queue up behind the first
+        assert flights.in_flight() == 1
+        release.set()
+        assert [future.result() for future in futures] == ["result"] * 8
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+
+def test_every_waiting_caller_sees_the_error():
+    flights, started, release = SingleFlight(), threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "drug", fail)
+        started.wait(5)
+        follower = pool.submit(flights.do, "drug", fail)
+        time.sleep(0.05)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_different_keys_run_independently():
+    flights = SingleFlight()
+    assert flights.do("a", lambda: flights.do("b", lambda: "nested")) == "nested"
+
+
+def lease_collection():
+    return memory_mongo.MemoryMongoClient()["lease_test"]["leases"]
+
+
+def test_lease_is_exclusive_until_released_by_its_owner():
+    collection = lease_collection()
+    collection.delete_many({})
+    first, second = MongoLease(collection), MongoLease(collection)
+    second.owner = "another-worker"
+    assert first.acquire("drug")
+    assert not second.acquire("drug")
+    second.release("drug")  # Not the owner, so the lease stays
+    assert not second.acquire("drug")
+    first.release("drug")
+    assert second.acquire("drug")
+
+
+def test_expired_lease_is_taken_over():
+    collection = lease_collection()
+    collection.delete_many({})
+    expired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    collection.insert_one({"_id": "drug", "owner": "dead-worker", "expires_at": expired})
+    assert MongoLease(collection).acquire("drug")
+
+
+def test_wait_returns_once_the_holder_is_done():
+    collection = lease_collection()
+    collection.delete_many({})
+    holder, waiter, done = MongoLease(collection), MongoLease(collection, ttl=5), threading.Event()
+    holder.acquire("drug")
+    threading.Timer(0.1, done.set).start()
+    assert waiter.wait("drug", done.is_set, interval=0.01)
+
+
+@pytest.mark.parametrize("coalescing", ["local", "mongo"])
+def test_concurrent_requests_download_a_new_drug_once(form, world, upstream, monkeypatch, coalescing):
+    monkeypatch.setattr(form, "FETCH_COALESCING", coalescing)
+    load_world(form, world, stored=range(1, world.count))
+    upstream.latency = 0.05
+    upstream.reset_counts()
+    drug_name = world.names[0]
+    with ThreadPoolExecutor(6) as pool:
+        list(pool.map(lambda _: form.fetch_drug_data(drug_name), range(6)))
+    assert upstream.calls["pubchem_ddi"] == 1
+    assert form.collection.count_documents({"drug_name": drug_name}) == 1
+    assert drug_name in form.interaction_graph.indexed_drugs
@@ -0,0 +1,32 @@
+import re
+
+from benchmarks.run import load_world
+
+
+def drug_pairs(html):
+    return re.findall(r"Drug Pair: ([^<]+)</h3>", html)
+
+
+def test_stream_shows_the_same_interactions_as_the_page(client, world):
+    drug_names = " ".join(world.regimen(5))
+    page = client.post("/form/", data={"drug_names": drug_names}).get_data(as_text=True)
+    stream = client.post("/form/", data={"drug_names": drug_names, "stream": "1"})
+    assert stream.headers["X-Accel-Buffering"] == "no"
+    assert sorted(drug_pairs(stream.get_data(as_text=True))) == sorted(drug_pairs(page))
+    assert drug_pairs(page)
+
+
+def test_stream_sends_the_input_drugs_before_any_download(form, client, world, upstream):
+    load_world(form, world, stored=[])
+    regimen = world.regimen(3)
+    upstream.reset_counts()
+    response = client.post("/form/", data={"drug_names": " ".join(regimen), "stream": "1"}, buffered=False)
+    chunks = iter(response.response)
+    sent = ""
+    while not all(drug_name in sent for drug_name in regimen):
+        sent += next(chunks).decode()
+    assert "pubchem_ddi" not in upstream.calls
+    rest = "".join(chunk.decode() for chunk in chunks)
+    response.close()
+    assert upstream.calls["pubchem_ddi"] > 0
+    assert "Drug Pair:" in rest
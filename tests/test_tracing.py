@@ -0,0 +1,149 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+
+from Form import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+SAMPLED = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+class Capture:
+    def __init__(self):
+        self.spans = []
+
+    def submit(self, spans):
+        self.spans.extend(spans)
+
+    def named(self, name):
+        return next(span for span in self.spans if span.name == name)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    """Spans handed to the exporter, instead of being written out."""
+    capture = Capture()
+    monkeypatch.setattr(tracing, "exporter", capture)
+    return capture
+
+
+def test_parse_traceparent():
+    assert tracing.parse_traceparent(SAMPLED) == (TRACE_ID, PARENT_ID, True)
+    assert tracing.parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (TRACE_ID, PARENT_ID, False)
+    for header in (None, "", "garbage", f"00-{TRACE_ID}-{PARENT_ID}", f"00-{TRACE_ID}-{PARENT_ID}-zz", f"00-abc-{PARENT_ID}-01"):
+        assert tracing.parse_traceparent(header) is None
+
+
+def test_unsampled_requests_trace_nothing(exported):
+    with tracing.trace("root") as root:
+        assert root is tracing.NOOP_SPAN
+        with tracing.span("child") as child:
+            assert child is tracing.NOOP_SPAN
+        tracing.event("ignored")
+        assert tracing.traceparent() is None
+    assert exported.spans == []
+
+
+def test_spans_nest_under_the_incoming_parent(exported):
+    with tracing.trace("root", traceparent=SAMPLED, drug_count=3):
+        with tracing.span("stage", pair_count=3) as stage:
+            tracing.event("downloading", drug="a")
+            assert tracing.traceparent() == f"00-{TRACE_ID}-{stage.span_id}-01"
+        tracing.current_span().set(cache_hit=False)
+    root, stage = exported.named("root"), exported.named("stage")
+    assert {root.trace.trace_id, stage.trace.trace_id} == {TRACE_ID}
+    assert root.parent_id == PARENT_ID and stage.parent_id == root.span_id
+    assert root.attributes == {"drug_count": 3, "cache_hit": False}
+    assert stage.to_dict()["events"][0]["message"] == "downloading"
+    assert root.start <= stage.start <= stage.end <= root.end
+
+
+def test_errors_are_recorded_and_raised(exported):
+    with pytest.raises(ValueError):
+        with tracing.trace("root", traceparent=SAMPLED):
+            with tracing.span("stage"):
+                raise ValueError("boom")
+    assert exported.named("stage").error == "ValueError('boom')"
+    assert exported.named("root").error == "ValueError('boom')"
+
+
+def test_spans_outliving_their_request_are_exported_on_their_own(exported):
+    with tracing.trace("root", traceparent=SAMPLED):
+        parent = tracing._current_span.get()
+    token = tracing._current_span.set(parent)  # As a background task carrying the request's context
+    try:
+        with tracing.span("background"):
+            pass
+    finally:
+        tracing._current_span.reset(token)
+    assert [span.name for span in exported.spans] == ["root", "background"]
+
+
+def test_otlp_payload(exported):
+    with pytest.raises(KeyError):
+        with tracing.trace("root", traceparent=SAMPLED, count=2, ratio=0.5, hit=True, drug="x"):
+            raise KeyError("a")
+    payload = tracing.to_otlp(exported.spans)
+    otlp_span = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert (otlp_span["traceId"], otlp_span["parentSpanId"]) == (TRACE_ID, PARENT_ID)
+    assert otlp_span["attributes"] == [
+        {"key": "count", "value": {"intValue": "2"}},
+        {"key": "ratio", "value": {"doubleValue": 0.5}},
+        {"key": "hit", "value": {"boolValue": True}},
+        {"key": "drug", "value": {"stringValue": "x"}},
+    ]
+    assert otlp_span["status"]["code"] == 2
+
+
+def wait_for_lines(filename, count):
+    for _ in range(200):
+        try:
+            with open(filename) as file:
+                lines = file.readlines()
+            if len(lines) >= count:
+                return [json.loads(line) for line in lines]
+        except FileNotFoundError:
+            pass
+        time.sleep(0.01)
+    raise AssertionError(f"{filename} never got {count} spans")
+
+
+def test_jsonl_exporter_appends_one_span_per_line(exported, tmp_path):
+    with tracing.trace("root", traceparent=SAMPLED):
+        with tracing.span("stage"):
+            pass
+    filename = str(tmp_path / "traces" / "spans.jsonl")
+    tracing.SpanExporter(f"jsonl:{filename}").submit(exported.spans)
+    spans = wait_for_lines(filename, 2)
+    assert [span["name"] for span in spans] == ["stage", "root"]
+    assert spans[0]["parent_id"] == spans[1]["span_id"]
+
+
+def export_in_child(exporter, spans):
+    exporter.submit(spans)
+    time.sleep(1)  # Leave the export thread time to write before the child exits
+
+
+def test_exporter_works_in_a_forked_child(exported, tmp_path):
+    with tracing.trace("root", traceparent=SAMPLED):
+        pass
+    filename = str(tmp_path / "spans.jsonl")
+    exporter = tracing.SpanExporter(f"jsonl:{filename}")
+    exporter.submit(exported.spans)  # Parent's export thread now waits on the queue
+    wait_for_lines(filename, 1)
+    child = multiprocessing.get_context("fork").Process(target=export_in_child, args=(exporter, exported.spans))
+    child.start()
+    child.join(10)
+    assert len(wait_for_lines(filename, 2)) == 2
+
+
+def test_sampled_form_request_traces_its_stages(client, world, exported):
+    response = client.post("/form/", data={"drug_names": " ".join(world.regimen(3))}, headers={"traceparent": SAMPLED})
+    assert response.status_code == 200
+    root, check = exported.named("form.index"), exported.named("check_regimen")
+    assert root.parent_id == PARENT_ID and root.attributes["input_drug_count"] == 3
+    assert check.trace is root.trace
+    assert check.attributes["drug_count"] >= 3 and "pair_count" in check.attributes
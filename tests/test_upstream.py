@@ -0,0 +1,111 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+from Form.upstream import CircuitBreaker, UpstreamClient, UpstreamUnavailable
+
+
+class Upstream(httpx.MockTransport):
+    """Answers with the given statuses in turn (the last one repeats), counting requests."""
+
+    def __init__(self, *statuses, delays=()):
+        self.statuses, self.delays, self.calls = list(statuses), list(delays), 0
+        self._lock = threading.Lock()
+        super().__init__(self.respond)
+
+    def respond(self, request):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+        if index < len(self.delays):
+            time.sleep(self.delays[index])
+        return httpx.Response(self.statuses[min(index, len(self.statuses) - 1)], text=f"answer {index}")
+
+
+def client(transport, **kwargs):
+    kwargs.setdefault("backoff", 0.001)
+    return UpstreamClient("test", "http://upstream.test", transport=transport, **kwargs)
+
+
+def test_breaker_opens_after_repeated_failures_and_probes_after_the_reset():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one probe per reset period
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_retryable_statuses_are_retried():
+    upstream = Upstream(503, 502, 200)
+    response = client(upstream, retries=2).get("/path")
+    assert (response.status_code, upstream.calls) == (200, 3)
+
+
+def test_other_statuses_are_returned_without_retrying():
+    upstream = Upstream(404)
+    assert client(upstream, retries=2).get("/path").status_code == 404
+    assert upstream.calls == 1
+
+
+def test_exhausted_retries_raise_and_count_against_the_breaker():
+    upstream = Upstream(503)
+    upstream_client = client(upstream, retries=1)
+    with pytest.raises(UpstreamUnavailable):
+        upstream_client.get("/path")
+    assert upstream.calls == 2
+    assert upstream_client.breaker.failures == 1
+
+
+def test_open_circuit_fails_fast():
+    upstream = Upstream(200)
+    upstream_client = client(upstream)
+    upstream_client.breaker.opened_at = time.monotonic()
+    with pytest.raises(UpstreamUnavailable, match="circuit is open"):
+        upstream_client.get("/path")
+    assert upstream.calls == 0
+
+
+def test_deadline_bounds_the_retries():
+    upstream = Upstream(503)
+    started = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        client(upstream, retries=1000, backoff=0.01).get("/path", deadline=0.2)
+    assert time.monotonic() - started < 1
+
+
+def test_hedged_request_takes_the_faster_answer():
+    upstream = Upstream(200, delays=[1.0])
+    started = time.monotonic()
+    response = client(upstream, hedge_after=0.05).get("/path")
+    assert time.monotonic() - started < 0.5
+    assert response.text == "answer 1"
+
+
+def test_a_transport_fallback_answers_when_the_upstream_cannot():
+    class WithFallback(Upstream):
+        def fallback(self, url, params):
+            return httpx.Response(200, text=f"recorded {url}")
+
+    response = client(WithFallback(503), retries=0).get("/path")
+    assert response.text == "recorded http://upstream.test/path"
+
+
+def test_an_exhausted_rate_budget_is_not_the_upstream_failing():
+    class Empty:
+        def acquire(self, timeout=None):
+            return False
+
+    upstream = Upstream(200)
+    upstream_client = client(upstream, rate_limiter=Empty())
+    with pytest.raises(UpstreamUnavailable, match="rate budget"):
+        upstream_client.get("/path")
+    assert upstream.calls == 0
+    assert upstream_client.breaker.failures == 0